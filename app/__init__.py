@@ -1,79 +1,124 @@
 import os
-import json
 import importlib # 用于动态导入
 import logging  # 引入 logging 模块
+from contextlib import nullcontext
 from flask import Flask, render_template
 from config import config
-
-def _register_tool_blueprints(app: Flask):
+from .registry import ToolRegistry
+from .lazy_loader import LazyToolLoader
+from .template_cache import init_template_cache
+from .metrics import init_metrics
+from .services.janitor import init_janitor
+from .services.blob_store import get_blob_store
+
+def _register_tool_blueprint(app: Flask, tool_info: dict):
     """
-    Loads tools configuration from tools.json and dynamically registers
-    their blueprints with the Flask application.
+    Imports a single tool package and registers its blueprint.
 
     Args:
         app: The Flask application instance.
+        tool_info: The tool's entry in tools.json.
     """
-    # 计算 tools.json 的路径 (假设它在项目根目录, 即 app 目录的上一级)
-    json_path = os.path.join(app.config["PROJECT_ROOT"], "app", "tools.json")
-    app.logger.info(f"Json path: {json_path}")
+    module_name = tool_info.get('module_name')
+    url_prefix = tool_info.get('url')
+    tool_name = tool_info.get('name', module_name) # 用于错误消息
+
+    # 遵循约定：蓝图变量名为 <module_name>_bp
+    blueprint_variable_name = f"{module_name}_bp"
+    # 模块的完整导入路径
+    module_import_path = f"app.tools.{module_name}"
+
+    # 启动分析 (run.py --profile-startup) 时记录各阶段耗时
+    profiler = app.extensions.get('startup_profiler')
 
     try:
-        with open(json_path, 'r', encoding='utf-8') as f:
-            tools_list = json.load(f)
-
-        app.logger.info(f"Found {len(tools_list)} tools in {json_path}") # Log number of tools found
-
-        for tool_info in tools_list:
-            if not tool_info.get('enabled', True):
-                app.logger.info(f"Skipping tool registration: Tool '{tool_info.get('name')}' is disabled.")
-                continue
-
-            module_name = tool_info.get('module_name')
-            url_prefix = tool_info.get('url')
-            tool_name = tool_info.get('name', module_name) # 用于错误消息
-
-            if not module_name or not url_prefix:
-                app.logger.warning(f"Skipping tool registration: Missing 'module_name' or 'url' in tools.json entry for '{tool_name}'.")
-                continue
-
-            # 遵循约定：蓝图变量名为 <module_name>_bp
-            blueprint_variable_name = f"{module_name}_bp"
-            # 模块的完整导入路径
-            module_import_path = f"app.tools.{module_name}"
-
-            try:
-                # 动态导入工具模块
-                # app.logger.debug(f"Attempting to import module: {module_import_path}")
-                tool_module = importlib.import_module(module_import_path)
-                # 从模块中获取蓝图实例
-                # app.logger.debug(f"Attempting to get attribute '{blueprint_variable_name}' from module {module_import_path}")
-                blueprint_object = getattr(tool_module, blueprint_variable_name)
-                # 注册蓝图
-                app.register_blueprint(blueprint_object, url_prefix=url_prefix)
-                app.logger.info(f"Successfully registered blueprint for tool '{tool_name}' from {module_import_path} with prefix '{url_prefix}'.")
-
-            except ImportError as e:
-                app.logger.error(f"Failed to import module for tool '{tool_name}': {module_import_path}. Error: {e}")
-            except AttributeError as e:
-                app.logger.error(f"Failed to find blueprint variable '{blueprint_variable_name}' in module {module_import_path} for tool '{tool_name}'. Error: {e}")
-            except Exception as e:
-                app.logger.error(f"An unexpected error occurred while registering blueprint for tool '{tool_name}' from {module_import_path}. Error: {e}", exc_info=True) # Log traceback
-
-    except FileNotFoundError:
-        app.logger.error(f"tools.json not found at {json_path}. No tool blueprints will be registered dynamically.")
-    except json.JSONDecodeError:
-        app.logger.error(f"Failed to decode tools.json at {json_path}. No tool blueprints will be registered dynamically.")
+        # 动态导入工具模块
+        # app.logger.debug(f"Attempting to import module: {module_import_path}")
+        with profiler.measure(module_name, 'import') if profiler else nullcontext():
+            tool_module = importlib.import_module(module_import_path)
+        # 从模块中获取蓝图实例
+        # app.logger.debug(f"Attempting to get attribute '{blueprint_variable_name}' from module {module_import_path}")
+        blueprint_object = getattr(tool_module, blueprint_variable_name)
+        # 注册蓝图
+        with profiler.measure(module_name, 'register') if profiler else nullcontext():
+            app.register_blueprint(blueprint_object, url_prefix=url_prefix)
+        app.logger.info(f"Successfully registered blueprint for tool '{tool_name}' from {module_import_path} with prefix '{url_prefix}'.")
+
+    except ImportError as e:
+        app.logger.error(f"Failed to import module for tool '{tool_name}': {module_import_path}. Error: {e}")
+    except AttributeError as e:
+        app.logger.error(f"Failed to find blueprint variable '{blueprint_variable_name}' in module {module_import_path} for tool '{tool_name}'. Error: {e}")
     except Exception as e:
-         app.logger.error(f"An unexpected error occurred while loading tools.json. Error: {e}", exc_info=True) # Log traceback
+        app.logger.error(f"An unexpected error occurred while registering blueprint for tool '{tool_name}' from {module_import_path}. Error: {e}", exc_info=True) # Log traceback
+
+
+def _register_tool_blueprints(app: Flask, registry: ToolRegistry, lazy_loader: LazyToolLoader = None):
+    """
+    Registers the blueprints of the tools listed in the tool registry
+    (loaded from tools.json) with the Flask application.
+
+    Args:
+        app: The Flask application instance.
+        registry: The ToolRegistry shared with the index page.
+        lazy_loader: If given, tools are only recorded by URL prefix and
+            imported later by lazy_loader.load_all().
+    """
+    app.logger.info(f"Json path: {registry.json_path}")
+
+    tools_list = registry.all_tools()
+    app.logger.info(f"Found {len(tools_list)} tools in {registry.json_path}") # Log number of tools found
+
+    for tool_info in tools_list:
+        if not tool_info.get('enabled', True):
+            app.logger.info(f"Skipping tool registration: Tool '{tool_info.get('name')}' is disabled.")
+            continue
+
+        module_name = tool_info.get('module_name')
+        url_prefix = tool_info.get('url')
+        tool_name = tool_info.get('name', module_name) # 用于错误消息
+
+        if not module_name or not url_prefix:
+            app.logger.warning(f"Skipping tool registration: Missing 'module_name' or 'url' in tools.json entry for '{tool_name}'.")
+            continue
+
+        if lazy_loader is not None:
+            lazy_loader.add_tool(tool_info)
+            app.logger.info(f"Deferred loading of tool '{tool_name}' at '{url_prefix}' until the server starts.")
+        else:
+            _register_tool_blueprint(app, tool_info)
+
+
+def _load_storage_areas(app: Flask):
+    """
+    Makes sure every storage area is registered with the janitor in this process.
+
+    Tools register their areas when their package is imported, so with
+    LAZY_TOOL_LOADING the tools marked "storage": true in tools.json are
+    loaded here first; the blob store registers itself on first use.
+    Called by the janitor before each sweep, only in the process that sweeps.
+    """
+    lazy_loader = app.extensions.get('lazy_tool_loader')
+    if lazy_loader is not None:
+        for tool_info in app.extensions['tool_registry'].enabled_tools():
+            if tool_info.get('storage') and tool_info.get('url'):
+                lazy_loader.load(tool_info['url'].rstrip('/'))
+    get_blob_store()
 
 
 # --- 应用工厂 ---
-def create_app(config_name):
-    """Creates and configures the Flask application."""
+def create_app(config_name, profiler=None):
+    """
+    Creates and configures the Flask application.
+
+    Args:
+        config_name: Key into config.config.
+        profiler: Optional StartupProfiler that records per-tool timings.
+    """
     app = Flask(__name__)
-    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  
     app.config.from_object(config[config_name])
     config[config_name].init_app(app)
+    if profiler is not None:
+        app.extensions['startup_profiler'] = profiler
 
     # 配置日志记录 (如果尚未配置)
     if not app.debug and not app.testing:
@@ -93,13 +138,34 @@ def create_app(config_name):
     # db = SQLAlchemy()
     # db.init_app(app)
 
+    # --- Jinja bytecode cache (可在部署时通过 run.py --precompile-templates 预编译) ---
+    init_template_cache(app)
+
+    # --- 请求指标 (before_request/after_request) 和 /metrics 端点 ---
+    init_metrics(app)
+
     # --- 注册主蓝图 ---
     from .main import main as main_blueprint
     app.register_blueprint(main_blueprint)
     app.logger.info("Registered main blueprint.")
 
+    # --- 工具注册表: tools.json 只解析一次, 由启动注册和首页共享 ---
+    # 计算 tools.json 的路径 (假设它在项目根目录, 即 app 目录的上一级)
+    json_path = os.path.join(app.config["PROJECT_ROOT"], "app", "tools.json")
+    tool_registry = ToolRegistry(json_path, logger=app.logger)
+    app.extensions['tool_registry'] = tool_registry
+
     # --- 调用辅助函数动态注册工具蓝图 ---
-    _register_tool_blueprints(app)
+    # LAZY_TOOL_LOADING 开启时只记录 URL 前缀, 工具包在开始处理请求前才导入 (gunicorn 的 post_worker_init / run.py)
+    lazy_loader = None
+    if app.config.get('LAZY_TOOL_LOADING'):
+        lazy_loader = LazyToolLoader(app, _register_tool_blueprint)
+        app.extensions['lazy_tool_loader'] = lazy_loader
+    _register_tool_blueprints(app, tool_registry, lazy_loader)
+
+    # --- 后台清理过期会话和上传文件 ---
+    # 存储区域在工具导入时注册; 延迟加载时由清理任务在清理前加载 tools.json 中标记了 storage 的工具
+    init_janitor(app, prepare=lambda: _load_storage_areas(app))
 
     # --- 注册全局错误处理 ---
     @app.errorhandler(404)
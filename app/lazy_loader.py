@@ -0,0 +1,50 @@
+import threading
+
+
+class LazyToolLoader:
+    """
+    Defers importing tool packages until the server is about to serve
+    requests, instead of doing it in create_app.
+
+    Flask does not allow registering blueprints once the app has handled a
+    request, and changing the URL map while other threads are matching
+    requests is not thread-safe, so every pending tool must be loaded before
+    the first request: gunicorn does it in the post_worker_init hook (see
+    gunicorn.conf.py), before the worker accepts connections, and run.py does
+    it before starting the development server.
+
+    Args:
+        app: The Flask application instance.
+        register_func: Callable (app, tool_info) that imports the tool package
+            and registers its blueprint.
+    """
+
+    def __init__(self, app, register_func):
+        self.app = app
+        self.register_func = register_func
+        self._lock = threading.Lock()
+        self._pending = {}  # { url_prefix: tool_info }
+
+    def add_tool(self, tool_info):
+        """Records a tool whose blueprint should be registered by load()/load_all()."""
+        url_prefix = tool_info['url'].rstrip('/')
+        self._pending[url_prefix] = tool_info
+
+    @property
+    def pending_prefixes(self):
+        return list(self._pending)
+
+    def load(self, url_prefix):
+        """Imports and registers the tool mounted at url_prefix (idempotent)."""
+        with self._lock:
+            tool_info = self._pending.pop(url_prefix, None)
+            if tool_info is None:
+                # 已经加载过 (或由其他线程加载); 导入失败的工具也不会重试
+                return
+            self.register_func(self.app, tool_info)
+            self.app.logger.info(f"Loaded deferred tool '{tool_info.get('name', tool_info.get('module_name'))}' at '{url_prefix}'.")
+
+    def load_all(self):
+        """Loads every pending tool. Must run before the app serves its first request."""
+        for url_prefix in list(self._pending):
+            self.load(url_prefix)
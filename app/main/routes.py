@@ -1,17 +1,11 @@
 # app/main/routes.py
-from flask import render_template
+from flask import render_template, current_app
 from . import main # <--- 确保导入了在 __init__.py 中定义的 main 蓝图实例
-import json
-import os
 
 def load_tool_list():
-    try:
-        json_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'tools.json')
-        with open(json_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Error loading tools.json: {e}")
-        return []
+    """Returns the enabled tools from the registry built in create_app."""
+    # 注册表只在 tools.json 的 mtime 变化时重新解析, 不会每个请求都读文件
+    return current_app.extensions['tool_registry'].enabled_tools()
 
 @main.route('/') # <--- 检查这个路由装饰器是否存在且正确
 def index():
@@ -20,7 +14,6 @@ def index():
     try:
         # 假设你的主页模板是 index.html
         tools = load_tool_list()
-        tools = [tool for tool in tools if tool.get('enabled', True)]
         return render_template('index.html', tools=tools)
     except Exception as e:
          # 添加错误处理或日志记录会很有帮助
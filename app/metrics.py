@@ -0,0 +1,270 @@
+import os
+import time
+import threading
+from flask import Flask, Response, g, request
+
+# Prometheus 默认延迟分桶, 末尾补充了适合大批量图片/PDF 处理的长尾分桶
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# 请求/响应体大小分桶 (字节): 1KB ... 256MB
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(10))
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}  # { label_values: value }
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._lock = threading.Lock()
+        self._values = {}  # { label_values: [bucket_counts, sum, count] }
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, (list(state[0]), state[1], state[2])) for key, state in self._values.items())
+        for key, (bucket_counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ('le', _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class GaugeCallback:
+    """A gauge whose samples are computed at scrape time by callbacks."""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._callbacks = {}  # { label_values: func }
+
+    def set_function(self, func, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        self._callbacks[key] = func
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        for key, func in sorted(self._callbacks.items()):
+            try:
+                value = func()
+            except Exception:
+                # 采集失败时跳过该样本, 不影响其他指标
+                continue
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Minimal in-process metrics registry rendered in the Prometheus text format.
+
+    Metrics are per process: under gunicorn each worker keeps its own values,
+    so scrape through a per-worker port or aggregate with sum() by label.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _get_or_create(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def gauge_callback(self, name, documentation, labelnames=()):
+        return self._get_or_create(GaugeCallback, name, documentation, labelnames)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# 进程级单例, 工具模块可以在导入时向其注册自己的指标
+REGISTRY = MetricsRegistry()
+
+REQUEST_LABELS = ('tool', 'endpoint', 'method')
+
+REQUEST_LATENCY = REGISTRY.histogram(
+    'vibetools_request_duration_seconds', 'Request latency in seconds.', REQUEST_LABELS)
+REQUEST_CPU = REGISTRY.counter(
+    'vibetools_request_cpu_seconds_total', 'CPU time spent in the request thread, in seconds.', REQUEST_LABELS)
+REQUEST_SIZE = REGISTRY.histogram(
+    'vibetools_request_size_bytes', 'Request body size in bytes.', REQUEST_LABELS, buckets=SIZE_BUCKETS)
+RESPONSE_SIZE = REGISTRY.histogram(
+    'vibetools_response_size_bytes', 'Response body size in bytes (when known).', REQUEST_LABELS, buckets=SIZE_BUCKETS)
+RESPONSES = REGISTRY.counter(
+    'vibetools_responses_total', 'Responses by status code.', REQUEST_LABELS + ('status',))
+SESSIONS_GAUGE = REGISTRY.gauge_callback(
+    'vibetools_sessions', 'Active sessions held by a tool.', ('tool',))
+DIRECTORY_BYTES_GAUGE = REGISTRY.gauge_callback(
+    'vibetools_directory_bytes', 'Total size of files under a storage directory, in bytes.', ('directory',))
+
+
+def register_session_gauge(tool, func):
+    """Exposes func() (e.g. lambda: len(SESSIONS)) as vibetools_sessions{tool=...}."""
+    SESSIONS_GAUGE.set_function(func, tool=tool)
+
+
+def directory_size(path):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                # 文件可能在遍历过程中被删除
+                pass
+    return total
+
+
+class _CachedDirectorySize:
+    """Walking uploads/ on every scrape is expensive; cache the result briefly."""
+
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        self._value = 0
+        self._expires = 0.0
+
+    def __call__(self):
+        now = time.monotonic()
+        if now >= self._expires:
+            self._value = directory_size(self.path)
+            self._expires = now + self.ttl
+        return self._value
+
+
+def _tool_label(app: Flask, tool_labels: dict):
+    """
+    The tool label of the current request: the module_name of the tools.json
+    entry whose url prefix the blueprint is mounted at ('main' outside tools).
+    tool_labels caches the result per blueprint.
+    """
+    blueprint = request.blueprint
+    if blueprint is None:
+        return 'main'
+    label = tool_labels.get(blueprint)
+    if label is None:
+        label = blueprint  # 不属于任何工具的蓝图 (如 main) 按蓝图名统计
+        registry = app.extensions.get('tool_registry')
+        for tool in registry.all_tools() if registry else ():
+            url_prefix = (tool.get('url') or '').rstrip('/')
+            if url_prefix and tool.get('module_name') and (request.path == url_prefix or request.path.startswith(url_prefix + '/')):
+                label = tool['module_name']
+                break
+        tool_labels[blueprint] = label
+    return label
+
+
+def init_metrics(app: Flask):
+    """
+    Installs the before_request/after_request instrumentation and /metrics.
+
+    Requests are labeled by tool (the module_name of the tool's tools.json
+    entry, see _tool_label), endpoint and method.
+    """
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+    tool_labels = {}  # { blueprint name: tool label }
+
+    uploads_dir = os.path.join(app.config['PROJECT_ROOT'], 'uploads')
+    DIRECTORY_BYTES_GAUGE.set_function(
+        _CachedDirectorySize(uploads_dir, app.config.get('METRICS_DIRECTORY_SIZE_TTL', 30)),
+        directory='uploads')
+
+    @app.before_request
+    def _start_request_timer():
+        g._metrics_start = time.perf_counter()
+        g._metrics_cpu_start = time.thread_time()
+
+    @app.after_request
+    def _record_request_metrics(response):
+        start = g.pop('_metrics_start', None)
+        if start is None:
+            return response
+        cpu_start = g.pop('_metrics_cpu_start')
+
+        labels = {
+            'tool': _tool_label(app, tool_labels),
+            'endpoint': request.endpoint or 'unmatched',
+            'method': request.method,
+        }
+        REQUEST_LATENCY.observe(time.perf_counter() - start, **labels)
+        REQUEST_CPU.inc(time.thread_time() - cpu_start, **labels)
+        REQUEST_SIZE.observe(request.content_length or 0, **labels)
+        if response.content_length is not None:
+            RESPONSE_SIZE.observe(response.content_length, **labels)
+        RESPONSES.inc(status=str(response.status_code), **labels)
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
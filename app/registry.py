@@ -0,0 +1,84 @@
+import os
+import json
+import logging
+import threading
+
+
+class ToolRegistry:
+    """
+    In-memory cache of app/tools.json.
+
+    The file is parsed once and only re-parsed when its mtime changes, so the
+    index page and blueprint registration share a single parsed copy instead
+    of opening and decoding the file on every request.
+    """
+
+    def __init__(self, json_path, logger=None):
+        self.json_path = json_path
+        self.logger = logger or logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._mtime = None
+        self._tools = []
+        self._enabled_tools = []
+
+    def _current_mtime(self):
+        try:
+            return os.stat(self.json_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _load(self):
+        """Parses tools.json; returns None on failure so the previous list is kept."""
+        try:
+            with open(self.json_path, 'r', encoding='utf-8') as f:
+                tools_list = json.load(f)
+        except FileNotFoundError:
+            self.logger.error(f"tools.json not found at {self.json_path}. No tools will be available.")
+            return []
+        except json.JSONDecodeError:
+            self.logger.error(f"Failed to decode tools.json at {self.json_path}. Keeping previously loaded tools.")
+            return None
+        except Exception as e:
+            self.logger.error(f"An unexpected error occurred while loading tools.json. Error: {e}", exc_info=True)
+            return None
+
+        if not isinstance(tools_list, list):
+            self.logger.error(f"tools.json at {self.json_path} must contain a list. Keeping previously loaded tools.")
+            return None
+        return tools_list
+
+    def refresh(self, force=False):
+        """Reloads tools.json if its mtime changed since the last load."""
+        mtime = self._current_mtime()
+        if not force and self._loaded and mtime == self._mtime:
+            return
+        with self._lock:
+            # 双重检查: 其他线程可能已经完成了加载
+            if not force and self._loaded and mtime == self._mtime:
+                return
+            tools_list = self._load()
+            if tools_list is not None:
+                self._tools = tools_list
+                self._enabled_tools = [tool for tool in tools_list if tool.get('enabled', True)]
+                self.logger.info(f"Loaded {len(tools_list)} tools ({len(self._enabled_tools)} enabled) from {self.json_path}")
+            # 即使解析失败也记录 mtime, 避免每个请求都重复解析同一个损坏的文件
+            self._mtime = mtime
+            self._loaded = True
+
+    def all_tools(self):
+        """Returns every entry in tools.json (callers must not mutate it)."""
+        self.refresh()
+        return self._tools
+
+    def enabled_tools(self):
+        """Returns the entries whose 'enabled' flag is not false (callers must not mutate it)."""
+        self.refresh()
+        return self._enabled_tools
+
+    def get(self, module_name):
+        """Returns the tools.json entry for module_name, or None."""
+        for tool in self.all_tools():
+            if tool.get('module_name') == module_name:
+                return tool
+        return None
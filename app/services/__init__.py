@@ -0,0 +1 @@
+# 多个工具共享的服务 (会话存储等)
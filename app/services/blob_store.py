@@ -0,0 +1,266 @@
+import os
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from .session_store import PROJECT_ROOT
+from .janitor import touch_file, register_blob_storage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ROOT = os.path.join(PROJECT_ROOT, 'uploads', 'blobs')
+CHUNK_SIZE = 1024 * 1024
+# 未被引用的 blob 保留多久 (秒), 期间再次上传相同内容可以直接复用
+UNREFERENCED_BLOB_TTL = 24 * 3600
+
+
+class BlobStore:
+    """
+    Content-addressed storage shared by the file-handling tools.
+
+    Blobs are stored once under objects/<sha256[:2]>/<sha256>. Tools never
+    write into the store directly; they hard-link a blob into their own
+    session or upload directory with link_into(). The filesystem link count
+    is the blob's reference count: deleting a session directory drops its
+    references, and a blob whose only remaining link is the store's own is
+    unreferenced and may be garbage collected (see BlobStorage in janitor).
+
+    Because of those links, a path that went through put_file() or
+    link_into() shares its inode with the blob and with every other session
+    linked to it: callers must never write to such a path in place (e.g.
+    open(path, 'wb')), which would corrupt all of them. To produce a new
+    version of the file, write it with replacing() (or link_into(...,
+    replace=True)), which swaps in a new inode.
+
+    Derived artifacts (e.g. a normalized image, an extracted PDF) are
+    recorded against (source digest, recipe), where recipe is a string that
+    identifies the transformation and its parameters, so identical requests
+    can reuse a cached result instead of reprocessing.
+    """
+
+    def __init__(self, root=DEFAULT_ROOT):
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        self.tmp_dir = os.path.join(root, 'tmp')
+        self.db_path = os.path.join(root, 'derived.sqlite3')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self._local = threading.local()
+        self._digest_cache = OrderedDict()  # { (dev, ino, size, mtime_ns): digest }
+        self._digest_cache_lock = threading.Lock()
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS derived ("
+            " source TEXT NOT NULL,"
+            " recipe TEXT NOT NULL,"
+            " digest TEXT,"
+            " meta TEXT NOT NULL,"
+            " created REAL NOT NULL,"
+            " PRIMARY KEY (source, recipe))"
+        )
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    # --- Blobs ---
+
+    def path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def exists(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def _commit_temp(self, tmp_path, digest):
+        final_path = self.path(digest)
+        if os.path.exists(final_path):
+            # 内容已存在: 丢弃新副本
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            # mkstemp 创建的文件权限为 0600, 改为与普通上传文件一致
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, final_path)
+        return digest
+
+    def put_stream(self, stream):
+        """Copies a binary stream into the store while hashing it. Returns its digest."""
+        hasher = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                    f.write(chunk)
+            return self._commit_temp(tmp_path, hasher.hexdigest())
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def put_file(self, src_path):
+        """
+        Adds src_path to the store; src_path becomes a hard link to the blob. Returns its digest.
+
+        src_path must not be written in place afterwards (see replacing()).
+        """
+        digest = self.digest_file(src_path)
+        final_path = self.path(digest)
+        if os.path.exists(final_path):
+            # 相同内容已存在: 让 src_path 指向已有的 blob, 释放重复的副本
+            if not self.link_into(digest, src_path, replace=True):
+                return self.put_file(src_path)
+            return digest
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        try:
+            os.link(src_path, final_path)
+        except FileExistsError:
+            self.link_into(digest, src_path, replace=True)
+        except OSError:
+            # 跨文件系统: 复制一份进存储, src_path 保持独立的副本
+            fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+            os.close(fd)
+            try:
+                shutil.copyfile(src_path, tmp_path)
+                self._commit_temp(tmp_path, digest)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        return digest
+
+    def link_into(self, digest, dest_path, replace=False):
+        """
+        Makes dest_path refer to the blob (hard link, or a copy across filesystems).
+
+        Returns False if the blob no longer exists (e.g. it was just garbage collected).
+        dest_path must not be written in place afterwards (see replacing()).
+        """
+        src_path = self.path(digest)
+        tmp_dest = f"{dest_path}.{os.getpid()}.{threading.get_ident()}.tmp" if replace else dest_path
+        try:
+            try:
+                os.link(src_path, tmp_dest)
+            except FileNotFoundError:
+                return False
+            except OSError:
+                # 跨文件系统或不支持硬链接时退化为复制
+                shutil.copyfile(src_path, tmp_dest)
+            else:
+                touch_file(src_path)
+            if replace:
+                os.replace(tmp_dest, dest_path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    @staticmethod
+    @contextmanager
+    def replacing(dest_path):
+        """
+        Yields a file opened for binary writing that replaces dest_path when the
+        with block completes (it is discarded if the block raises).
+
+        The data goes to a temporary file next to dest_path that is then
+        renamed over it, so a dest_path that is a hard link to a blob is
+        unlinked rather than overwritten, and readers never see a partial file.
+        """
+        tmp_path = f"{dest_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                yield f
+            os.replace(tmp_path, dest_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def digest_file(self, path):
+        """SHA-256 of a file, cached by inode so hard links to the same blob hash once."""
+        st = os.stat(path)
+        key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        with self._digest_cache_lock:
+            digest = self._digest_cache.get(key)
+            if digest is not None:
+                self._digest_cache.move_to_end(key)
+                return digest
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                hasher.update(chunk)
+        digest = hasher.hexdigest()
+        with self._digest_cache_lock:
+            self._digest_cache[key] = digest
+            if len(self._digest_cache) > 4096:
+                self._digest_cache.popitem(last=False)
+        return digest
+
+    @staticmethod
+    def digest_stream(stream):
+        """SHA-256 of a seekable stream; the stream is rewound afterwards."""
+        hasher = hashlib.sha256()
+        stream.seek(0)
+        for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+            hasher.update(chunk)
+        stream.seek(0)
+        return hasher.hexdigest()
+
+    # --- Derived artifacts ---
+
+    def get_derived(self, source, recipe):
+        """
+        Returns (digest, meta) for a cached derived artifact, or None.
+
+        digest may be None for metadata-only results (e.g. a page count).
+        """
+        row = self._connection().execute(
+            "SELECT digest, meta FROM derived WHERE source = ? AND recipe = ?", (source, recipe)).fetchone()
+        if row is None:
+            return None
+        digest, meta = row
+        if digest is not None and not self.exists(digest):
+            # 结果 blob 已被回收, 记录失效
+            self._connection().execute("DELETE FROM derived WHERE source = ? AND recipe = ?", (source, recipe))
+            return None
+        return digest, json.loads(meta)
+
+    def put_derived(self, source, recipe, digest=None, meta=None):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO derived (source, recipe, digest, meta, created) VALUES (?, ?, ?, ?, ?)",
+            (source, recipe, digest, json.dumps(meta or {}), time.time()))
+
+    def forget(self, digest):
+        """Drops derived records that produce or originate from digest (after it was removed)."""
+        self._connection().execute("DELETE FROM derived WHERE source = ? OR digest = ?", (digest, digest))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_blob_store():
+    """Returns the process-wide BlobStore (root from BLOB_STORE_DIR, default uploads/blobs)."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = BlobStore(os.environ.get('BLOB_STORE_DIR', DEFAULT_ROOT))
+                # 未被引用的 blob 由后台清理任务回收
+                register_blob_storage(_store, UNREFERENCED_BLOB_TTL)
+    return _store
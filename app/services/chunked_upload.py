@@ -0,0 +1,240 @@
+import os
+import uuid
+import shutil
+import hashlib
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Windows: 无跨进程文件锁, 依赖偏移量检查
+    fcntl = None
+
+from flask import current_app, jsonify, request
+
+from .session_store import create_session_store
+from .janitor import register_session_storage, touch_file
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+DEFAULT_MAX_UPLOAD_SIZE = 2 * 1024 * 1024 * 1024
+READ_BLOCK_SIZE = 1024 * 1024
+
+
+class UploadError(Exception):
+    def __init__(self, message, status_code=400, **extra):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.extra = extra
+
+    def to_response(self):
+        return jsonify({'error': self.message, **self.extra}), self.status_code
+
+
+def _valid_uuid(value):
+    try:
+        return str(uuid.UUID(str(value))) == value
+    except ValueError:
+        return False
+
+
+class ChunkedUploads:
+    """
+    Resumable, chunked uploads that are appended straight into a tool's
+    session directory (<base_dir>/<session_id>/incoming/<upload_id>/data).
+
+    Protocol (see register_chunked_upload_routes):
+      1. POST   api/upload/init          {filename, size, sha256?, session_id?}
+                                          -> {upload_id, session_id, offset, chunk_size}
+      2. PUT    api/upload/<upload_id>?offset=N   raw chunk body,
+                                          optional header X-Chunk-SHA256
+                                          -> {offset, complete}
+         A PUT at the wrong offset returns 409 with the current offset, so
+         a client resumes by asking GET api/upload/<upload_id> and
+         continuing from the returned offset.
+      3. POST   api/upload  {session_id, upload_ids}  (the tool's normal
+         upload endpoint) processes the completed files.
+
+    Upload state is kept in the shared session store, so the chunks of one
+    upload may be handled by different worker processes.
+    """
+
+    def __init__(self, name, base_dir, ttl):
+        self.name = name
+        self.base_dir = base_dir
+        self.store = create_session_store(f"{name}.uploads", ttl=ttl)
+        # 过期 (放弃) 的上传由后台清理任务删除
+        register_session_storage(f"{name}.uploads", None, self.store)
+
+    def _upload_dir(self, session_id, upload_id):
+        return os.path.join(self.base_dir, session_id, 'incoming', upload_id)
+
+    def init(self, filename, size, sha256=None, session_id=None):
+        max_size = current_app.config.get('MAX_UPLOAD_SIZE', DEFAULT_MAX_UPLOAD_SIZE)
+        if not filename:
+            raise UploadError('Missing filename')
+        try:
+            size = int(size)
+        except (TypeError, ValueError):
+            raise UploadError('Missing or invalid size')
+        if size < 0 or size > max_size:
+            raise UploadError(f'File exceeds the maximum upload size of {max_size} bytes', 413)
+        if session_id is None:
+            session_id = str(uuid.uuid4())
+        elif not _valid_uuid(session_id):
+            raise UploadError('Invalid session ID')
+
+        upload_id = str(uuid.uuid4())
+        upload_dir = self._upload_dir(session_id, upload_id)
+        os.makedirs(upload_dir)
+        path = os.path.join(upload_dir, 'data')
+        open(path, 'wb').close()
+
+        state = {
+            'session_id': session_id,
+            'filename': filename,
+            'size': size,
+            'sha256': sha256.lower() if sha256 else None,
+            'path': path,
+            'directory': upload_dir,
+            'complete': size == 0 and not sha256,
+        }
+        self.store.set(upload_id, state)
+        logger.info(f"[{self.name}][{session_id}] Started chunked upload {upload_id} for '{filename}' ({size} bytes).")
+        return upload_id, state
+
+    def status(self, upload_id):
+        state = self.store.get(upload_id, touch=True) if _valid_uuid(upload_id) else None
+        if state is None:
+            raise UploadError('Unknown or expired upload ID', 404)
+        try:
+            offset = os.path.getsize(state['path'])
+        except OSError:
+            raise UploadError('Upload data is missing', 410)
+        return state, offset
+
+    def append(self, upload_id, offset, stream, length, chunk_sha256=None):
+        """Appends length bytes from stream at offset. Returns (new_offset, complete)."""
+        state, _ = self.status(upload_id)
+        if state['complete']:
+            return state['size'], True
+        if length is None:
+            raise UploadError('Content-Length is required', 411)
+
+        with open(state['path'], 'r+b') as f:
+            if fcntl is not None:
+                # 同一上传的并发/重试请求串行化
+                fcntl.flock(f, fcntl.LOCK_EX)
+            current = os.fstat(f.fileno()).st_size
+            if offset != current:
+                raise UploadError('Offset mismatch', 409, offset=current)
+            if offset + length > state['size']:
+                raise UploadError('Chunk extends past the declared file size')
+
+            hasher = hashlib.sha256()
+            f.seek(offset)
+            remaining = length
+            while remaining > 0:
+                block = stream.read(min(READ_BLOCK_SIZE, remaining))
+                if not block:
+                    break
+                hasher.update(block)
+                f.write(block)
+                remaining -= len(block)
+            if remaining or (chunk_sha256 and hasher.hexdigest() != chunk_sha256.lower()):
+                # 不完整或校验失败的分片丢弃, 客户端从原偏移量重传
+                f.truncate(offset)
+                raise UploadError('Chunk checksum mismatch' if not remaining else 'Incomplete chunk', 400, offset=offset)
+            f.flush()
+            new_offset = offset + length
+
+        complete = new_offset == state['size']
+        if complete:
+            if state['sha256'] and self._file_sha256(state['path']) != state['sha256']:
+                os.truncate(state['path'], 0)
+                raise UploadError('File checksum mismatch; upload restarted', 400, offset=0)
+            self.store.update(upload_id, complete=True)
+        else:
+            self.store.touch(upload_id)
+        # 追加分片不会改变会话目录的时间戳; 标记为使用中, 免得被当作孤立目录清理
+        touch_file(os.path.join(self.base_dir, state['session_id']))
+        return new_offset, complete
+
+    @staticmethod
+    def _file_sha256(path):
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(READ_BLOCK_SIZE), b''):
+                hasher.update(block)
+        return hasher.hexdigest()
+
+    def completed_files(self, session_id, upload_ids):
+        """Returns [(filename, path)] for completed uploads belonging to session_id, in order."""
+        if not session_id or not _valid_uuid(session_id):
+            raise UploadError('Invalid session ID')
+        if not upload_ids:
+            raise UploadError('No upload IDs provided')
+        files = []
+        for upload_id in upload_ids:
+            state, _ = self.status(upload_id)
+            if state['session_id'] != session_id:
+                raise UploadError(f'Upload {upload_id} does not belong to this session')
+            if not state['complete']:
+                raise UploadError(f"Upload of '{state['filename']}' is not complete", 409)
+            files.append((state['filename'], state['path']))
+        return files
+
+    def finish(self, session_id, upload_ids):
+        """
+        Forgets the given uploads and removes their data. Other uploads to the
+        same session (e.g. still in progress) are left alone.
+        """
+        if not session_id or not _valid_uuid(session_id):
+            return
+        for upload_id in upload_ids or []:
+            if not _valid_uuid(upload_id):
+                continue
+            self.store.delete(upload_id)
+            shutil.rmtree(self._upload_dir(session_id, upload_id), ignore_errors=True)
+        try:
+            # 最后一个上传完成后移除空的 incoming 目录
+            os.rmdir(os.path.join(self.base_dir, session_id, 'incoming'))
+        except OSError:
+            pass
+
+
+def register_chunked_upload_routes(blueprint, uploads):
+    """Adds the api/upload/init and api/upload/<upload_id> endpoints to a tool blueprint."""
+
+    def init_upload():
+        data = request.get_json(silent=True) or {}
+        try:
+            upload_id, state = uploads.init(
+                data.get('filename'), data.get('size'), data.get('sha256'), data.get('session_id'))
+        except UploadError as e:
+            return e.to_response()
+        return jsonify({
+            'success': True,
+            'upload_id': upload_id,
+            'session_id': state['session_id'],
+            'offset': 0,
+            'chunk_size': current_app.config.get('UPLOAD_CHUNK_SIZE', DEFAULT_CHUNK_SIZE),
+        })
+
+    def upload_chunk(upload_id):
+        try:
+            if request.method == 'GET':
+                state, offset = uploads.status(upload_id)
+                return jsonify({'success': True, 'offset': offset, 'size': state['size'], 'complete': state['complete']})
+            offset = request.args.get('offset', type=int)
+            if offset is None:
+                raise UploadError('Missing offset')
+            new_offset, complete = uploads.append(
+                upload_id, offset, request.stream, request.content_length, request.headers.get('X-Chunk-SHA256'))
+        except UploadError as e:
+            return e.to_response()
+        return jsonify({'success': True, 'offset': new_offset, 'complete': complete})
+
+    blueprint.add_url_rule('/api/upload/init', 'init_chunked_upload', init_upload, methods=['POST'])
+    blueprint.add_url_rule('/api/upload/<upload_id>', 'chunked_upload', upload_chunk, methods=['GET', 'PUT'])
@@ -0,0 +1,371 @@
+import os
+import time
+import shutil
+import logging
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: 只在单进程下运行, 不需要跨进程锁
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# 超出配额后一直清理到配额的这个比例以下, 避免每轮都在配额边缘反复清理
+QUOTA_LOW_WATERMARK = 0.9
+
+
+def touch_file(path):
+    """Marks a file as recently used (atime only) for LRU eviction."""
+    try:
+        st = os.stat(path)
+        os.utime(path, ns=(time.time_ns(), st.st_mtime_ns))
+    except OSError:
+        pass
+
+
+def _last_used(st):
+    return max(st.st_atime, st.st_mtime)
+
+
+def _path_size(path):
+    if os.path.isfile(path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                pass
+    return total
+
+
+def _remove_path(path):
+    try:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+    except OSError as e:
+        logger.error(f"[Janitor] Failed to remove {path}: {e}")
+        return False
+
+
+class SessionStorage:
+    """
+    A tool whose files live in <directory>/<session_id>/ and whose sessions are in a SessionStore.
+
+    With directory=None only the sessions' own data['directory'] paths are
+    managed (no orphan scan, no quota candidates).
+    """
+
+    def __init__(self, name, directory, store):
+        self.name = name
+        self.directory = directory
+        self.store = store
+
+    def evict_expired(self):
+        removed = 0
+        for session_id, data in self.store.pop_expired():
+            session_dir = data.get('directory') or (self.directory and os.path.join(self.directory, session_id))
+            if session_dir and _remove_path(session_dir):
+                removed += 1
+            logger.info(f"[Janitor][{self.name}][{session_id}] Expired session removed.")
+
+        # 孤立目录: 服务器崩溃或重启前遗留、已没有会话记录的目录
+        live = self.store.last_accessed()
+        cutoff = time.time() - self.store.ttl
+        for entry in self._entries():
+            if entry.name in live:
+                continue
+            try:
+                if _last_used(entry.stat()) < cutoff and _remove_path(entry.path):
+                    removed += 1
+                    logger.info(f"[Janitor][{self.name}] Removed orphaned directory {entry.path}.")
+            except OSError:
+                pass
+        return removed
+
+    def _entries(self):
+        if self.directory is None:
+            return []
+        try:
+            return [entry for entry in os.scandir(self.directory) if entry.is_dir()]
+        except FileNotFoundError:
+            return []
+
+    def candidates(self):
+        """Yields (last_used, size, key) for each session directory."""
+        live = self.store.last_accessed()
+        for entry in self._entries():
+            try:
+                last_used = live.get(entry.name, _last_used(entry.stat()))
+            except OSError:
+                continue
+            yield last_used, _path_size(entry.path), entry.name
+
+    def evict(self, key):
+        self.store.delete(key)
+        return _remove_path(os.path.join(self.directory, key))
+
+
+class FileStorage:
+    """
+    A directory of files that expire max_age seconds after they were last used.
+
+    Subdirectories are treated as one entry each (e.g. a cache of derived
+    files per source); their last use is the directory's own atime/mtime.
+    """
+
+    def __init__(self, name, directory, max_age):
+        self.name = name
+        self.directory = directory
+        self.max_age = max_age
+
+    def _entries(self):
+        try:
+            return [entry for entry in os.scandir(self.directory) if entry.is_file() or entry.is_dir()]
+        except FileNotFoundError:
+            return []
+
+    def evict_expired(self):
+        removed = 0
+        cutoff = time.time() - self.max_age
+        for entry in self._entries():
+            try:
+                if _last_used(entry.stat()) < cutoff and _remove_path(entry.path):
+                    removed += 1
+            except OSError:
+                pass
+        if removed:
+            logger.info(f"[Janitor][{self.name}] Removed {removed} expired files.")
+        return removed
+
+    def candidates(self):
+        for entry in self._entries():
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            size = st.st_size if entry.is_file() else _path_size(entry.path)
+            yield _last_used(st), size, entry.name
+
+    def evict(self, key):
+        return _remove_path(os.path.join(self.directory, key))
+
+
+class BlobStorage:
+    """
+    The blob store's objects. Only unreferenced blobs (link count 1, i.e.
+    not linked into any session/upload directory) are eligible; referenced
+    bytes are already accounted for by the areas that link them.
+    """
+
+    # 中断的写入留下的临时文件保留时间
+    TMP_MAX_AGE = 3600
+
+    def __init__(self, blob_store, max_age):
+        self.name = 'blobs'
+        self.blob_store = blob_store
+        self.max_age = max_age
+
+    def _unreferenced(self):
+        try:
+            shards = [entry.path for entry in os.scandir(self.blob_store.objects_dir) if entry.is_dir()]
+        except FileNotFoundError:
+            return
+        for shard in shards:
+            for entry in os.scandir(shard):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                if st.st_nlink <= 1:
+                    yield entry.name, st
+
+    def evict_expired(self):
+        removed = 0
+        cutoff = time.time() - self.max_age
+        for digest, st in list(self._unreferenced()):
+            if _last_used(st) < cutoff and self.evict(digest):
+                removed += 1
+
+        tmp_cutoff = time.time() - self.TMP_MAX_AGE
+        try:
+            for entry in os.scandir(self.blob_store.tmp_dir):
+                try:
+                    if entry.stat().st_mtime < tmp_cutoff:
+                        _remove_path(entry.path)
+                except OSError:
+                    pass
+        except FileNotFoundError:
+            pass
+
+        if removed:
+            logger.info(f"[Janitor][{self.name}] Removed {removed} unreferenced blobs.")
+        return removed
+
+    def candidates(self):
+        for digest, st in self._unreferenced():
+            yield _last_used(st), st.st_size, digest
+
+    def evict(self, key):
+        path = self.blob_store.path(key)
+        try:
+            # 再次确认仍未被引用 (可能刚被链接进某个会话)
+            if os.stat(path).st_nlink > 1:
+                return False
+        except FileNotFoundError:
+            return False
+        if _remove_path(path):
+            self.blob_store.forget(key)
+            return True
+        return False
+
+
+# 工具模块在导入时注册自己的存储区域; 使用 LAZY_TOOL_LOADING 时由 Janitor 的 prepare 回调确保它们已导入
+STORAGE_AREAS = []
+
+
+def register_session_storage(name, directory, store):
+    STORAGE_AREAS.append(SessionStorage(name, directory, store))
+
+
+def register_file_storage(name, directory, max_age):
+    STORAGE_AREAS.append(FileStorage(name, directory, max_age))
+
+
+def register_blob_storage(blob_store, max_age):
+    STORAGE_AREAS.append(BlobStorage(blob_store, max_age))
+
+
+class _SweepLock:
+    """Non-blocking cross-process lock so only one worker sweeps at a time."""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def __enter__(self):
+        if fcntl is None:
+            return True
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            os.close(self._fd)
+            self._fd = None
+            return False
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        return False
+
+
+class Janitor:
+    """
+    Background thread that removes expired sessions and files of every
+    registered storage area and, when their combined size exceeds
+    quota_bytes, evicts the least recently used sessions/files first.
+
+    prepare, if given, is called by the process that won the sweep lock
+    before each sweep, to register storage areas that this process has not
+    registered yet (e.g. of tools that are loaded lazily).
+    """
+
+    def __init__(self, interval, quota_bytes, lock_path, areas=None, prepare=None):
+        self.interval = interval
+        self.quota_bytes = quota_bytes
+        self.lock_path = lock_path
+        self.areas = STORAGE_AREAS if areas is None else areas
+        self.prepare = prepare
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sweep(self):
+        """Runs one cleanup pass. Returns the number of removed items, or None if another process holds the lock."""
+        with _SweepLock(self.lock_path) as acquired:
+            if not acquired:
+                return None
+            if self.prepare is not None:
+                try:
+                    self.prepare()
+                except Exception as e:
+                    logger.error(f"[Janitor] Error while registering storage areas: {e}", exc_info=True)
+            removed = 0
+            for area in list(self.areas):
+                try:
+                    removed += area.evict_expired()
+                except Exception as e:
+                    logger.error(f"[Janitor][{area.name}] Error while removing expired items: {e}", exc_info=True)
+            if self.quota_bytes:
+                removed += self._enforce_quota()
+            return removed
+
+    def _enforce_quota(self):
+        candidates = []
+        for area in list(self.areas):
+            try:
+                candidates.extend((last_used, size, area, key) for last_used, size, key in area.candidates())
+            except Exception as e:
+                logger.error(f"[Janitor][{area.name}] Error while listing files: {e}", exc_info=True)
+
+        total = sum(size for _, size, _, _ in candidates)
+        if total <= self.quota_bytes:
+            return 0
+
+        target = self.quota_bytes * QUOTA_LOW_WATERMARK
+        logger.warning(f"[Janitor] Storage usage {total} bytes exceeds quota {self.quota_bytes} bytes. Evicting least recently used items.")
+        removed = 0
+        candidates.sort(key=lambda candidate: candidate[0])
+        for last_used, size, area, key in candidates:
+            if total <= target:
+                break
+            if area.evict(key):
+                removed += 1
+                total -= size
+                logger.info(f"[Janitor][{area.name}] Evicted {key} ({size} bytes, last used {time.ctime(last_used)}).")
+        return removed
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"[Janitor] Unexpected error during sweep: {e}", exc_info=True)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='janitor', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+def init_janitor(app, prepare=None):
+    """Starts the background janitor if JANITOR_ENABLED is set. prepare is passed to Janitor."""
+    if not app.config.get('JANITOR_ENABLED'):
+        return None
+    janitor = Janitor(
+        interval=app.config.get('JANITOR_INTERVAL', 300),
+        quota_bytes=app.config.get('UPLOADS_QUOTA_BYTES', 0),
+        lock_path=os.path.join(app.config['PROJECT_ROOT'], 'uploads', '.janitor.lock'),
+        prepare=prepare,
+    )
+    janitor.start()
+    app.extensions['janitor'] = janitor
+    app.logger.info(f"Started background janitor (interval={janitor.interval}s, quota={janitor.quota_bytes or 'unlimited'} bytes).")
+    return janitor
@@ -0,0 +1,173 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .session_store import create_session_store
+from .janitor import register_session_storage
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_INTERVAL = 0.5  # 进度最多每隔这么多秒写一次共享存储
+HEARTBEAT_INTERVAL = 10  # 执行任务的进程每隔这么多秒刷新一次其排队中/执行中任务的心跳
+HEARTBEAT_TIMEOUT = 3 * HEARTBEAT_INTERVAL  # 心跳超过这么久未刷新的任务视为已随进程退出
+ACTIVE_STATUSES = ('queued', 'running')
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobQueue:
+    """
+    Background jobs for work that is too slow to run inside a request.
+
+    submit() returns a job id immediately and the job runs on a small
+    per-process thread pool (max_workers), so long jobs cannot take up the
+    web server's request threads; at most max_pending jobs may be queued or
+    running per process, beyond that submit() raises QueueFull. Job state
+    ({status, done, total, result, error}) is kept in the shared session
+    store, so any worker process can report it.
+
+    status is 'queued', 'running', 'done' or 'failed'. The job function is
+    called as fn(progress, *args), where progress(done, total) reports how
+    far it got; its return value (JSON-serializable) becomes result, and
+    the message of an exception it raises becomes error.
+
+    A job only runs in the process that submitted it, and dies with it
+    (e.g. when gunicorn recycles or reloads the worker). Each job records
+    its owner (pid and a per-process boot id) and a heartbeat that the
+    owner refreshes every HEARTBEAT_INTERVAL seconds; get() reports a
+    queued or running job as failed once its owner process no longer
+    exists or its heartbeat is older than HEARTBEAT_TIMEOUT.
+    """
+
+    def __init__(self, name, max_workers, max_pending, ttl):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.store = create_session_store(f"{name}.jobs", ttl=ttl)
+        register_session_storage(f"{name}.jobs", None, self.store)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._boot_id = None
+        self._active = set()  # 本进程中排队中/执行中的任务 id
+
+    def _get_executor(self):
+        # fork 之后的子进程不能沿用父进程的线程池 (也没有父进程的心跳线程)
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                thread_name_prefix=f"{self.name}.jobs")
+            self._pid = os.getpid()
+            self._boot_id = uuid.uuid4().hex
+            self._active = set()
+            threading.Thread(target=self._heartbeat_loop, args=(self._boot_id,),
+                             name=f"{self.name}.jobs.heartbeat", daemon=True).start()
+        return self._executor
+
+    def _heartbeat_loop(self, boot_id):
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            with self._lock:
+                if self._boot_id != boot_id:
+                    return
+                job_ids = list(self._active)
+            now = time.time()
+            for job_id in job_ids:
+                try:
+                    self.store.update(job_id, heartbeat=now)
+                except Exception as e:
+                    logger.warning(f"[{self.name} job {job_id}] Failed to record heartbeat: {e}")
+
+    def submit(self, fn, *args, **meta):
+        """Queues fn(progress, *args). Extra keyword arguments are stored with the job. Returns the job id."""
+        job_id = self.reserve(**meta)
+        self.start(job_id, fn, *args)
+        return job_id
+
+    def reserve(self, **meta):
+        """
+        Records a queued job owned by this process without running it yet, so
+        its id can be published (e.g. claimed in a session) first. Follow with
+        start() or release(). Raises QueueFull. Returns the job id.
+        """
+        job_id = str(uuid.uuid4())
+        with self._lock:
+            self._get_executor()
+            if len(self._active) >= self.max_pending:
+                raise QueueFull(f"Too many {self.name} jobs in progress, try again later")
+            self._active.add(job_id)
+            owner = {'owner_pid': self._pid, 'owner_boot': self._boot_id}
+        try:
+            self.store.set(job_id, {'status': 'queued', 'done': 0, 'total': None, 'result': None, 'error': None,
+                                    'heartbeat': time.time(), **owner, **meta})
+        except BaseException:
+            with self._lock:
+                self._active.discard(job_id)
+            raise
+        return job_id
+
+    def start(self, job_id, fn, *args):
+        """Runs a reserved job as fn(progress, *args)."""
+        try:
+            with self._lock:
+                executor = self._get_executor()
+            executor.submit(self._run, job_id, fn, args)
+        except BaseException:
+            self.release(job_id)
+            raise
+
+    def release(self, job_id):
+        """Forgets a reserved job that will not be started."""
+        with self._lock:
+            self._active.discard(job_id)
+        self.store.delete(job_id)
+
+    def get(self, job_id):
+        """The job's state dict, or None if unknown or expired. Jobs whose owner process is gone are marked failed."""
+        job = self.store.get(job_id)
+        if job is not None and job['status'] in ACTIVE_STATUSES and self._owner_gone(job):
+            logger.warning(f"[{self.name} job {job_id}] Owner process {job.get('owner_pid')} is gone; marking the job failed.")
+            job = self.store.update(job_id, status='failed',
+                                    error='The server process running this job stopped. Please try again.')
+        return job
+
+    def _owner_gone(self, job):
+        if time.time() - job.get('heartbeat', 0) > HEARTBEAT_TIMEOUT:
+            return True
+        pid = job.get('owner_pid')
+        if pid == os.getpid():
+            # pid 被复用时 boot id 不同
+            with self._lock:
+                return job.get('owner_boot') != self._boot_id
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        except (PermissionError, TypeError):
+            pass
+        return False
+
+    def _run(self, job_id, fn, args):
+        last_write = 0
+
+        def progress(done, total):
+            nonlocal last_write
+            now = time.monotonic()
+            if done == total or now - last_write >= PROGRESS_INTERVAL:
+                last_write = now
+                self.store.update(job_id, done=done, total=total, heartbeat=time.time())
+
+        try:
+            self.store.update(job_id, status='running', heartbeat=time.time())
+            result = fn(progress, *args)
+            self.store.update(job_id, status='done', result=result)
+        except Exception as e:
+            logger.error(f"[{self.name} job {job_id}] Failed: {e}", exc_info=True)
+            self.store.update(job_id, status='failed', error=str(e))
+        finally:
+            with self._lock:
+                self._active.discard(job_id)
@@ -0,0 +1,40 @@
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+_pools = {}  # { name: (pid, ProcessPoolExecutor) }
+_pools_lock = threading.Lock()
+
+
+def _mp_context():
+    # gthread worker 是多线程进程, 直接 fork 可能继承其他线程持有的锁; forkserver 从干净的进程 fork
+    try:
+        return multiprocessing.get_context('forkserver')
+    except ValueError:  # Windows
+        return multiprocessing.get_context('spawn')
+
+
+def get_process_pool(name, max_workers, initializer=None, initargs=()):
+    """
+    The per-process pool called name, for CPU-bound work that should not run
+    on request threads. Created on first use and recreated after a fork or
+    after discard_process_pool(). initializer(*initargs) runs once in each
+    pool process (e.g. to apply process-wide library settings).
+    """
+    with _pools_lock:
+        entry = _pools.get(name)
+        if entry is None or entry[0] != os.getpid():
+            entry = (os.getpid(), ProcessPoolExecutor(max_workers=max_workers, mp_context=_mp_context(),
+                                                      initializer=initializer, initargs=initargs))
+            _pools[name] = entry
+        return entry[1]
+
+
+def discard_process_pool(name, pool):
+    """Drops a pool that is broken (a pool process died); the next get_process_pool() starts a new one."""
+    with _pools_lock:
+        entry = _pools.get(name)
+        if entry is not None and entry[1] is pool:
+            del _pools[name]
+    pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,331 @@
+import os
+import copy
+import json
+import time
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+
+logger = logging.getLogger(__name__)
+
+# 项目根目录 (app/services 的上两级)
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+DEFAULT_DB_PATH = os.path.join(PROJECT_ROOT, 'uploads', 'sessions.sqlite3')
+DEFAULT_TTL = 3600  # Seconds of inactivity before a session expires
+
+
+class SessionStore(ABC):
+    """
+    Interface for tool session storage.
+
+    Sessions are JSON-serializable dicts keyed by session id within a
+    namespace (one per tool). Each session expires `ttl` seconds after it
+    was last written or touched; expired sessions are invisible to get()
+    and are removed by whoever calls pop_expired().
+
+    Values returned by get() are copies: write changes back with set() or
+    update(). Backends must implement every abstract method; a backend
+    missing one cannot be instantiated.
+    """
+
+    def __init__(self, namespace, ttl=DEFAULT_TTL):
+        self.namespace = namespace
+        self.ttl = ttl
+
+    @abstractmethod
+    def get(self, session_id, touch=False):
+        """Returns the session dict, or None if missing or expired."""
+
+    @abstractmethod
+    def set(self, session_id, data):
+        """Creates or replaces a session and resets its expiry."""
+
+    @abstractmethod
+    def update(self, session_id, **fields):
+        """Atomically merges fields into an existing session. Returns the new dict or None."""
+
+    @abstractmethod
+    def modify(self, session_id, fn):
+        """
+        Atomic read-modify-write of an existing session: merges fn(data) (a dict
+        of fields) into it. Returns the new dict or None. fn may raise to leave
+        the session unchanged; it runs while the session is locked, so keep it
+        short and free of I/O.
+        """
+
+    @abstractmethod
+    def delete(self, session_id):
+        """Removes a session. Returns its last data, or None if it did not exist."""
+
+    @abstractmethod
+    def touch(self, session_id):
+        """Resets a session's expiry without changing its data."""
+
+    @abstractmethod
+    def pop_expired(self, now=None):
+        """Removes expired sessions and returns them as a list of (session_id, data)."""
+
+    @abstractmethod
+    def last_accessed(self):
+        """Returns { session_id: last_accessed } for the live sessions."""
+
+    @abstractmethod
+    def __len__(self):
+        """Returns the number of live sessions."""
+
+    def __contains__(self, session_id):
+        return self.get(session_id) is not None
+
+
+class MemorySessionStore(SessionStore):
+    """Process-local store; only suitable for a single worker process."""
+
+    def __init__(self, namespace, ttl=DEFAULT_TTL):
+        super().__init__(namespace, ttl)
+        self._lock = threading.Lock()
+        self._sessions = {}  # { session_id: (data, last_accessed) }
+
+    def _live(self, session_id, now):
+        entry = self._sessions.get(session_id)
+        if entry is None or entry[1] + self.ttl <= now:
+            return None
+        return entry
+
+    def get(self, session_id, touch=False):
+        now = time.time()
+        with self._lock:
+            entry = self._live(session_id, now)
+            if entry is None:
+                return None
+            if touch:
+                self._sessions[session_id] = (entry[0], now)
+            return copy.deepcopy(entry[0])
+
+    def set(self, session_id, data):
+        with self._lock:
+            self._sessions[session_id] = (copy.deepcopy(data), time.time())
+
+    def update(self, session_id, **fields):
+        now = time.time()
+        with self._lock:
+            entry = self._live(session_id, now)
+            if entry is None:
+                return None
+            data = dict(entry[0], **copy.deepcopy(fields))
+            self._sessions[session_id] = (data, now)
+            return copy.deepcopy(data)
+
+    def modify(self, session_id, fn):
+        now = time.time()
+        with self._lock:
+            entry = self._live(session_id, now)
+            if entry is None:
+                return None
+            data = dict(entry[0], **copy.deepcopy(fn(copy.deepcopy(entry[0]))))
+            self._sessions[session_id] = (data, now)
+            return copy.deepcopy(data)
+
+    def delete(self, session_id):
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+        return entry[0] if entry else None
+
+    def touch(self, session_id):
+        now = time.time()
+        with self._lock:
+            entry = self._live(session_id, now)
+            if entry is not None:
+                self._sessions[session_id] = (entry[0], now)
+
+    def pop_expired(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            expired = [sid for sid, (_, last) in self._sessions.items() if last + self.ttl <= now]
+            return [(sid, self._sessions.pop(sid)[0]) for sid in expired]
+
+    def last_accessed(self):
+        now = time.time()
+        with self._lock:
+            return {sid: last for sid, (_, last) in self._sessions.items() if last + self.ttl > now}
+
+    def __len__(self):
+        return len(self.last_accessed())
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    SQLite (WAL mode) store shared by every worker process on the host, so a
+    session created on one worker is visible to the others and survives
+    restarts.
+    """
+
+    def __init__(self, namespace, ttl=DEFAULT_TTL, db_path=DEFAULT_DB_PATH):
+        super().__init__(namespace, ttl)
+        self.db_path = db_path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " namespace TEXT NOT NULL,"
+                " session_id TEXT NOT NULL,"
+                " data TEXT NOT NULL,"
+                " last_accessed REAL NOT NULL,"
+                " PRIMARY KEY (namespace, session_id))"
+            )
+
+    def _connection(self):
+        # 每个线程一个连接; fork 之后 pid 变化, 不能复用父进程的连接
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _conn(self, write=True):
+        return _Transaction(self._connection(), immediate=write)
+
+    def get(self, session_id, touch=False):
+        now = time.time()
+        with self._conn(write=touch) as conn:
+            row = conn.execute(
+                "SELECT data FROM sessions WHERE namespace = ? AND session_id = ? AND last_accessed > ?",
+                (self.namespace, session_id, now - self.ttl)).fetchone()
+            if row is None:
+                return None
+            if touch:
+                conn.execute(
+                    "UPDATE sessions SET last_accessed = ? WHERE namespace = ? AND session_id = ?",
+                    (now, self.namespace, session_id))
+        return json.loads(row[0])
+
+    def set(self, session_id, data):
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (namespace, session_id, data, last_accessed) VALUES (?, ?, ?, ?)",
+                (self.namespace, session_id, json.dumps(data), time.time()))
+
+    def update(self, session_id, **fields):
+        now = time.time()
+        with self._conn() as conn:
+            row = conn.execute(
+                "SELECT data FROM sessions WHERE namespace = ? AND session_id = ? AND last_accessed > ?",
+                (self.namespace, session_id, now - self.ttl)).fetchone()
+            if row is None:
+                return None
+            data = dict(json.loads(row[0]), **fields)
+            conn.execute(
+                "UPDATE sessions SET data = ?, last_accessed = ? WHERE namespace = ? AND session_id = ?",
+                (json.dumps(data), now, self.namespace, session_id))
+        return data
+
+    def modify(self, session_id, fn):
+        now = time.time()
+        # BEGIN IMMEDIATE: 其他进程在 fn 执行期间不能修改这个会话
+        with self._conn() as conn:
+            row = conn.execute(
+                "SELECT data FROM sessions WHERE namespace = ? AND session_id = ? AND last_accessed > ?",
+                (self.namespace, session_id, now - self.ttl)).fetchone()
+            if row is None:
+                return None
+            data = json.loads(row[0])
+            data = dict(data, **fn(copy.deepcopy(data)))
+            conn.execute(
+                "UPDATE sessions SET data = ?, last_accessed = ? WHERE namespace = ? AND session_id = ?",
+                (json.dumps(data), now, self.namespace, session_id))
+        return data
+
+    def delete(self, session_id):
+        with self._conn() as conn:
+            row = conn.execute(
+                "SELECT data FROM sessions WHERE namespace = ? AND session_id = ?",
+                (self.namespace, session_id)).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "DELETE FROM sessions WHERE namespace = ? AND session_id = ?",
+                (self.namespace, session_id))
+        return json.loads(row[0])
+
+    def touch(self, session_id):
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE sessions SET last_accessed = ? WHERE namespace = ? AND session_id = ? AND last_accessed > ?",
+                (now, self.namespace, session_id, now - self.ttl))
+
+    def pop_expired(self, now=None):
+        cutoff = (time.time() if now is None else now) - self.ttl
+        with self._conn() as conn:
+            rows = conn.execute(
+                "SELECT session_id, data FROM sessions WHERE namespace = ? AND last_accessed <= ?",
+                (self.namespace, cutoff)).fetchall()
+            conn.execute(
+                "DELETE FROM sessions WHERE namespace = ? AND last_accessed <= ?",
+                (self.namespace, cutoff))
+        return [(session_id, json.loads(data)) for session_id, data in rows]
+
+    def last_accessed(self):
+        with self._conn(write=False) as conn:
+            rows = conn.execute(
+                "SELECT session_id, last_accessed FROM sessions WHERE namespace = ? AND last_accessed > ?",
+                (self.namespace, time.time() - self.ttl)).fetchall()
+        return dict(rows)
+
+    def __len__(self):
+        with self._conn(write=False) as conn:
+            row = conn.execute(
+                "SELECT COUNT(*) FROM sessions WHERE namespace = ? AND last_accessed > ?",
+                (self.namespace, time.time() - self.ttl)).fetchone()
+        return row[0]
+
+
+class _Transaction:
+    """
+    Wraps an autocommit connection so `with` runs the block in a transaction.
+    Writers use BEGIN IMMEDIATE so read-modify-write sequences cannot interleave.
+    """
+
+    def __init__(self, conn, immediate=True):
+        self.conn = conn
+        self.immediate = immediate
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE" if self.immediate else "BEGIN")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")
+        return False
+
+
+# 所有已创建的存储, 供后台清理任务遍历
+STORES = {}
+
+
+def create_session_store(namespace, ttl=DEFAULT_TTL):
+    """
+    Creates the session store for a tool.
+
+    The backend is chosen by the SESSION_STORE environment variable:
+    'sqlite' (default, shared across worker processes; database at
+    SESSION_DB_PATH) or 'memory' (process-local).
+    """
+    backend = os.environ.get('SESSION_STORE', 'sqlite').lower()
+    if backend == 'memory':
+        store = MemorySessionStore(namespace, ttl=ttl)
+    elif backend == 'sqlite':
+        store = SQLiteSessionStore(namespace, ttl=ttl, db_path=os.environ.get('SESSION_DB_PATH', DEFAULT_DB_PATH))
+    else:
+        raise ValueError(f"Unknown SESSION_STORE backend: {backend!r}")
+    logger.info(f"Using {type(store).__name__} for '{namespace}' sessions (ttl={ttl}s).")
+    STORES[namespace] = store
+    return store
@@ -0,0 +1,108 @@
+// Resumable chunked uploads (see app/services/chunked_upload.py).
+//
+// chunkedUpload('/tools/img2pdf', files, { onProgress })
+//   -> Promise<{ session_id, upload_ids }>
+//
+// Each file is registered with POST <base>/api/upload/init and sent in
+// chunks with PUT <base>/api/upload/<upload_id>?offset=N. A failed chunk is
+// retried after asking the server for the current offset, so an interrupted
+// upload continues where it stopped instead of starting over. The caller then
+// POSTs { session_id, upload_ids } to the tool's normal api/upload endpoint.
+(function () {
+    'use strict';
+
+    // Files larger than this are sent in chunks instead of one multipart request
+    const CHUNKED_UPLOAD_THRESHOLD = 8 * 1024 * 1024;
+    const MAX_RETRIES = 5;
+
+    async function requestJson(method, url, body, headers) {
+        const response = await fetch(url, { method, body, headers });
+        let data = {};
+        try {
+            data = await response.json();
+        } catch (e) {
+            // 非 JSON 响应 (例如代理返回的错误页)
+        }
+        return { ok: response.ok, status: response.status, data };
+    }
+
+    async function sha256Hex(blob) {
+        if (!window.crypto || !window.crypto.subtle) {
+            return null; // 非安全上下文 (http) 下不可用, 跳过分片校验
+        }
+        const digest = await window.crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+        return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+    }
+
+    async function uploadFile(baseUrl, file, sessionId, onChunk) {
+        const init = await requestJson('POST', `${baseUrl}/api/upload/init`,
+            JSON.stringify({ filename: file.name, size: file.size, session_id: sessionId }),
+            { 'Content-Type': 'application/json' });
+        if (!init.ok) {
+            throw new Error(init.data.error || `Upload failed (${init.status})`);
+        }
+        const { upload_id: uploadId, chunk_size: chunkSize } = init.data;
+        let offset = init.data.offset;
+        let retries = 0;
+
+        while (offset < file.size) {
+            const chunk = file.slice(offset, Math.min(offset + chunkSize, file.size));
+            const headers = { 'Content-Type': 'application/octet-stream' };
+            const checksum = await sha256Hex(chunk);
+            if (checksum) {
+                headers['X-Chunk-SHA256'] = checksum;
+            }
+            let result;
+            try {
+                result = await requestJson('PUT', `${baseUrl}/api/upload/${uploadId}?offset=${offset}`, chunk, headers);
+            } catch (e) {
+                result = { ok: false, status: 0, data: {} }; // 网络错误
+            }
+            if (result.ok) {
+                offset = result.data.offset;
+                retries = 0;
+                onChunk(offset);
+                continue;
+            }
+            if (result.status === 404 || result.status === 410 || result.status === 413 || ++retries > MAX_RETRIES) {
+                throw new Error(result.data.error || `Upload failed (${result.status})`);
+            }
+            // 从服务器记录的偏移量继续
+            await new Promise(resolve => setTimeout(resolve, 500 * retries));
+            if (typeof result.data.offset === 'number') {
+                offset = result.data.offset;
+            } else {
+                const status = await requestJson('GET', `${baseUrl}/api/upload/${uploadId}`);
+                if (status.ok) {
+                    offset = status.data.offset;
+                }
+            }
+        }
+        return { uploadId, sessionId: init.data.session_id };
+    }
+
+    async function chunkedUpload(baseUrl, files, options = {}) {
+        const onProgress = options.onProgress || (() => {});
+        const total = Array.from(files).reduce((sum, file) => sum + file.size, 0) || 1;
+        let done = 0;
+        let sessionId = options.sessionId || null;
+        const uploadIds = [];
+
+        for (const file of files) {
+            const result = await uploadFile(baseUrl, file, sessionId, offset => {
+                onProgress(Math.round(((done + offset) / total) * 100));
+            });
+            sessionId = result.sessionId;
+            uploadIds.push(result.uploadId);
+            done += file.size;
+        }
+        return { session_id: sessionId, upload_ids: uploadIds };
+    }
+
+    function needsChunkedUpload(files) {
+        return Array.from(files).reduce((sum, file) => sum + file.size, 0) > CHUNKED_UPLOAD_THRESHOLD;
+    }
+
+    window.chunkedUpload = chunkedUpload;
+    window.needsChunkedUpload = needsChunkedUpload;
+})();
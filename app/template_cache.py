@@ -0,0 +1,61 @@
+import os
+from flask import Flask
+from jinja2 import FileSystemBytecodeCache
+
+
+def init_template_cache(app: Flask):
+    """
+    Enables Jinja's on-disk bytecode cache when TEMPLATE_CACHE_DIR is set.
+
+    Compiled templates are then shared by every worker and survive restarts,
+    so a freshly started worker does not recompile base.html and the tool
+    pages before its first response. Entries are keyed by template source
+    checksum, so edited templates are recompiled automatically.
+    """
+    cache_dir = app.config.get('TEMPLATE_CACHE_DIR')
+    if not cache_dir:
+        return None
+
+    os.makedirs(cache_dir, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+    app.logger.info(f"Jinja bytecode cache enabled at {cache_dir}")
+    return app.jinja_env.bytecode_cache
+
+
+def list_precompile_templates(app: Flask):
+    """Returns base.html, index.html, errors/* and every <tool>/index.html."""
+    template_root = os.path.join(app.root_path, app.template_folder)
+    names = ['base.html', 'index.html']
+
+    errors_dir = os.path.join(template_root, 'errors')
+    if os.path.isdir(errors_dir):
+        names.extend(f"errors/{name}" for name in sorted(os.listdir(errors_dir)) if name.endswith('.html'))
+
+    for entry in sorted(os.listdir(template_root)):
+        if entry == 'errors':
+            continue
+        if os.path.isfile(os.path.join(template_root, entry, 'index.html')):
+            names.append(f"{entry}/index.html")
+    return names
+
+
+def precompile_templates(app: Flask):
+    """
+    Compiles the templates into the bytecode cache (meant to run at deploy time).
+
+    Returns:
+        A list of (template_name, error) tuples; error is None on success.
+    """
+    if app.jinja_env.bytecode_cache is None:
+        raise RuntimeError("TEMPLATE_CACHE_DIR is not configured; nothing to precompile into.")
+
+    results = []
+    for name in list_precompile_templates(app):
+        try:
+            # get_template 会编译模板并写入 bytecode cache
+            app.jinja_env.get_template(name)
+            results.append((name, None))
+        except Exception as e:
+            app.logger.error(f"Failed to precompile template '{name}': {e}")
+            results.append((name, e))
+    return results
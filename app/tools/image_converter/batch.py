@@ -0,0 +1,108 @@
+import os
+import time
+import logging
+import zipfile
+from concurrent.futures import as_completed, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image
+
+from app.services.process_pool import get_process_pool, discard_process_pool
+from .edit_engine import apply_operations, save_image
+
+logger = logging.getLogger(__name__)
+
+# 批处理进程池大小, 默认每个核一个进程
+BATCH_WORKERS = int(os.environ.get('IMAGE_BATCH_WORKERS', 0)) or os.cpu_count() or 1
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def process_image(source_path, output_path, operations, output_format, preset=None):
+    """Runs in a pool process: applies operations to one image and saves it. Returns (width, height)."""
+    with Image.open(source_path) as img:
+        img.load()
+        result = apply_operations(img, operations)
+        save_image(result, output_path, output_format, preset)
+        return result.size
+
+
+class _ZipStream:
+    """Unseekable file object that collects what ZipFile writes so it can be yielded."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _unique_name(name, used):
+    base, ext = os.path.splitext(name)
+    candidate, n = name, 1
+    while candidate in used:
+        candidate = f"{base}_{n}{ext}"
+        n += 1
+    used.add(candidate)
+    return candidate
+
+
+def stream_batch_zip(items, work_dir, operations, output_format, preset=None):
+    """
+    Processes items ([(original filename, source path)]) on the process pool
+    and yields a ZIP archive of the results, adding each image as soon as it
+    is done. Images that fail are listed in errors.txt at the end of the archive.
+    """
+    pool = get_process_pool('image_converter.batch', BATCH_WORKERS)
+    futures = {}
+    for i, (original_name, source_path) in enumerate(items):
+        output_path = os.path.join(work_dir, f"output_{i}")
+        future = pool.submit(process_image, source_path, output_path, operations, output_format, preset)
+        futures[future] = (original_name, source_path, output_path)
+
+    stream = _ZipStream()
+    used_names = set()
+    errors = []
+    extension = 'jpg' if output_format == 'jpeg' else output_format
+    try:
+        with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_STORED) as archive:
+            for future in as_completed(futures):
+                original_name, source_path, output_path = futures[future]
+                try:
+                    future.result()
+                except BrokenProcessPool:
+                    discard_process_pool('image_converter.batch', pool)
+                    raise
+                except Exception as e:
+                    # 错误信息中不暴露服务器上的路径
+                    message = str(e).replace(source_path, original_name)
+                    logger.warning(f"Batch item '{original_name}' failed: {message}")
+                    errors.append(f"{original_name}: {message}")
+                    continue
+
+                arcname = _unique_name(f"{os.path.splitext(original_name)[0]}.{extension}", used_names)
+                info = zipfile.ZipInfo(arcname, date_time=time.localtime()[:6])
+                with archive.open(info, 'w') as entry, open(output_path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b''):
+                        entry.write(chunk)
+                        yield stream.drain()
+                os.remove(output_path)
+                yield stream.drain()
+
+            if errors:
+                archive.writestr('errors.txt', '\n'.join(errors) + '\n')
+        yield stream.drain()
+    finally:
+        # 客户端中途断开时取消尚未开始的任务, 并等待正在执行的任务结束,
+        # 调用方随后会删除 work_dir, 不能让池中的进程还在其中读写
+        for future in futures:
+            future.cancel()
+        wait(futures)
@@ -0,0 +1,366 @@
+import os
+import json
+import math
+import threading
+from collections import OrderedDict
+
+from PIL import Image, ImageOps
+
+# 每个 worker 进程缓存的解码中间结果上限 (字节)
+DEFAULT_CACHE_BYTES = int(os.environ.get('IMAGE_EDIT_CACHE_BYTES', 256 * 1024 * 1024))
+
+# 缩小倍数达到该值时先用 reduce() 按整数倍缩小再做 LANCZOS; 3.0 时与直接重采样几乎无差别
+REDUCING_GAP = 3.0
+
+# Pillow 的格式名; 'jpg' 不是 Pillow 认识的格式名
+PILLOW_FORMATS = {'jpg': 'JPEG', 'jpeg': 'JPEG', 'png': 'PNG', 'gif': 'GIF', 'webp': 'WEBP', 'avif': 'AVIF'}
+
+# 编码器预设: 编码速度与文件大小的取舍 (按 Pillow 格式名给出 save() 参数)
+ENCODER_PRESETS = {
+    'fast': {
+        'JPEG': {'quality': 80},
+        'PNG': {'compress_level': 1},
+        'WEBP': {'quality': 80, 'method': 0},
+        'AVIF': {'quality': 60, 'speed': 10},
+    },
+    'balanced': {
+        'JPEG': {'quality': 80, 'optimize': True},
+        'PNG': {'compress_level': 6},
+        'WEBP': {'quality': 80, 'method': 4},
+        'AVIF': {'quality': 60, 'speed': 6},
+    },
+    'smallest': {
+        'JPEG': {'quality': 75, 'optimize': True, 'progressive': True},
+        'PNG': {'optimize': True},
+        'WEBP': {'quality': 75, 'method': 6},
+        'AVIF': {'quality': 50, 'speed': 2},
+    },
+}
+DEFAULT_PRESET = os.environ.get('IMAGE_ENCODER_PRESET', 'balanced')
+if DEFAULT_PRESET not in ENCODER_PRESETS:
+    DEFAULT_PRESET = 'balanced'
+
+# 90° 旋转和翻转构成的二面体群: (逆时针旋转的 90° 次数, 是否先水平翻转) -> Image.Transpose
+_TRANSPOSE_METHODS = {
+    (0, True): 'FLIP_LEFT_RIGHT',
+    (1, False): 'ROTATE_90',
+    (1, True): 'TRANSPOSE',
+    (2, False): 'ROTATE_180',
+    (2, True): 'FLIP_TOP_BOTTOM',
+    (3, False): 'ROTATE_270',
+    (3, True): 'TRANSVERSE',
+}
+_SWAPPING_TRANSPOSES = {'ROTATE_90', 'ROTATE_270', 'TRANSPOSE', 'TRANSVERSE'}
+
+
+def apply_operation(img, op):
+    """Applies one edit operation and returns the resulting image (img itself is not modified)."""
+    op_type = op.get('type')
+
+    if op_type == 'resize':
+        width = op.get('width')
+        height = op.get('height')
+        if width and height:
+            box = tuple(op['box']) if op.get('box') else None
+            img = img.resize((int(width), int(height)), Image.LANCZOS, box=box, reducing_gap=REDUCING_GAP)
+
+    elif op_type == 'crop':
+        left = op.get('left', 0)
+        top = op.get('top', 0)
+        right = op.get('right', img.width)
+        bottom = op.get('bottom', img.height)
+        img = img.crop((int(left), int(top), int(right), int(bottom)))
+
+    elif op_type == 'rotate':
+        angle = op.get('angle', 0)
+        img = img.rotate(float(angle), expand=True)
+
+    elif op_type == 'flip':
+        direction = op.get('direction', 'horizontal')
+        if direction == 'horizontal':
+            img = ImageOps.mirror(img)
+        elif direction == 'vertical':
+            img = ImageOps.flip(img)
+
+    elif op_type == 'grayscale':
+        img = ImageOps.grayscale(img)
+
+    elif op_type == 'transpose':
+        img = img.transpose(Image.Transpose[op['method']])
+
+    return img
+
+
+def save_image(img, fp, output_format, preset=None):
+    """
+    Encodes img to a path or file object in output_format ('jpg', 'png', ...;
+    unknown formats become JPEG) with the encoder settings of preset
+    ('fast', 'balanced' or 'smallest'; default IMAGE_ENCODER_PRESET).
+    """
+    pillow_format = PILLOW_FORMATS.get(output_format, 'JPEG')
+    options = ENCODER_PRESETS.get(preset) or ENCODER_PRESETS[DEFAULT_PRESET]
+    if pillow_format == 'JPEG' and img.mode not in ('RGB', 'L', 'CMYK'):
+        img = img.convert('RGB')
+    elif pillow_format == 'AVIF' and img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if img.has_transparency_data else 'RGB')
+    img.save(fp, format=pillow_format, **options.get(pillow_format, {}))
+
+
+def _compose(transform, op):
+    # transform 表示 "先 (可选) 水平翻转, 再逆时针旋转 k 个 90°"; 返回再执行 op 之后的组合
+    turns, mirrored = transform
+    if op.get('type') == 'rotate':
+        return (turns + int(float(op.get('angle', 0)) % 360.0) // 90) % 4, mirrored
+    if op.get('direction', 'horizontal') == 'horizontal':
+        return -turns % 4, not mirrored
+    # 垂直翻转 = 水平翻转后旋转 180°
+    return (2 - turns) % 4, not mirrored
+
+
+def _is_right_angle(op):
+    op_type = op.get('type')
+    if op_type == 'rotate':
+        return float(op.get('angle', 0)) % 90.0 == 0
+    return op_type == 'flip' and op.get('direction', 'horizontal') in ('horizontal', 'vertical')
+
+
+def _crop_box(op, size):
+    width, height = size
+    return (int(op.get('left', 0)), int(op.get('top', 0)),
+            int(op.get('right', width)), int(op.get('bottom', height)))
+
+
+def _inside(box, size):
+    # crop 允许超出图像 (超出部分补黑), resize(box=...) 不允许
+    left, top, right, bottom = box
+    return 0 <= left < right <= size[0] and 0 <= top < bottom <= size[1]
+
+
+def plan_operations(operations, size):
+    """
+    Rewrites an operation list for an image of the given size into an
+    equivalent one that is cheaper to execute:
+
+    - runs of 90° rotations and flips become a single transpose (or nothing,
+      e.g. flip + flip);
+    - a crop followed by a crop or a resize becomes one crop, or one
+      resize(box=...) that resamples straight from the uncropped image;
+    - grayscale after the image is already grayscale is dropped, and a
+      grayscale is moved ahead of pending transposes so they move one band
+      instead of three;
+    - no-op resizes and 0° rotations are dropped.
+
+    Large downscales use reduce() before resampling (see REDUCING_GAP).
+    """
+    planned = []
+    transform = (0, False)
+    grayscale = False
+    crop_size = None  # 上一个输出的 crop 所作用的图像尺寸 (可以与下一个操作合并时)
+
+    def flush():
+        nonlocal transform, crop_size
+        method = _TRANSPOSE_METHODS.get(transform)
+        if method:
+            planned.append({'type': 'transpose', 'method': method})
+            crop_size = None
+        transform = (0, False)
+
+    for op in operations:
+        op_type = op.get('type')
+        if _is_right_angle(op):
+            transform = _compose(transform, op)
+        elif op_type == 'grayscale':
+            if grayscale:
+                continue
+            # 灰度化是逐像素的, 与纯像素重排的 transpose 可交换
+            planned.append(op)
+            grayscale = True
+        elif op_type == 'crop':
+            flush()
+            box = _crop_box(op, size)
+            previous = planned[-1] if crop_size and planned else None
+            if previous is not None and previous['type'] == 'crop' and _inside(box, size):
+                left, top = previous['left'], previous['top']
+                planned[-1] = dict(previous, left=left + box[0], top=top + box[1],
+                                   right=left + box[2], bottom=top + box[3])
+            else:
+                planned.append({'type': 'crop', 'left': box[0], 'top': box[1], 'right': box[2], 'bottom': box[3]})
+                crop_size = size if _inside(box, size) else None
+            size = result_size(size, [op])
+            continue
+        elif op_type == 'resize':
+            if not (op.get('width') and op.get('height')):
+                continue
+            target = (int(op['width']), int(op['height']))
+            flush()
+            previous = planned[-1] if crop_size and planned else None
+            if previous is not None and previous['type'] == 'crop':
+                box = _crop_box(previous, crop_size)
+                planned[-1] = {'type': 'resize', 'width': target[0], 'height': target[1], 'box': list(box)}
+            elif target != tuple(size):
+                planned.append({'type': 'resize', 'width': target[0], 'height': target[1]})
+        else:
+            flush()
+            planned.append(op)
+        crop_size = None
+        size = result_size(size, [op])
+    flush()
+    return planned
+
+
+def apply_operations(img, operations):
+    """Applies an operation list (after planning it) and returns the resulting image."""
+    for op in plan_operations(operations, img.size):
+        img = apply_operation(img, op)
+    return img
+
+
+def scale_operation(op, scale):
+    """Scales the pixel coordinates of an operation, for applying it to a downscaled proxy."""
+    op_type = op.get('type')
+    if op_type == 'resize' and op.get('width') and op.get('height'):
+        return dict(op, width=max(1, round(int(op['width']) * scale)), height=max(1, round(int(op['height']) * scale)))
+    if op_type == 'crop':
+        return dict(op, **{key: round(int(op[key]) * scale) for key in ('left', 'top', 'right', 'bottom') if key in op})
+    return op
+
+
+def _rotated_size(size, angle):
+    # 与 Image.rotate(expand=True) 的画布尺寸计算一致
+    width, height = size
+    angle = angle % 360.0
+    if angle in (0, 180):
+        return width, height
+    if angle in (90, 270):
+        return height, width
+    radians = -math.radians(angle)
+    a, b = round(math.cos(radians), 15), round(math.sin(radians), 15)
+    d, e = round(-math.sin(radians), 15), round(math.cos(radians), 15)
+    cx, cy = width / 2.0, height / 2.0
+    c = a * -cx + b * -cy + cx
+    f = d * -cx + e * -cy + cy
+    corners = ((0, 0), (width, 0), (width, height), (0, height))
+    xs = [a * x + b * y + c for x, y in corners]
+    ys = [d * x + e * y + f for x, y in corners]
+    return math.ceil(max(xs)) - math.floor(min(xs)), math.ceil(max(ys)) - math.floor(min(ys))
+
+
+def result_size(size, operations):
+    """The (width, height) that applying operations to an image of the given size produces, without decoding it."""
+    width, height = size
+    for op in operations:
+        op_type = op.get('type')
+        if op_type == 'resize' and op.get('width') and op.get('height'):
+            width, height = int(op['width']), int(op['height'])
+        elif op_type == 'crop':
+            left, top = int(op.get('left', 0)), int(op.get('top', 0))
+            right, bottom = int(op.get('right', width)), int(op.get('bottom', height))
+            width, height = max(0, right - left), max(0, bottom - top)
+        elif op_type == 'rotate':
+            width, height = _rotated_size((width, height), float(op.get('angle', 0)))
+        elif op_type == 'transpose' and op.get('method') in _SWAPPING_TRANSPOSES:
+            width, height = height, width
+    return width, height
+
+
+def _image_bytes(img):
+    return img.width * img.height * len(img.getbands())
+
+
+class EditEngine:
+    """
+    Renders an image as (pristine source, operation list).
+
+    The decoded source and every rendered result are cached in memory under
+    (source digest, operation list), so a request that appends one operation
+    to a chain rendered before decodes nothing and applies only the new
+    operation. The operations not covered by the cache are run through
+    plan_operations() first. Cached
+    images are shared and must be treated as read-only; every operation
+    returns a new image.
+
+    The cache is per process and bounded by max_bytes of decoded pixels
+    (least recently used entries are dropped first).
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()  # { (digest, proxy_size, prefix_json): Image }
+        self._bytes = 0
+
+    @staticmethod
+    def _key(digest, operations, proxy_size=None):
+        return digest, proxy_size, json.dumps(operations, sort_keys=True)
+
+    def _get(self, key):
+        with self._lock:
+            img = self._cache.get(key)
+            if img is not None:
+                self._cache.move_to_end(key)
+            return img
+
+    def _put(self, key, img):
+        size = _image_bytes(img)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._cache.pop(key, None)
+            if previous is not None:
+                self._bytes -= _image_bytes(previous)
+            self._cache[key] = img
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._cache.popitem(last=False)
+                self._bytes -= _image_bytes(evicted)
+
+    @staticmethod
+    def _decode(source_path, proxy_size):
+        img = Image.open(source_path)
+        if proxy_size:
+            scale = min(1.0, proxy_size / max(img.size))
+            target = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+            if scale < 1:
+                # JPEG 可以在解码时直接按 1/2~1/8 缩小 (DCT 缩放), 不必先解码全尺寸
+                img.draft(img.mode, target)
+                img = img.resize(target, Image.BICUBIC, reducing_gap=2.0)
+        img.load()
+        return img
+
+    def render(self, source_path, source_digest, operations, proxy_size=None):
+        """
+        Returns the image produced by applying operations to source_path (read-only, may be cached).
+
+        With proxy_size, the source is decoded downscaled so its longer side is
+        at most proxy_size pixels, and the operations' coordinates are scaled
+        to match: a fast, approximate preview of the full-resolution result.
+        """
+        scale = 1.0
+        if proxy_size:
+            with Image.open(source_path) as header:
+                scale = min(1.0, proxy_size / max(header.size))
+
+        # 从最长的已缓存前缀开始
+        img = None
+        start = 0
+        for prefix_len in range(len(operations), -1, -1):
+            img = self._get(self._key(source_digest, operations[:prefix_len], proxy_size))
+            if img is not None:
+                start = prefix_len
+                break
+
+        if img is None:
+            img = self._decode(source_path, proxy_size)
+            self._put(self._key(source_digest, [], proxy_size), img)
+
+        if start < len(operations):
+            remaining = [scale_operation(op, scale) if scale < 1 else op for op in operations[start:]]
+            img = apply_operations(img, remaining)
+            # 合并后的操作没有与原始前缀一一对应的中间结果, 只缓存最终结果
+            self._put(self._key(source_digest, operations, proxy_size), img)
+        return img
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._bytes = 0
@@ -1,22 +1,62 @@
-from flask import Blueprint, render_template, request, jsonify, url_for, send_from_directory
+from flask import Blueprint, Response, render_template, request, jsonify, url_for, send_from_directory, send_file
 from werkzeug.utils import secure_filename
 import os
 import uuid
-from PIL import Image, ImageOps
+from PIL import Image, ImageOps, features
 from datetime import datetime
 import io
 import imghdr
 import base64
 import logging
+import json
+import shutil
+import tempfile
 from . import image_converter_bp
+from app.services.janitor import register_file_storage, register_session_storage, touch_file
+from app.services.blob_store import get_blob_store
+from app.services.session_store import create_session_store
+from app.services.chunked_upload import ChunkedUploads, UploadError, register_chunked_upload_routes
+from .edit_engine import EditEngine, DEFAULT_PRESET, ENCODER_PRESETS, PILLOW_FORMATS, result_size, save_image
+from .batch import stream_batch_zip
+from .tiles import Pyramid
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Create upload directory with absolute path
 UPLOAD_FOLDER = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..', 'uploads/image_converter/images'))
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+FILE_TTL = 24 * 3600  # Seconds since last use before the janitor removes an uploaded/edited image
+PREVIEW_SIZE = 1024  # Default longer side of preview images, in pixels
+MAX_PREVIEW_SIZE = 2048
+EXPORT_SPOOL_SIZE = 32 * 1024 * 1024  # Exported images larger than this are buffered on disk instead of in memory
+EXPORT_CHUNK_SIZE = 256 * 1024
+# Uploaded and edited files are UUID-named and never change, so browsers may cache them indefinitely
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# Formats offered to browsers that accept them, in order of preference (if this Pillow build can encode them)
+NEGOTIATED_FORMATS = tuple(f for f in ('avif', 'webp') if features.check(f))
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+register_file_storage('image_converter', UPLOAD_FOLDER, FILE_TTL)
+
+# Batch jobs work in uploads/image_converter/batch/<id>/ (inputs, and chunked uploads under incoming/)
+BATCH_FOLDER = os.path.abspath(os.path.join(UPLOAD_FOLDER, '..', 'batch'))
+os.makedirs(BATCH_FOLDER, exist_ok=True)
+BATCH_TTL = 3600  # Seconds since last use before the janitor removes a batch directory
+CHUNKED_UPLOADS = ChunkedUploads('image_converter', BATCH_FOLDER, ttl=BATCH_TTL)
+register_chunked_upload_routes(image_converter_bp, CHUNKED_UPLOADS)
+# Directories left behind by interrupted batches are removed by the janitor. They are named by
+# batch/session id, not upload id, so they expire by age (chunk uploads touch their directory).
+register_file_storage('image_converter.batch', BATCH_FOLDER, BATCH_TTL)
+
+# Deep Zoom tile pyramids, one directory per image content digest
+TILES_FOLDER = os.path.abspath(os.path.join(UPLOAD_FOLDER, '..', 'tiles'))
+os.makedirs(TILES_FOLDER, exist_ok=True)
+register_file_storage('image_converter.tiles', TILES_FOLDER, FILE_TTL)
+
+# { edited filename: {'source': uploaded filename, 'operations': [...], 'format': output format, 'preset': encoder preset} }
+EDIT_HISTORY = create_session_store('image_converter.edits', ttl=FILE_TTL)
+register_session_storage('image_converter.edits', None, EDIT_HISTORY)
+EDIT_ENGINE = EditEngine()
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -46,7 +86,12 @@ def upload_image():
             unique_filename = f"{uuid.uuid4()}_{filename}"
             filepath = os.path.join(UPLOAD_FOLDER, unique_filename)
             logging.info(f"Saving file to {filepath}")
-            file.save(filepath)
+            # Store the upload content-addressed; identical uploads share one copy on disk
+            blob_store = get_blob_store()
+            digest = blob_store.put_stream(file.stream)
+            if not blob_store.link_into(digest, filepath):
+                file.stream.seek(0)
+                file.save(filepath)
             
             # Get image info
             with Image.open(filepath) as img:
@@ -60,7 +105,9 @@ def upload_image():
                 'width': width,
                 'height': height,
                 'format': format,
-                'url': f"/tools/image_converter/api/images/{unique_filename}"
+                'url': f"/tools/image_converter/api/images/{unique_filename}",
+                'preview_url': f"/tools/image_converter/api/preview/{unique_filename}",
+                'tiles_url': f"/tools/image_converter/api/tiles/{unique_filename}.dzi"
             }
             logging.info(f"Upload successful: {response_data}")
             return jsonify(response_data)
@@ -71,87 +118,323 @@ def upload_image():
     logging.error(f"File type not allowed: {file.filename}")
     return jsonify({'success': False, 'error': 'File type not allowed'}), 400
 
+def materialize(filename):
+    """
+    Returns the path of an uploaded or edited file, or None if it is unknown.
+    Edits made in preview mode are rendered at full resolution on first use.
+    """
+    filepath = os.path.join(UPLOAD_FOLDER, filename)
+    if not os.path.isfile(filepath):
+        lineage = EDIT_HISTORY.get(filename)
+        source_filepath = os.path.join(UPLOAD_FOLDER, lineage['source']) if lineage else None
+        if not (source_filepath and os.path.exists(source_filepath)):
+            return None
+        render_edit(filepath, source_filepath, lineage['operations'], lineage['format'], lineage.get('preset'))
+    touch_file(filepath)
+    return filepath
+
 @image_converter_bp.route('/api/images/<filename>')
 def get_image(filename):
     logging.info(f"Attempting to serve image: {filename} from {UPLOAD_FOLDER}")
-    if not os.path.exists(os.path.join(UPLOAD_FOLDER, filename)):
-        logging.error(f"File not found: {os.path.join(UPLOAD_FOLDER, filename)}")
+    try:
+        filepath = materialize(filename)
+    except Exception as e:
+        logging.exception(f"Error rendering {filename}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    if filepath is None:
+        logging.error(f"File not found: {filename}")
+        return jsonify({'error': 'File not found'}), 404
+
+    digest = get_blob_store().digest_file(filepath)
+    # Only images displayed in a page are transcoded; downloads keep the format the user chose
+    variant = None
+    if NEGOTIATED_FORMATS and request.headers.get('Sec-Fetch-Dest') == 'image':
+        try:
+            variant = negotiate_variant(filepath, digest)
+        except Exception as e:
+            logging.exception(f"Error transcoding {filename}: {str(e)}")
+    if variant:
+        variant_path, variant_format, variant_digest = variant
+        response = send_file(variant_path, mimetype=f"image/{variant_format}", etag=variant_digest,
+                             max_age=IMMUTABLE_MAX_AGE)
+    else:
+        response = send_from_directory(UPLOAD_FOLDER, filename, etag=digest, max_age=IMMUTABLE_MAX_AGE)
+    response.cache_control.immutable = True
+    if NEGOTIATED_FORMATS:
+        response.vary.update(('Accept', 'Sec-Fetch-Dest'))
+    return response
+
+def negotiate_variant(filepath, digest):
+    """
+    Returns (path, format, digest) of a WebP/AVIF variant of a JPEG or PNG
+    file that the client explicitly accepts, or None. Variants are encoded
+    once with the default preset and kept in the derived cache; a variant
+    that is not smaller than the original is never served.
+    """
+    accepted = {value for value, quality in request.accept_mimetypes if quality > 0}
+    candidates = [f for f in NEGOTIATED_FORMATS if f"image/{f}" in accepted]
+    if not candidates:
+        return None
+    with Image.open(filepath) as img:
+        if img.format not in ('JPEG', 'PNG') or getattr(img, 'is_animated', False):
+            return None
+
+    blob_store = get_blob_store()
+    for variant_format in candidates:
+        recipe = "image_converter.variant:" + json.dumps({'format': variant_format, 'preset': DEFAULT_PRESET})
+        cached = blob_store.get_derived(digest, recipe)
+        if cached is None:
+            with Image.open(filepath) as img, tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE) as buffer:
+                save_image(img, buffer, variant_format, DEFAULT_PRESET)
+                if buffer.tell() >= os.path.getsize(filepath):
+                    blob_store.put_derived(digest, recipe, None, {'larger': True})
+                    continue
+                buffer.seek(0)
+                cached = (blob_store.put_stream(buffer), {})
+                blob_store.put_derived(digest, recipe, cached[0], cached[1])
+        if cached[0] is not None:
+            return blob_store.path(cached[0]), variant_format, cached[0]
+    return None
+
+def open_pyramid(filename):
+    """The tile Pyramid of an uploaded or edited image, or None if it is unknown."""
+    filepath = materialize(filename)
+    if filepath is None:
+        return None
+    # Keyed by content, so identical images (and re-uploads) share one pyramid
+    digest = get_blob_store().digest_file(filepath)
+    return Pyramid(filepath, os.path.join(TILES_FOLDER, digest))
+
+@image_converter_bp.route('/api/tiles/<filename>.dzi')
+def get_tile_descriptor(filename):
+    """Deep Zoom descriptor of an image; its tiles are served from <filename>_files/."""
+    try:
+        pyramid = open_pyramid(filename)
+    except Exception as e:
+        logging.exception(f"Error opening {filename}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    if pyramid is None:
         return jsonify({'error': 'File not found'}), 404
-    return send_from_directory(UPLOAD_FOLDER, filename)
+    return Response(pyramid.descriptor(), mimetype='application/xml')
+
+@image_converter_bp.route('/api/tiles/<filename>_files/<int:level>/<int:col>_<int:row>.<tile_format>')
+def get_tile(filename, level, col, row, tile_format):
+    """One 256px tile of the Deep Zoom pyramid; a level is built on the first request for one of its tiles."""
+    try:
+        pyramid = open_pyramid(filename)
+        tile_path = pyramid.tile_path(level, col, row) if pyramid and tile_format == pyramid.format else None
+    except Exception as e:
+        logging.exception(f"Error building tiles of {filename}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    if tile_path is None:
+        return jsonify({'error': 'Tile not found'}), 404
+    # The tile of a given image never changes
+    response = send_file(tile_path, max_age=IMMUTABLE_MAX_AGE)
+    response.cache_control.immutable = True
+    return response
+
+@image_converter_bp.route('/api/preview/<filename>')
+def get_preview(filename):
+    """Serves a downscaled preview of an uploaded or edited image (see EditEngine.render)."""
+    size = min(max(request.args.get('size', PREVIEW_SIZE, type=int), 64), MAX_PREVIEW_SIZE)
+    source_filename, operations, _ = resolve_edit(filename)
+    if source_filename is None:
+        return jsonify({'error': 'File not found'}), 404
+    source_filepath = os.path.join(UPLOAD_FOLDER, source_filename)
+    touch_file(source_filepath)
+    try:
+        source_digest = get_blob_store().digest_file(source_filepath)
+        img = EDIT_ENGINE.render(source_filepath, source_digest, operations, proxy_size=size)
+        buffer = io.BytesIO()
+        if img.mode in ('RGBA', 'LA', 'P'):
+            img.save(buffer, format='PNG', compress_level=1)
+            mimetype = 'image/png'
+        else:
+            img.save(buffer, format='JPEG', quality=80)
+            mimetype = 'image/jpeg'
+    except Exception as e:
+        logging.exception(f"Error rendering preview of {filename}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    buffer.seek(0)
+    return send_file(buffer, mimetype=mimetype, max_age=0)
+
+def resolve_edit(filename):
+    """
+    Returns (source filename, operations, format) for an uploaded or edited
+    file, or (None, None, None) if neither the file nor its source exists.
+    """
+    lineage = EDIT_HISTORY.get(filename)
+    if lineage and os.path.exists(os.path.join(UPLOAD_FOLDER, lineage['source'])):
+        return lineage['source'], lineage['operations'], lineage.get('format')
+    if os.path.exists(os.path.join(UPLOAD_FOLDER, filename)):
+        return filename, [], None
+    return None, None, None
+
+def edit_recipe(operations, output_format, preset):
+    """The derived-cache recipe of an edit (see BlobStore.get_derived)."""
+    return "image_converter.edit:" + json.dumps(
+        {'operations': operations, 'format': output_format, 'preset': preset or DEFAULT_PRESET}, sort_keys=True)
+
+def render_edit(edited_filepath, source_filepath, operations, output_format, preset=None):
+    """Renders operations on the source at full resolution into edited_filepath. Returns (width, height)."""
+    # Identical edits of identical content reuse the cached result without decoding
+    blob_store = get_blob_store()
+    source_digest = blob_store.digest_file(source_filepath)
+    recipe = edit_recipe(operations, output_format, preset)
+    cached = blob_store.get_derived(source_digest, recipe)
+    if cached and blob_store.link_into(cached[0], edited_filepath, replace=True):
+        return cached[1]['width'], cached[1]['height']
+
+    # Reuses the decoded source and intermediate results of earlier edits
+    img = EDIT_ENGINE.render(source_filepath, source_digest, operations)
+
+    # Save using the requested format (to a temporary name first, in case of a concurrent download)
+    tmp_filepath = f"{edited_filepath}.{uuid.uuid4().hex}.tmp"
+    try:
+        save_image(img, tmp_filepath, output_format, preset)
+        os.replace(tmp_filepath, edited_filepath)
+    finally:
+        if os.path.exists(tmp_filepath):
+            os.remove(tmp_filepath)
+    width, height = img.size
+
+    # Deduplicate the result and remember it for identical future edits
+    edited_digest = blob_store.put_file(edited_filepath)
+    blob_store.put_derived(source_digest, recipe, edited_digest, {'width': width, 'height': height})
+    return width, height
+
+def _stream_file(f):
+    try:
+        for chunk in iter(lambda: f.read(EXPORT_CHUNK_SIZE), b''):
+            yield chunk
+    finally:
+        f.close()
+
+def export_edit(edited_filepath, source_filepath, operations, output_format, preset, persist):
+    """
+    Renders an edit at full resolution and returns a response that streams the
+    encoded image, with its dimensions in X-Image-Width/X-Image-Height.
+
+    The image is encoded into a spooled buffer, so nothing touches the disk
+    unless it is larger than EXPORT_SPOOL_SIZE. With persist the encoded bytes
+    are also stored as edited_filepath (and cached for identical edits).
+    """
+    blob_store = get_blob_store()
+    source_digest = blob_store.digest_file(source_filepath)
+    recipe = edit_recipe(operations, output_format, preset)
+
+    buffer = None
+    cached = blob_store.get_derived(source_digest, recipe)
+    if cached:
+        try:
+            buffer = open(blob_store.path(cached[0]), 'rb')
+        except FileNotFoundError:
+            pass  # Blob was just reclaimed; render again
+    if buffer is not None:
+        width, height = cached[1]['width'], cached[1]['height']
+        if persist and not blob_store.link_into(cached[0], edited_filepath, replace=True):
+            # Blob was reclaimed after it was opened; copy from the open file
+            with blob_store.replacing(edited_filepath) as f:
+                shutil.copyfileobj(buffer, f)
+            buffer.seek(0)
+    else:
+        img = EDIT_ENGINE.render(source_filepath, source_digest, operations)
+        width, height = img.size
+        buffer = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE)
+        try:
+            save_image(img, buffer, output_format, preset)
+            if persist:
+                buffer.seek(0)
+                edited_digest = blob_store.put_stream(buffer)
+                if not blob_store.link_into(edited_digest, edited_filepath, replace=True):
+                    buffer.seek(0)
+                    with blob_store.replacing(edited_filepath) as f:
+                        shutil.copyfileobj(buffer, f)
+                blob_store.put_derived(source_digest, recipe, edited_digest, {'width': width, 'height': height})
+        except BaseException:
+            buffer.close()
+            raise
+
+    size = buffer.seek(0, os.SEEK_END)
+    buffer.seek(0)
+    edited_filename = os.path.basename(edited_filepath)
+    extension = 'jpg' if output_format == 'jpeg' else output_format
+    headers = {
+        'Content-Length': str(size),
+        'Content-Disposition': f'inline; filename="{os.path.splitext(edited_filename)[0]}.{extension}"',
+        'X-Image-Width': str(width),
+        'X-Image-Height': str(height),
+        'X-Image-Format': output_format,
+    }
+    if persist:
+        headers['X-Image-Filename'] = edited_filename
+        headers['X-Image-Url'] = f"/tools/image_converter/api/images/{edited_filename}"
+    mimetype = f"image/{PILLOW_FORMATS.get(output_format, 'JPEG').lower()}"
+    return Response(_stream_file(buffer), mimetype=mimetype, headers=headers, direct_passthrough=True)
 
 @image_converter_bp.route('/api/edit', methods=['POST'])
 def edit_image():
-    data = request.json
+    data = request.get_json(silent=True) or {}
     filename = data.get('filename')
     operations = data.get('operations', [])
     output_format = data.get('format', 'jpeg').lower()
+    # Preview mode only records the edit; the full-resolution file is rendered on download
+    preview = bool(data.get('preview'))
+    # Export mode responds with the encoded image itself instead of JSON; persisting it is optional
+    export = bool(data.get('export'))
+    persist = bool(data.get('persist', not export))
+    # Encoder speed/size trade-off: 'fast', 'balanced' or 'smallest'
+    preset = data.get('preset')
+    if not isinstance(preset, str) or preset not in ENCODER_PRESETS:
+        preset = DEFAULT_PRESET
     
     if not filename:
         return jsonify({'success': False, 'error': 'No filename provided'}), 400
+    if not isinstance(operations, list) or not all(isinstance(op, dict) for op in operations):
+        return jsonify({'success': False, 'error': 'Invalid operations'}), 400
     
-    filepath = os.path.join(UPLOAD_FOLDER, filename)
-    
-    if not os.path.exists(filepath):
+    # Edits are always rendered from the pristine upload: an edited file is
+    # resolved to its source plus the operations that produced it, and the new
+    # operations are appended (no generational loss from re-encoding)
+    source_filename, previous_operations, _ = resolve_edit(filename)
+    if source_filename is None:
         return jsonify({'success': False, 'error': 'File not found'}), 404
+    source_filepath = os.path.join(UPLOAD_FOLDER, source_filename)
+    touch_file(source_filepath)
     
+    # Make sure the output format is valid
+    if output_format not in ALLOWED_EXTENSIONS:
+        output_format = 'jpeg'
+
+    # Extract the original filename without any previous 'edited_' prefixes
+    original_filename = filename
+    # Remove any existing "edited_UUID_" prefixes
+    while original_filename.startswith("edited_"):
+        # Find the second underscore (after the UUID)
+        second_underscore = original_filename.find("_", 7)
+        if second_underscore > 0:
+            original_filename = original_filename[second_underscore+1:]
+        else:
+            break
+
+    # Create a new clean filename
+    edited_filename = f"edited_{uuid.uuid4()}_{original_filename}"
+    edited_filepath = os.path.join(UPLOAD_FOLDER, edited_filename)
+
     try:
-        img = Image.open(filepath)
-        
-        for op in operations:
-            op_type = op.get('type')
-            
-            if op_type == 'resize':
-                width = op.get('width')
-                height = op.get('height')
-                if width and height:
-                    img = img.resize((int(width), int(height)), Image.LANCZOS)
-            
-            elif op_type == 'crop':
-                left = op.get('left', 0)
-                top = op.get('top', 0)
-                right = op.get('right', img.width)
-                bottom = op.get('bottom', img.height)
-                img = img.crop((int(left), int(top), int(right), int(bottom)))
-            
-            elif op_type == 'rotate':
-                angle = op.get('angle', 0)
-                img = img.rotate(float(angle), expand=True)
-            
-            elif op_type == 'flip':
-                direction = op.get('direction', 'horizontal')
-                if direction == 'horizontal':
-                    img = ImageOps.mirror(img)
-                elif direction == 'vertical':
-                    img = ImageOps.flip(img)
-            
-            elif op_type == 'grayscale':
-                img = ImageOps.grayscale(img)
-        
-        # Extract the original filename without any previous 'edited_' prefixes
-        original_filename = filename
-        # Remove any existing "edited_UUID_" prefixes
-        while original_filename.startswith("edited_"):
-            # Find the second underscore (after the UUID)
-            second_underscore = original_filename.find("_", 7)
-            if second_underscore > 0:
-                original_filename = original_filename[second_underscore+1:]
-            else:
-                break
-                
-        # Create a new clean filename
-        edited_filename = f"edited_{uuid.uuid4()}_{original_filename}"
-        edited_filepath = os.path.join(UPLOAD_FOLDER, edited_filename)
-        
-        # Make sure the output format is valid
-        if output_format not in ALLOWED_EXTENSIONS:
-            output_format = 'jpeg'
-        
-        # Save using the requested format
-        img.save(edited_filepath, format=output_format.upper())
-        
-        # Get image info for the edited image
-        with Image.open(edited_filepath) as edited_img:
-            width, height = edited_img.size
+        operations = previous_operations + operations
+        if export:
+            response = export_edit(edited_filepath, source_filepath, operations, output_format, preset, persist)
+            if persist:
+                EDIT_HISTORY.set(edited_filename, {'source': source_filename, 'operations': operations, 'format': output_format, 'preset': preset})
+            return response
+        if preview:
+            with Image.open(source_filepath) as source_img:
+                width, height = result_size(source_img.size, operations)
+        else:
+            width, height = render_edit(edited_filepath, source_filepath, operations, output_format, preset)
+
+        EDIT_HISTORY.set(edited_filename, {'source': source_filename, 'operations': operations, 'format': output_format, 'preset': preset})
         
         return jsonify({
             'success': True,
@@ -159,8 +442,79 @@ def edit_image():
             'width': width,
             'height': height,
             'format': output_format,
-            'url': f"/tools/image_converter/api/images/{edited_filename}"
+            'preset': preset,
+            'url': f"/tools/image_converter/api/images/{edited_filename}",
+            'preview_url': f"/tools/image_converter/api/preview/{edited_filename}",
+            'tiles_url': f"/tools/image_converter/api/tiles/{edited_filename}.dzi"
         })
     
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@image_converter_bp.route('/api/batch', methods=['POST'])
+def batch_edit():
+    """
+    Applies one operation list and output format to many images and responds
+    with a ZIP archive that is streamed as the images finish processing.
+
+    Accepts multipart form data ('images', 'operations' as a JSON string,
+    'format', 'preset') or, for files sent with the chunked upload API, JSON
+    {'session_id', 'upload_ids', 'operations', 'format', 'preset'}.
+    """
+    if request.is_json:
+        data = request.get_json(silent=True) or {}
+        try:
+            items = CHUNKED_UPLOADS.completed_files(data.get('session_id'), data.get('upload_ids'))
+        except UploadError as e:
+            return e.to_response()
+        session_id, upload_ids = data['session_id'], data['upload_ids']
+        work_dir = os.path.join(BATCH_FOLDER, session_id)
+        operations = data.get('operations', [])
+        output_format = str(data.get('format', 'jpeg')).lower()
+        preset = data.get('preset')
+
+        def cleanup():
+            CHUNKED_UPLOADS.finish(session_id, upload_ids)
+            shutil.rmtree(work_dir, ignore_errors=True)
+    else:
+        files = [f for f in request.files.getlist('images') if f.filename]
+        if not files:
+            return jsonify({'success': False, 'error': 'No files provided'}), 400
+        try:
+            operations = json.loads(request.form.get('operations') or '[]')
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Invalid operations'}), 400
+        output_format = request.form.get('format', 'jpeg').lower()
+        preset = request.form.get('preset')
+
+        work_dir = os.path.join(BATCH_FOLDER, str(uuid.uuid4()))
+        os.makedirs(work_dir)
+        items = []
+        for i, f in enumerate(files):
+            source_path = os.path.join(work_dir, f"input_{i}")
+            f.save(source_path)
+            items.append((secure_filename(f.filename) or f"image_{i}", source_path))
+
+        def cleanup():
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    not_allowed = [name for name, _ in items if not allowed_file(name)]
+    if not_allowed or not isinstance(operations, list):
+        cleanup()
+        error = f"File type not allowed: {', '.join(not_allowed)}" if not_allowed else 'Invalid operations'
+        return jsonify({'success': False, 'error': error}), 400
+    if output_format not in ALLOWED_EXTENSIONS:
+        output_format = 'jpeg'
+    if not isinstance(preset, str) or preset not in ENCODER_PRESETS:
+        preset = DEFAULT_PRESET
+
+    logging.info(f"Batch of {len(items)} images: {len(operations)} operations, format {output_format}")
+
+    def generate():
+        try:
+            yield from stream_batch_zip(items, work_dir, operations, output_format, preset)
+        finally:
+            cleanup()
+
+    return Response(generate(), mimetype='application/zip',
+                    headers={'Content-Disposition': 'attachment; filename=images.zip'})
@@ -204,7 +204,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
             if (data.success) {
                 currentImage = data; // Store image data
-                showImage(data.url); // Display the uploaded image
+                showImage(data.preview_url || data.url); // Display a downscaled preview of the uploaded image
                 updateImageInfo(data); // Show image details
                 toggleOperationButtons(true); // Enable editing buttons
             } else {
@@ -322,7 +322,8 @@ document.addEventListener('DOMContentLoaded', () => {
                 body: JSON.stringify({
                     filename: currentImage.filename, // Send current filename to identify image
                     operations: operations,
-                    format: format || currentImage.format // Target format
+                    format: format || currentImage.format, // Target format
+                    preview: true // Full resolution is rendered only when the image is downloaded
                 })
             });
 
@@ -339,8 +340,8 @@ document.addEventListener('DOMContentLoaded', () => {
 
             if (data.success) {
                 currentImage = data; // Update state with new image data
-                // Add cache-busting query parameter to force image reload
-                showImage(data.url + '?t=' + new Date().getTime());
+                // Show the fast low-resolution preview; data.url renders full resolution on download
+                showImage(data.preview_url);
                 updateImageInfo(data); // Update displayed info
 
                 document.getElementById('download-btn').classList.remove('hidden');
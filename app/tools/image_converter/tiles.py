@@ -0,0 +1,132 @@
+import os
+import math
+import uuid
+import shutil
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: 只在单进程下运行, 线程锁即可
+    fcntl = None
+
+from PIL import Image
+
+from app.services.janitor import touch_file
+from .edit_engine import REDUCING_GAP
+
+TILE_SIZE = 256
+TILE_OVERLAP = 1
+TILE_QUALITY = 85
+
+_thread_lock = threading.Lock()
+
+
+@contextmanager
+def _exclusive(lock_path):
+    # 多个 worker 同时请求同一层级的瓦片时只构建一次
+    if fcntl is None:
+        with _thread_lock:
+            yield
+        return
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+def tile_format(img):
+    """'png' for images with transparency, otherwise 'jpg'."""
+    if img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info):
+        return 'png'
+    return 'jpg'
+
+
+class Pyramid:
+    """
+    Deep Zoom (DZI) tile pyramid of one image.
+
+    Level 0 is 1x1 pixel and the top level is the full-resolution image; each
+    level is half the size of the one above it and is cut into TILE_SIZE
+    tiles that overlap their neighbours by TILE_OVERLAP pixels. A level is
+    built the first time one of its tiles is requested and cached as files
+    under directory/<level>/<col>_<row>.<format>.
+    """
+
+    def __init__(self, source_path, directory):
+        self.source_path = source_path
+        self.directory = directory
+        with Image.open(source_path) as img:
+            self.width, self.height = img.size
+            self.format = tile_format(img)
+        self.max_level = math.ceil(math.log2(max(self.width, self.height, 1)))
+
+    def level_size(self, level):
+        scale = 2 ** (self.max_level - level)
+        return max(1, math.ceil(self.width / scale)), max(1, math.ceil(self.height / scale))
+
+    def descriptor(self):
+        """The .dzi XML document describing the pyramid."""
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" TileSize="{TILE_SIZE}" '
+            f'Overlap="{TILE_OVERLAP}" Format="{self.format}">'
+            f'<Size Width="{self.width}" Height="{self.height}"/></Image>\n'
+        )
+
+    def tile_path(self, level, col, row):
+        """Path of a tile, building its level first if needed. None if the tile is out of range."""
+        if not 0 <= level <= self.max_level:
+            return None
+        width, height = self.level_size(level)
+        if not (0 <= col < math.ceil(width / TILE_SIZE) and 0 <= row < math.ceil(height / TILE_SIZE)):
+            return None
+        level_dir = os.path.join(self.directory, str(level))
+        if not os.path.isdir(level_dir):
+            self._build_level(level, level_dir)
+        touch_file(self.directory)
+        return os.path.join(level_dir, f"{col}_{row}.{self.format}")
+
+    def _decode(self, size):
+        img = Image.open(self.source_path)
+        if img.size != size:
+            # JPEG 可以在解码时直接按 1/2~1/8 缩小, 低层级不必解码全尺寸
+            img.draft(img.mode, size)
+            img = img.resize(size, Image.LANCZOS, reducing_gap=REDUCING_GAP)
+        img.load()
+        if self.format == 'jpg' and img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        elif self.format == 'png' and img.mode not in ('RGBA', 'LA'):
+            img = img.convert('RGBA')
+        return img
+
+    def _build_level(self, level, level_dir):
+        os.makedirs(self.directory, exist_ok=True)
+        with _exclusive(f"{level_dir}.lock"):
+            if os.path.isdir(level_dir):
+                return  # 等锁期间已由其他请求构建
+            width, height = self.level_size(level)
+            img = self._decode((width, height))
+
+            # 先写到临时目录, 整层完成后再改名, 读取方不会看到不完整的层级
+            tmp_dir = f"{level_dir}.{uuid.uuid4().hex}.tmp"
+            os.makedirs(tmp_dir)
+            try:
+                for row in range(math.ceil(height / TILE_SIZE)):
+                    for col in range(math.ceil(width / TILE_SIZE)):
+                        box = (max(0, col * TILE_SIZE - TILE_OVERLAP),
+                               max(0, row * TILE_SIZE - TILE_OVERLAP),
+                               min(width, (col + 1) * TILE_SIZE + TILE_OVERLAP),
+                               min(height, (row + 1) * TILE_SIZE + TILE_OVERLAP))
+                        tile_path = os.path.join(tmp_dir, f"{col}_{row}.{self.format}")
+                        if self.format == 'jpg':
+                            img.crop(box).save(tile_path, format='JPEG', quality=TILE_QUALITY)
+                        else:
+                            img.crop(box).save(tile_path, format='PNG')
+                os.rename(tmp_dir, level_dir)
+            except BaseException:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                raise
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+Per-image normalization for img2pdf: downscale to MAX_DIMENSION and convert
+to a format/mode that img2pdf can embed. Runs in a process pool (see
+routes.upload_image), so it only takes and returns picklable values.
+
+JPEGs that need no transform are copied byte for byte: img2pdf embeds the
+JPEG stream as-is, so re-encoding would only cost CPU and quality.
+"""
+import shutil
+import logging
+from PIL import Image
+import pillow_heif
+
+# --- Register the HEIF opener with Pillow ---
+# Depth maps and auxiliary images (e.g. iPhone portrait mattes) never end up in the
+# PDF, so they are not read at all; thumbnails are kept for draft() (see below).
+# libheif has no option to skip the alpha plane of the primary image; it is decoded
+# and flattened like any other transparency.
+try:
+    pillow_heif.register_heif_opener(thumbnails=True, depth_images=False, aux_images=False)
+    logging.info("Successfully registered HEIF opener.")
+except Exception as e:
+    # Log the error, but allow the app to continue if HEIF isn't strictly required
+    # or if pillow-heif might not be installed everywhere.
+    logging.error(f"Failed to register HEIF opener: {e}. HEIC/HEIF support may be unavailable.", exc_info=True)
+
+try:
+    from pillow_heif import HeifError
+except ImportError:
+    # Newer pillow_heif versions raise standard exceptions instead
+    class HeifError(Exception):
+        pass
+
+logger = logging.getLogger(__name__)
+
+MAX_DIMENSION = 2048 # Maximum width or height allowed for resizing
+REDUCING_GAP = 3.0 # Let resize() shrink by an integer factor with reduce() before resampling
+COMMON_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp']
+PASSTHROUGH_MODES = ('RGB', 'L', 'CMYK') # JPEG modes img2pdf embeds without conversion
+DRAFT_FORMATS = ('JPEG', 'HEIF') # Formats whose decoders can produce a smaller image directly
+
+
+def _scaled_size(width, height):
+    """(width, height) scaled down to fit MAX_DIMENSION, or None if it already fits."""
+    max_dim = max(width, height)
+    if max_dim <= MAX_DIMENSION:
+        return None
+    scale_factor = MAX_DIMENSION / max_dim
+    return int(width * scale_factor), int(height * scale_factor)
+
+
+def configure_heif(decode_threads):
+    """
+    Sets how many threads libheif may use to decode a HEIC/HEIF image. This is
+    a process-wide setting: call it once per process (a pool initializer, or
+    at import in a web worker), never per image.
+    """
+    pillow_heif.options.DECODE_THREADS = max(1, decode_threads)
+
+
+def normalize_image(source_path, dest_base, safe_ext, log_prefix):
+    """
+    Normalizes the image at source_path and saves it as dest_base + extension.
+
+    Returns {'path', 'ext', 'width', 'height'} of the saved file.
+    """
+    img_object = None # Pillow Image object for the original uploaded image
+    img_to_save = None # Pillow Image object for the final version to be saved (potentially resized/converted)
+    try:
+        # --- Open image using Pillow (reads the header only) ---
+        img_object = Image.open(source_path)
+
+        original_width, original_height = img_object.size
+        original_mode = img_object.mode
+        detected_format = img_object.format # Format detected by Pillow
+        logger.info(f"{log_prefix} Opened. Original Size: {original_width}x{original_height}, Mode: {original_mode}, Detected Format: {detected_format}")
+
+        new_size = _scaled_size(original_width, original_height)
+
+        # --- Fast path: a JPEG that needs no transform keeps its original bytes ---
+        if new_size is None and detected_format == 'JPEG' and original_mode in PASSTHROUGH_MODES \
+                and safe_ext in COMMON_EXTENSIONS:
+            # Decoding at 1/8 scale still reads the whole entropy-coded stream, so
+            # truncated or corrupted files are rejected here as before
+            img_object.draft(original_mode, (max(1, original_width // 8), max(1, original_height // 8)))
+            img_object.load()
+            final_save_path = f"{dest_base}{safe_ext}"
+            logger.info(f"{log_prefix} JPEG needs no changes. Copying original bytes to {final_save_path}")
+            shutil.copyfile(source_path, final_save_path)
+            return {'path': final_save_path, 'ext': safe_ext, 'width': original_width, 'height': original_height}
+
+        if new_size and detected_format in DRAFT_FORMATS:
+            # JPEG: decode at 1/2, 1/4 or 1/8 scale; HEIF: decode an embedded thumbnail
+            # instead of the full image if one is large enough. Neither goes below new_size.
+            img_object.draft(original_mode, new_size)
+            logger.info(f"{log_prefix} Draft decoding at {img_object.size[0]}x{img_object.size[1]}")
+
+        # Load image data into memory. This can catch some corrupted files early.
+        img_object.load()
+
+        # Start with the loaded image object as the one to potentially save
+        img_to_save = img_object
+
+        # --- Resizing Logic ---
+        if new_size:
+            current_width, current_height = img_to_save.size
+            new_width, new_height = new_size
+            logger.info(f"{log_prefix} Resizing from {current_width}x{current_height} to {new_width}x{new_height}")
+
+            resized_img = img_to_save.resize((new_width, new_height), Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP)
+
+            # Close the previous image object if a new one was created by resize
+            if img_to_save is not resized_img:
+                img_to_save.close()
+
+            img_to_save = resized_img # Update reference to the resized image
+            logger.info(f"{log_prefix} Resized successfully.")
+        else:
+            logger.info(f"{log_prefix} No resizing needed (dimensions within limit).")
+
+        # --- Determine Target Format and Handle Mode Conversions ---
+        current_mode = img_to_save.mode # Mode of the (potentially resized) image
+        target_format = None # Target format for saving (e.g., 'JPEG', 'PNG')
+        final_ext_override = None # Use this if conversion changes the file extension
+
+        # 1. Handle HEIC/HEIF: Convert to JPEG for wider compatibility in PDFs
+        if detected_format in ['HEIF', 'HEIC']:
+            logger.info(f"{log_prefix} Detected HEIC/HEIF. Planning conversion to JPEG.")
+            target_format = 'JPEG'
+            final_ext_override = ".jpg"
+        # 2. Handle Uncommon Extensions: Convert to PNG as a safe, widely supported format
+        elif safe_ext not in COMMON_EXTENSIONS:
+            logger.warning(f"{log_prefix} Original file has uncommon extension '{safe_ext}'. Planning conversion to PNG.")
+            target_format = 'PNG'
+            final_ext_override = ".png"
+        # 3. Keep the original common format unless mode dictates otherwise
+        else:
+            if detected_format and detected_format.upper() in ['JPEG', 'PNG', 'GIF', 'BMP', 'TIFF', 'WEBP']:
+                target_format = detected_format.upper()
+            elif safe_ext in ['.jpg', '.jpeg']:
+                target_format = 'JPEG'
+            elif safe_ext == '.png':
+                target_format = 'PNG'
+            else:
+                logger.warning(f"{log_prefix} Could not determine reliable target format from detected='{detected_format}', ext='{safe_ext}'. Defaulting to PNG.")
+                target_format = 'PNG'
+                final_ext_override = ".png" # Ensure extension matches if defaulting
+
+        # --- Perform Mode Conversion if Required ---
+        # Conversion is needed if:
+        # a) Target format is JPEG and source has transparency (RGBA, LA, P with transparency).
+        # b) Target format requires a specific mode (like RGB) and source is different.
+        # c) We explicitly decided to convert (e.g., HEIC -> JPEG).
+        needs_flattening = target_format == 'JPEG' and current_mode in ('RGBA', 'LA', 'P')
+        # Check if conversion to RGB is needed (excluding cases already handled by flattening)
+        needs_rgb_conversion = not needs_flattening and \
+                               ((target_format == 'JPEG' and current_mode not in ('RGB', 'L', 'CMYK')) or \
+                                (target_format == 'BMP' and current_mode not in ('RGB', 'L', 'P', 'RGBA')) or \
+                                (final_ext_override and current_mode not in ('RGB', 'L', 'RGBA', 'LA', 'P'))) # If changing format, ensure basic compatibility
+
+        if needs_flattening:
+            # Flatten image with transparency onto a white background for JPEG
+            logger.info(f"{log_prefix} Flattening mode '{current_mode}' onto white background for {target_format} saving.")
+            try:
+                bg = Image.new("RGB", img_to_save.size, (255, 255, 255))
+                # Paste the image onto the background. Pillow's paste handles the alpha mask correctly.
+                bg.paste(img_to_save, (0, 0), img_to_save)
+                img_to_save.close()
+                img_to_save = bg
+            except Exception as flatten_err:
+                # Fallback: Simple conversion to RGB (might use black background for transparency)
+                logger.warning(f"{log_prefix} Error during flattening: {flatten_err}. Falling back to convert('RGB').")
+                converted_img = img_to_save.convert('RGB')
+                img_to_save.close()
+                img_to_save = converted_img
+
+        elif needs_rgb_conversion:
+            # Convert modes like CMYK, YCbCr, etc., to RGB if necessary for the target format
+            logger.info(f"{log_prefix} Converting mode '{current_mode}' to RGB for {target_format or 'saving'}.")
+            converted_img = img_to_save.convert('RGB')
+            img_to_save.close()
+            img_to_save = converted_img
+
+        # --- Determine Final Save Path and Options ---
+        final_extension = final_ext_override if final_ext_override else safe_ext
+        # Ensure there's a valid extension, default to .png if missing or problematic
+        if not final_extension or final_extension == '.':
+            final_extension = ".png"
+            target_format = 'PNG' # Make sure format matches extension
+            logger.warning(f"{log_prefix} No valid extension found, defaulting to '.png' and PNG format.")
+
+        final_save_path = f"{dest_base}{final_extension}"
+
+        # Prepare options for Pillow's save method
+        save_options = {}
+        if target_format:
+            save_options['format'] = target_format.upper()
+        if save_options.get('format') == 'JPEG':
+            save_options['quality'] = 90 # Good balance of quality and size
+
+        logger.info(f"{log_prefix} Saving mode {img_to_save.mode} (was {original_mode}) to {final_save_path} with {save_options}")
+        img_to_save.save(final_save_path, **save_options)
+
+        final_width, final_height = img_to_save.size
+        return {'path': final_save_path, 'ext': final_extension, 'width': final_width, 'height': final_height}
+    finally:
+        # --- Ensure Pillow image objects are closed ---
+        if img_to_save:
+            img_to_save.close()
+        if img_object and img_object is not img_to_save:
+            img_object.close()
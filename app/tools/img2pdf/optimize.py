@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Fits img2pdf output into a byte budget (generate's target_bytes option).
+
+The budget is shared out over the images in proportion to their pixel
+counts, with at least MIN_IMAGE_BYTES per image. Images whose files already
+fit their share are used as-is and what they leave unused is shared among
+the others. Those are handled one at a time, so only one decoded image is
+in memory: each is decoded once and re-encoded as JPEG from those pixels,
+bisecting on quality and, if even MIN_QUALITY is too large, downscaling.
+Whatever an image leaves unused is passed on to the images after it.
+write_to_budget() then checks the size of the written PDF and fits again
+if it is still over the target.
+"""
+import io
+import os
+import logging
+from PIL import Image
+
+from .pdf_writer import write_pdf
+
+logger = logging.getLogger(__name__)
+
+MAX_QUALITY = 90 # Same quality as normalize_image's JPEG output
+MIN_QUALITY = 30 # Below this JPEG artifacts get worse faster than the size drops, so downscale instead
+MIN_DIMENSION = 256 # Never downscale an image's longer side below this
+PDF_OVERHEAD = 1024 # Header, page tree, xref table and trailer
+PAGE_OVERHEAD = 600 # Page dictionary, content stream and image dictionary per image
+MIN_IMAGE_BYTES = 1024 # Smallest share of a re-encoded image: JPEG headers (quantization/Huffman tables) alone take ~300-600 bytes
+MAX_CORRECTIONS = 2 # Extra passes when the written PDF turns out over the target
+
+
+def _encode(img, quality):
+    buf = io.BytesIO()
+    img.save(buf, format='JPEG', quality=quality, optimize=True)
+    return buf.getvalue()
+
+
+def _fit_quality(img, budget):
+    """Highest quality in [MIN_QUALITY, MAX_QUALITY] whose JPEG fits budget: (data, passes), or (None, passes)."""
+    passes = 0
+    best = None
+    low, high = MIN_QUALITY, MAX_QUALITY
+    while low <= high:
+        quality = (low + high) // 2
+        data = _encode(img, quality)
+        passes += 1
+        if len(data) <= budget:
+            best = data
+            low = quality + 1
+        else:
+            high = quality - 1
+    return best, passes
+
+
+def _decode_for_jpeg(path):
+    img = Image.open(path)
+    img.load()
+    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+        # Flatten transparency onto white, as normalize_image does for JPEG output
+        rgba = img.convert('RGBA')
+        bg = Image.new('RGB', img.size, (255, 255, 255))
+        bg.paste(rgba, (0, 0), rgba)
+        return bg
+    if img.mode not in ('RGB', 'L'):
+        return img.convert('RGB')
+    return img
+
+
+def _shrink(path, budget, log_prefix):
+    """Re-encodes one image to fit budget. Returns (jpeg bytes, passes); the smallest attempt if nothing fits."""
+    img = _decode_for_jpeg(path)
+    scaled = img
+    passes = 0
+    while True:
+        data, n = _fit_quality(scaled, budget)
+        passes += n
+        if data is not None:
+            return data, passes
+        smallest = _encode(scaled, MIN_QUALITY)
+        passes += 1
+        if max(scaled.size) <= MIN_DIMENSION:
+            logger.warning(f"{log_prefix} Cannot fit {os.path.basename(path)} into {budget} bytes; using {len(smallest)} bytes.")
+            return smallest, passes
+        # JPEG size grows roughly with the pixel count; aim a little below the budget
+        factor = min(0.9, 0.95 * (budget / len(smallest)) ** 0.5)
+        factor = max(factor, MIN_DIMENSION / max(scaled.size))
+        size = (max(1, int(scaled.width * factor)), max(1, int(scaled.height * factor)))
+        # Always resample from the decoded pixels, not from the previous attempt
+        scaled = img.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+
+def _share(budget, pixels, indices, i):
+    """Image i's share of budget among the images in indices: MIN_IMAGE_BYTES each (if the budget allows), the rest by pixel count."""
+    floor = min(MIN_IMAGE_BYTES, budget // max(1, len(indices)))
+    spare = max(0, budget - floor * len(indices))
+    return max(1, floor + spare * pixels[i] // max(1, sum(pixels[j] for j in indices)))
+
+
+def _kept(sizes, pixels, budget):
+    """
+    Indices of the images whose files are used as-is: those that fit their share.
+    Their unused share goes back to the others, which may let more images fit,
+    so this repeats until nothing changes.
+    """
+    kept = set()
+    while True:
+        todo = [i for i in range(len(sizes)) if i not in kept]
+        remaining = budget - sum(sizes[i] for i in kept)
+        fits = [i for i in todo if sizes[i] <= _share(remaining, pixels, todo, i)]
+        if not fits:
+            return kept
+        kept.update(fits)
+
+
+def fit_to_budget(image_paths, target_bytes, work_dir, progress=None, log_prefix=''):
+    """
+    Returns image paths (in the same order) whose PDF should come out at
+    most target_bytes: originals that fit, or JPEGs re-encoded into work_dir.
+    progress(done, total), if given, is called after each image.
+
+    Returns (paths, estimated PDF size).
+    """
+    pixels = []
+    for path in image_paths:
+        with Image.open(path) as img:
+            pixels.append(img.width * img.height)
+    sizes = [os.path.getsize(path) for path in image_paths]
+
+    overhead = PDF_OVERHEAD + PAGE_OVERHEAD * len(image_paths)
+    kept = _kept(sizes, pixels, target_bytes - overhead)
+    # Images to re-encode share what the kept ones leave; each one's savings go to those after it
+    todo = [i for i in range(len(image_paths)) if i not in kept]
+    remaining_budget = target_bytes - overhead - sum(sizes[i] for i in kept)
+
+    fitted = list(image_paths)
+    total_passes = 0
+    for k, i in enumerate(todo):
+        budget = _share(remaining_budget, pixels, todo[k:], i)
+        data, passes = _shrink(image_paths[i], budget, log_prefix)
+        total_passes += passes
+        fitted[i] = os.path.join(work_dir, f"{i:05d}.jpg")
+        with open(fitted[i], 'wb') as f:
+            f.write(data)
+        sizes[i] = len(data)
+        remaining_budget -= len(data)
+        if progress:
+            progress(k + 1, len(todo))
+    if progress and not todo:
+        progress(1, 1)
+
+    estimate = overhead + sum(sizes)
+    logger.info(f"{log_prefix} Fitted {len(image_paths)} images ({len(kept)} kept as-is) into ~{estimate} bytes "
+                f"(target {target_bytes}) with {total_passes} encode passes.")
+    return fitted, estimate
+
+
+def write_to_budget(image_paths, target_bytes, outputstream, work_dir, progress=None, log_prefix=''):
+    """
+    Fits the images into target_bytes (fit_to_budget) and writes the PDF to
+    outputstream (write_pdf), which must be seekable and empty. If the written
+    PDF is still over the target (fit_to_budget only estimates the PDF
+    overhead), the images are fitted again into a budget lowered by the
+    overshoot, up to MAX_CORRECTIONS times. Returns the size of the PDF.
+
+    progress(done, total) counts the fitting and writing of the first pass;
+    corrective passes do not report progress.
+    """
+    budget = target_bytes
+    size = None
+    for attempt in range(MAX_CORRECTIONS + 1):
+        attempt_dir = os.path.join(work_dir, str(attempt))
+        os.makedirs(attempt_dir, exist_ok=True)
+        fit_progress = write_progress = None
+        if progress and attempt == 0:
+            fit_progress = lambda done, total: progress(done, 2 * total)
+            write_progress = lambda done, total: progress(total + done, 2 * total)
+        fitted, _ = fit_to_budget(image_paths, budget, attempt_dir, fit_progress, log_prefix)
+
+        outputstream.seek(0)
+        outputstream.truncate()
+        previous_size, size = size, write_pdf(fitted, outputstream, write_progress)
+        if size <= target_bytes or (previous_size is not None and size >= previous_size):
+            break # On target, or the images cannot get any smaller
+        budget -= size - target_bytes
+        logger.info(f"{log_prefix} PDF is {size} bytes, over the {target_bytes} byte target; fitting again into {budget} bytes.")
+    return size
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental PDF output for img2pdf.
+
+img2pdf.convert() keeps every embedded image in memory until the whole
+document has been serialized. write_pdf() produces the same document one
+image at a time: each image is converted with img2pdf's internal engine,
+its objects are renumbered and written to the output straight away, and
+only the page references are kept for the page tree written at the end.
+Peak memory is therefore that of the largest single image, not of the PDF.
+"""
+import logging
+
+import img2pdf
+
+logger = logging.getLogger(__name__)
+
+
+def _header(version):
+    # Same header as img2pdf's own writer; "%PDF-1.x" has a fixed length, so it can be patched in place
+    return ("%%PDF-%s\n" % version).encode("ascii") + b"%\xe2\xe3\xcf\xd3\n"
+
+
+def write_pdf(image_paths, outputstream, progress=None):
+    """
+    Writes a PDF with one page per image (per frame for multi-frame images)
+    to outputstream, in the order of image_paths. Returns the number of bytes
+    written. outputstream must be seekable: the header is rewritten at the end
+    if an image needs a newer PDF version.
+
+    progress(done, total), if given, is called after each image.
+    """
+    # The document shell provides the info dictionary, catalog and page tree (objects 1-3), written last
+    shell = img2pdf.pdfdoc(img2pdf.Engine.internal)
+    pages = shell.writer.pages
+    version = shell.output_version
+
+    header = _header(version)
+    outputstream.write(header)
+    pos = len(header)
+    offsets = {} # object number -> byte offset, for the xref table
+    next_id = len(shell.writer.objects) + 1
+
+    for i, path in enumerate(image_paths):
+        doc = img2pdf.convert_to_docobject(path, engine=img2pdf.Engine.internal)
+        version = max(version, doc.output_version) # SMasks and UserUnit raise the required version
+
+        # Move the image's objects into the output document
+        own = {id(doc.writer.docinfo), id(doc.writer.catalog), id(doc.writer.pages)}
+        objects = [obj for obj in doc.writer.objects if id(obj) not in own]
+        for obj in objects:
+            obj.identifier = next_id
+            next_id += 1
+        for page in doc.writer.pagearray:
+            page[b"/Parent"] = pages
+            # Keep only a reference so the image data can be released once written
+            pages.content[b"/Kids"].append(img2pdf.MyPdfObject("%d 0 R" % page.identifier))
+            pages.content[b"/Count"] += 1
+
+        for obj in objects:
+            data = obj.tostring()
+            offsets[obj.identifier] = pos
+            outputstream.write(data)
+            pos += len(data)
+        del doc, objects
+        if progress:
+            progress(i + 1, len(image_paths))
+
+    if not pages.content[b"/Count"]:
+        raise ValueError("Unable to process empty list")
+
+    for obj in shell.writer.objects:
+        data = obj.tostring()
+        offsets[obj.identifier] = pos
+        outputstream.write(data)
+        pos += len(data)
+
+    # Cross-reference table and trailer, as in img2pdf.MyPdfWriter.tostream
+    trailer = {b"/Size": next_id, b"/Info": shell.writer.docinfo, b"/Root": shell.writer.catalog}
+    data = (b"xref\n" + ("0 %d\n" % next_id).encode() + b"0000000000 65535 f \n"
+            + b"".join(("%010d 00000 n \n" % offsets[identifier]).encode() for identifier in range(1, next_id))
+            + b"trailer\n" + img2pdf.parse(trailer) + b"\n"
+            + ("startxref\n%d\n" % pos).encode() + b"%%EOF\n")
+    outputstream.write(data)
+    pos += len(data)
+
+    if version != shell.output_version:
+        outputstream.seek(0)
+        outputstream.write(_header(version))
+        outputstream.seek(pos)
+    return pos
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
-from flask import Blueprint, render_template, request, jsonify, send_file
+from flask import Blueprint, render_template, request, jsonify, send_file, after_this_request, url_for
+from werkzeug.datastructures import FileStorage
 import os
 import uuid
 import tempfile
@@ -8,20 +9,11 @@ import img2pdf
 import io
 import logging
 import shutil
-import pillow_heif # Import the library
 import datetime # For logging timestamps if needed
 import time # For background cleanup logic
-
-# --- Register the HEIF opener with Pillow ---
-try:
-    pillow_heif.register_heif_opener()
-    logging.info("Successfully registered HEIF opener.")
-except Exception as e:
-    # Log the error, but allow the app to continue if HEIF isn't strictly required
-    # or if pillow-heif might not be installed everywhere.
-    logging.error(f"Failed to register HEIF opener: {e}. HEIC/HEIF support may be unavailable.", exc_info=True)
-    # If HEIF support is critical, you might want to raise an error here:
-    # raise RuntimeError("HEIF support could not be initialized.") from e
+import glob
+from concurrent.futures import wait
+from concurrent.futures.process import BrokenProcessPool
 
 # --- Flask Blueprint Setup ---
 # Replace with your actual Blueprint initialization
@@ -29,6 +21,17 @@ except Exception as e:
 # Mock Blueprint for standalone execution/testing:
 from . import img2pdf_bp
 # --- End Mock Blueprint ---
+from app.metrics import register_session_gauge
+from app.services.session_store import create_session_store
+from app.services.janitor import register_session_storage
+from app.services.blob_store import get_blob_store
+from app.services.chunked_upload import ChunkedUploads, UploadError, register_chunked_upload_routes
+from app.services.process_pool import get_process_pool, discard_process_pool
+from app.services.job_queue import JobQueue, QueueFull
+# Importing normalize also registers the HEIF opener with Pillow
+from .normalize import normalize_image, configure_heif, HeifError, MAX_DIMENSION
+from .pdf_writer import write_pdf
+from .optimize import write_to_budget
 
 
 # --- Configure Logging ---
@@ -40,7 +43,23 @@ logging.basicConfig(
 logger = logging.getLogger(__name__) # Get logger for this module
 
 # --- Constants ---
-MAX_DIMENSION = 2048 # Maximum width or height allowed for resizing
+# Processes that decode/resize/re-encode uploaded images in parallel (per worker process)
+NORMALIZE_WORKERS = int(os.environ.get('IMG2PDF_WORKERS', 0)) or os.cpu_count() or 1
+# libheif decoder threads per HEIC image (a process-wide setting, applied once per process).
+# Pool processes decode one image each, so each gets its share of the cores. A single image is
+# normalized inline on a request thread, and every thread of every gunicorn worker may be doing
+# that at once, so the web worker's own setting is its share over WEB_CONCURRENCY x WEB_THREADS.
+HEIF_POOL_THREADS = int(os.environ.get('IMG2PDF_HEIF_THREADS', 0)) or max(1, (os.cpu_count() or 1) // NORMALIZE_WORKERS)
+HEIF_INLINE_THREADS = max(1, (os.cpu_count() or 1) // (
+    int(os.environ.get('WEB_CONCURRENCY', 0) or os.cpu_count() or 1) * int(os.environ.get('WEB_THREADS', 0) or 4)))
+# Threads that generate PDFs in the background, and how many jobs may be queued or running (per worker process)
+GENERATE_WORKERS = int(os.environ.get('IMG2PDF_JOB_WORKERS', 2))
+GENERATE_MAX_PENDING = int(os.environ.get('IMG2PDF_JOB_QUEUE', 16))
+# Identifies the normalization below in the blob store's derived-artifact cache; bump it when the processing changes
+NORMALIZE_RECIPE_VERSION = 3
+
+# Decoder threads for images normalized inline in this web worker (pool processes use HEIF_POOL_THREADS)
+configure_heif(HEIF_INLINE_THREADS)
 SESSION_CLEANUP_DELAY = 3600 # Seconds before an inactive session is eligible for cleanup (e.g., 1 hour)
 
 # --- Determine Temporary Directory ---
@@ -76,15 +95,80 @@ else:
 
 
 # --- Session Storage ---
-# WARNING: In-memory dictionary is NOT suitable for production.
-# It doesn't scale, isn't persistent, and won't work with multiple server processes/workers.
-# Use Redis, Memcached, a database, or a distributed cache in production.
-SESSIONS = {} # Stores { session_id: {'images': [], 'directory': path, 'pdf_path': path, 'last_accessed': timestamp} }
+# Shared by all worker processes (SQLite/WAL by default, see app/services/session_store.py),
+# so an upload handled by one worker can be generated/downloaded by another.
+# Sessions expire after SESSION_CLEANUP_DELAY seconds without access.
+SESSIONS = create_session_store('img2pdf', ttl=SESSION_CLEANUP_DELAY) # Stores { session_id: {'images': [], 'directory': path, 'pdf_path': path} }
 
 # --- Helper Function to Update Session Timestamp ---
 def touch_session(session_id):
-    if session_id in SESSIONS:
-        SESSIONS[session_id]['last_accessed'] = time.time()
+    SESSIONS.touch(session_id)
+
+# Expose the number of active sessions on /metrics
+register_session_gauge('img2pdf', lambda: len(SESSIONS))
+# Expired sessions (and orphaned session directories) are removed by the background janitor
+register_session_storage('img2pdf', TEMP_DIR, SESSIONS)
+
+# --- Chunked Uploads ---
+# Large files are sent in chunks (api/upload/init, api/upload/<upload_id>) into
+# <session_dir>/incoming/ and then processed by api/upload like a normal upload.
+CHUNKED_UPLOADS = ChunkedUploads('img2pdf', TEMP_DIR, ttl=SESSION_CLEANUP_DELAY)
+register_chunked_upload_routes(img2pdf_bp, CHUNKED_UPLOADS)
+
+# --- PDF Generation Jobs ---
+# api/generate only queues the conversion; clients poll api/jobs/<job_id> and download when it is done
+GENERATE_JOBS = JobQueue('img2pdf', GENERATE_WORKERS, GENERATE_MAX_PENDING, ttl=SESSION_CLEANUP_DELAY)
+
+
+# --- Session Editing Helpers ---
+def session_image_list(session_images):
+    """The images of a session as sent to the client: [{id, name, size}] in PDF order."""
+    return [{'id': img['id'], 'name': img['name'], 'size': img['size']} for img in session_images]
+
+
+def check_session_editable(session_id, session):
+    """Returns an error response if the session's images must not change now (a PDF is being generated), else None."""
+    job_id = session.get('job_id')
+    job = GENERATE_JOBS.get(job_id) if job_id else None
+    if job and job['status'] in ('queued', 'running'):
+        logger.warning(f"[{session_id}] Rejected session change while job {job_id} is generating the PDF.")
+        return jsonify({'error': 'The PDF is being generated. Please wait until it is done before changing the images.'}), 409 # Conflict
+    return None
+
+
+class SessionEditError(Exception):
+    """Raised by an edit passed to edit_session_images() to leave the session unchanged."""
+
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+    def to_response(self):
+        return jsonify({'error': self.message}), self.status
+
+
+def edit_session_images(session_id, edit):
+    """
+    Atomically replaces the session's image list with edit(images) and invalidates the PDF generated
+    from the old list. Concurrent uploads/removals/reorders of the same session cannot undo each other.
+    edit may raise SessionEditError. Returns the new image list, or None if the session is gone.
+    """
+    outdated = {}
+
+    def apply(data):
+        outdated['pdf_path'] = data.get('pdf_path')
+        return {'images': edit(data.get('images', [])), 'pdf_path': None}
+
+    session = SESSIONS.modify(session_id, apply)
+    if session is None:
+        return None
+    # Remove the PDF generated from the old images (outside the store's lock)
+    pdf_path = outdated['pdf_path']
+    if pdf_path and os.path.exists(pdf_path):
+        try: os.remove(pdf_path)
+        except OSError as rm_err: logger.warning(f"[{session_id}] Failed to remove outdated PDF '{pdf_path}': {rm_err}")
+    return session['images']
 
 # --- Routes ---
 
@@ -104,14 +188,42 @@ def index():
 
 @img2pdf_bp.route('/api/upload', methods=['POST'])
 def upload_image():
-    """Handles image uploads, processing (resize, convert), and session creation."""
-    # Check if the post request has the file part
-    if 'images' not in request.files:
-        logger.warning("Upload attempt failed: 'images' part missing in request.files.")
-        return jsonify({'error': 'No images part in the request'}), 400
+    """
+    Handles image uploads, processing (resize, convert), and session creation.
+
+    Accepts either multipart form data ('images') or, for files sent with the
+    chunked upload API, JSON {'session_id': ..., 'upload_ids': [...]}.
+    If session_id names an existing session, the images are appended to it
+    instead (multipart: pass session_id as a form field).
+    """
+    session_id = None
+    if request.is_json:
+        # --- Files assembled by the chunked upload endpoints ---
+        data = request.get_json(silent=True) or {}
+        session_id = data.get('session_id')
+        upload_ids = data.get('upload_ids') or []
+        try:
+            completed = CHUNKED_UPLOADS.completed_files(session_id, upload_ids)
+        except UploadError as e:
+            logger.warning(f"[{session_id}] Chunked upload attempt failed: {e.message}")
+            return e.to_response()
+        uploaded_files = [FileStorage(stream=open(path, 'rb'), filename=filename) for filename, path in completed]
+
+        @after_this_request
+        def _finish_chunked_upload(response):
+            for file_storage in uploaded_files:
+                file_storage.close()
+            CHUNKED_UPLOADS.finish(session_id, upload_ids)
+            return response
+    else:
+        # Check if the post request has the file part
+        if 'images' not in request.files:
+            logger.warning("Upload attempt failed: 'images' part missing in request.files.")
+            return jsonify({'error': 'No images part in the request'}), 400
 
-    # Get list of uploaded files
-    uploaded_files = request.files.getlist('images')
+        # Get list of uploaded files
+        uploaded_files = request.files.getlist('images')
+        session_id = request.form.get('session_id') or None
 
     # Filter out any potential empty file inputs (where user didn't select a file)
     images_to_process = [img for img in uploaded_files if img.filename]
@@ -120,39 +232,114 @@ def upload_image():
         logger.warning("Upload attempt failed: 'images' field present, but no files were selected.")
         return jsonify({'error': 'No image files selected for upload'}), 400
 
+    # --- Append to an existing session ---
+    existing_session = SESSIONS.get(session_id, touch=True) if session_id else None
+    appending = existing_session is not None
+    if appending:
+        error_response = check_session_editable(session_id, existing_session)
+        if error_response:
+            return error_response
+        session_dir = existing_session['directory']
+        logger.info(f"[{session_id}] Appending {len(images_to_process)} images to the existing session.")
+    elif session_id and not request.is_json:
+        # Only the chunked upload endpoints may choose the ID of a new session
+        logger.warning(f"[{session_id}] Upload attempt for invalid/unknown session ID.")
+        return jsonify({'error': 'Invalid or expired session ID'}), 404
+
     # --- Create a new session for this upload batch ---
-    session_id = str(uuid.uuid4())
-    session_dir = os.path.join(TEMP_DIR, session_id)
-    try:
-        os.makedirs(session_dir)
-        logger.info(f"[{session_id}] Created session directory: {session_dir}")
-    except OSError as e:
-        logger.error(f"[{session_id}] Failed to create session directory {session_dir}: {e}", exc_info=True)
-        return jsonify({'error': 'Server error: Could not create temporary storage directory'}), 500
-
-    # Initialize session data
-    SESSIONS[session_id] = {
-        'images': [],           # List to store info about each processed image
-        'directory': session_dir, # Path to the session's temporary directory
-        'pdf_path': None,       # Path to the generated PDF (once created)
-        'last_accessed': time.time() # Timestamp for cleanup purposes
-    }
-    logger.info(f"[{session_id}] Initialized new session.")
+    # (chunked uploads already created the session directory and chose the ID)
+    if not appending:
+        session_id = session_id or str(uuid.uuid4())
+        session_dir = os.path.join(TEMP_DIR, session_id)
+        try:
+            os.makedirs(session_dir, exist_ok=True)
+            logger.info(f"[{session_id}] Created session directory: {session_dir}")
+        except OSError as e:
+            logger.error(f"[{session_id}] Failed to create session directory {session_dir}: {e}", exc_info=True)
+            return jsonify({'error': 'Server error: Could not create temporary storage directory'}), 500
+
+        # Initialize session data
+        SESSIONS.set(session_id, {
+            'images': [],           # List to store info about each processed image
+            'directory': session_dir, # Path to the session's temporary directory
+            'pdf_path': None,       # Path to the generated PDF (once created)
+        })
+        logger.info(f"[{session_id}] Initialized new session.")
+
+    session_images = [] # Image info collected in this request, written to the session store at the end
 
     image_data_response = [] # List of image details to send back to the client
     # List to keep track of file paths created IN THIS REQUEST for potential cleanup if error occurs mid-batch
     processed_files_this_request = []
+    staged_uploads = [] # Raw uploads saved to disk so pool processes can read them
+    pending = [] # Images to normalize: (index, original_filename, log_prefix, normalize_image args, input_digest, recipe)
+    futures = [] # Their pool futures (None for an image normalized in the request thread)
+    blob_store = get_blob_store()
+
+    def add_image_info(original_filename, final_save_path, final_width, final_height, log_prefix):
+        """Records a processed image in the session and in the response."""
+        # --- Store Image Information in Session ---
+        img_id = str(uuid.uuid4()) # Unique ID for this image within the session
+        img_info = {
+            'id': img_id,
+            'name': original_filename, # Display original name to the user
+            'path': final_save_path,  # Store the path to the ACTUAL saved file
+            'size': f"{final_width}x{final_height}" # Store final dimensions
+        }
+        session_images.append(img_info)
+        logger.info(f"{log_prefix} Stored info for image ID {img_id}. Path: {final_save_path}")
+
+        # --- Prepare Data for JSON Response to Client ---
+        image_data_response.append({
+            'id': img_id,
+            'name': original_filename,
+            'size': f"{final_width}x{final_height}" # Send final dimensions
+        })
 
-    # --- Process each uploaded image file ---
+    def abort_batch(original_filename, error, source_path=None):
+        """
+        Rolls back the whole upload (files of this request, session data and directory) and returns the error response.
+        When appending, only the files of this request are removed and the session keeps its images.
+        """
+        logger.error(f"[{session_id}] Aborting batch due to error on '{original_filename}'. Cleaning up.")
+        # Drop images that have not started and wait for running ones, so their outputs are removed below too
+        for future in futures:
+            if future:
+                future.cancel()
+        wait([future for future in futures if future])
+        for item in pending:
+            dest_base = item[3][1]
+            for fp in glob.glob(f"{glob.escape(dest_base)}*"):
+                if fp not in processed_files_this_request:
+                    processed_files_this_request.append(fp)
+        for fp in processed_files_this_request:
+            if os.path.exists(fp):
+                try: os.remove(fp)
+                except OSError: logger.warning(f"[{session_id}] Failed to remove file during error cleanup: {fp}")
+        if not appending:
+            SESSIONS.delete(session_id) # Remove session data
+            if os.path.exists(session_dir): shutil.rmtree(session_dir, ignore_errors=True) # Remove session dir
+        # Don't expose server paths of staged uploads in the message
+        message = str(error).replace(source_path, original_filename) if source_path else str(error)
+
+        if isinstance(error, HeifError):
+            # Specific error for HEIF processing issues
+            logger.error(f"[{session_id}] HEIF Error on '{original_filename}': {message}. Check libheif installation.", exc_info=error)
+            return jsonify({'error': f'Error processing HEIC/HEIF image "{original_filename}". Is libheif installed correctly? Details: {message}'}), 400 # Bad request likely due to format/library issue
+        if isinstance(error, Image.DecompressionBombError):
+            # Pillow's protection against potential DoS attacks
+            logger.error(f"[{session_id}] Decompression Bomb Error on '{original_filename}': {message}", exc_info=error)
+            return jsonify({'error': f'Image "{original_filename}" is too large or could be a decompression bomb. Processing aborted.'}), 413 # Payload too large
+        logger.error(f"[{session_id}] Unexpected error processing '{original_filename}': {message}", exc_info=error)
+        return jsonify({'error': f'Server error processing image "{original_filename}": {message}'}), 500 # Internal server error
+
+    # --- Pass 1: reuse cached results, stage the remaining uploads for normalization ---
+    results = [None] * len(images_to_process) # Per image (in upload order): {'path', 'width', 'height'}
     for i, img_file_storage in enumerate(images_to_process):
         original_filename = img_file_storage.filename
         log_prefix = f"[{session_id}][Image {i+1}/{len(images_to_process)}: '{original_filename}']"
         logger.info(f"{log_prefix} Starting processing.")
 
-        img_object = None # Pillow Image object for the original uploaded image
-        img_to_save = None # Pillow Image object for the final version to be saved (potentially resized/converted)
-        final_save_path = None # Full path where the processed image will be saved
-
         try:
             # --- Sanitize filename and create unique base name ---
             base, ext = os.path.splitext(original_filename)
@@ -162,257 +349,89 @@ def upload_image():
             # Generate a unique filename using UUID to prevent collisions
             unique_filename_base = f"{uuid.uuid4()}_{safe_base}"
 
-            # --- Open image using Pillow ---
-            # Reading directly from the stream avoids saving the original file unnecessarily
-            img_file_storage.stream.seek(0) # Ensure stream is at the beginning
-            img_object = Image.open(img_file_storage.stream)
-
-            # Load image data into memory. This can catch some corrupted files early.
-            img_object.load()
-
-            original_width, original_height = img_object.size
-            original_mode = img_object.mode
-            detected_format = img_object.format # Format detected by Pillow
-            logger.info(f"{log_prefix} Opened. Original Size: {original_width}x{original_height}, Mode: {original_mode}, Detected Format: {detected_format}")
-
-            # Start with the loaded image object as the one to potentially save
-            img_to_save = img_object
-
-            # --- Resizing Logic ---
-            current_width, current_height = original_width, original_height
-            max_dim = max(current_width, current_height)
-            if max_dim > MAX_DIMENSION:
-                scale_factor = MAX_DIMENSION / max_dim
-                new_width = int(current_width * scale_factor)
-                new_height = int(current_height * scale_factor)
-                logger.info(f"{log_prefix} Resizing from {current_width}x{current_height} to {new_width}x{new_height}")
+            # --- Reuse the normalized result of identical content uploaded before ---
+            input_digest = blob_store.digest_stream(img_file_storage.stream)
+            recipe = f"img2pdf.normalize:v{NORMALIZE_RECIPE_VERSION}:max={MAX_DIMENSION}:ext={safe_ext}"
+            cached = blob_store.get_derived(input_digest, recipe)
+            if cached:
+                cached_digest, cached_meta = cached
+                cached_path = os.path.join(session_dir, f"{unique_filename_base}{cached_meta['ext']}")
+                if blob_store.link_into(cached_digest, cached_path):
+                    logger.info(f"{log_prefix} Reusing previously processed copy {cached_digest[:12]} (skipping decode).")
+                    processed_files_this_request.append(cached_path)
+                    results[i] = {'path': cached_path, 'width': cached_meta['width'], 'height': cached_meta['height']}
+                    continue
+
+            # --- Make the upload readable by the pool processes ---
+            # Chunked uploads are already files on disk; multipart uploads are saved next to the results
+            source_path = getattr(img_file_storage.stream, 'name', None)
+            if not (isinstance(source_path, str) and os.path.isfile(source_path)):
+                source_path = os.path.join(session_dir, f".upload_{uuid.uuid4().hex}{safe_ext}")
+                img_file_storage.stream.seek(0)
+                img_file_storage.save(source_path)
+                staged_uploads.append(source_path)
+
+            dest_base = os.path.join(session_dir, unique_filename_base)
+            pending.append((i, original_filename, log_prefix, (source_path, dest_base, safe_ext, log_prefix), input_digest, recipe))
+        except Exception as e:
+            return abort_batch(original_filename, e)
 
-                # Determine resampling filter (use LANCZOS for quality, fallback for older Pillow)
-                try:
-                    resampling_filter = Image.Resampling.LANCZOS
-                except AttributeError:
-                    resampling_filter = Image.ANTIALIAS # Fallback for Pillow < 9.1.0
-
-                resized_img = img_to_save.resize((new_width, new_height), resampling_filter)
-
-                # Close the previous image object if a new one was created by resize
-                if img_to_save is not resized_img:
-                    logger.debug(f"{log_prefix} Closing pre-resize image object.")
-                    img_to_save.close()
-
-                img_to_save = resized_img # Update reference to the resized image
-                current_width, current_height = new_width, new_height # Update dimensions for metadata
-                logger.info(f"{log_prefix} Resized successfully.")
-            else:
-                 logger.info(f"{log_prefix} No resizing needed (dimensions within limit).")
-
-            # --- Determine Target Format and Handle Mode Conversions ---
-            current_mode = img_to_save.mode # Mode of the (potentially resized) image
-            target_format = None # Target format for saving (e.g., 'JPEG', 'PNG')
-            final_ext_override = None # Use this if conversion changes the file extension
-
-            # 1. Handle HEIC/HEIF: Convert to JPEG for wider compatibility in PDFs
-            #    (img2pdf might handle HEIC directly if libheif is installed, but converting ensures it)
-            if detected_format in ['HEIF', 'HEIC']:
-                logger.info(f"{log_prefix} Detected HEIC/HEIF. Planning conversion to JPEG.")
-                target_format = 'JPEG'
-                final_ext_override = ".jpg"
-            # 2. Handle Uncommon Extensions: Convert to PNG as a safe, widely supported format
-            elif safe_ext not in ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp']:
-                 logger.warning(f"{log_prefix} Original file has uncommon extension '{safe_ext}'. Planning conversion to PNG.")
-                 target_format = 'PNG'
-                 final_ext_override = ".png"
-            # 3. Determine if mode conversion is needed for the intended format
-            else:
-                # Generally, try to keep the original common format unless mode dictates otherwise
-                # Use detected format if available, otherwise guess from extension or default to PNG
-                if detected_format and detected_format.upper() in ['JPEG', 'PNG', 'GIF', 'BMP', 'TIFF', 'WEBP']:
-                     target_format = detected_format.upper()
-                elif safe_ext in ['.jpg', '.jpeg']:
-                     target_format = 'JPEG'
-                elif safe_ext == '.png':
-                     target_format = 'PNG'
-                # Add more elif for other extensions if needed
-                else:
-                     logger.warning(f"{log_prefix} Could not determine reliable target format from detected='{detected_format}', ext='{safe_ext}'. Defaulting to PNG.")
-                     target_format = 'PNG'
-                     final_ext_override = ".png" # Ensure extension matches if defaulting
-
-                # Check if the current mode is incompatible with the target format
-                if target_format == 'JPEG' and current_mode not in ('RGB', 'L', 'CMYK'):
-                    logger.info(f"{log_prefix} Mode '{current_mode}' is incompatible with JPEG target. Planning conversion.")
-                    # Conversion logic below will handle this.
-                elif target_format == 'BMP' and current_mode not in ('RGB', 'L', 'P', 'RGBA'): # BMP supports limited modes
-                    logger.info(f"{log_prefix} Mode '{current_mode}' may be incompatible with BMP target. Planning conversion to RGB.")
-                    # Conversion logic below will handle this.
-                # Add checks for other formats if necessary
-
-            # --- Perform Mode Conversion if Required ---
-            # Conversion is needed if:
-            # a) Target format is JPEG and source has transparency (RGBA, LA, P with transparency).
-            # b) Target format requires a specific mode (like RGB) and source is different.
-            # c) We explicitly decided to convert (e.g., HEIC -> JPEG).
-
-            needs_flattening = target_format == 'JPEG' and current_mode in ('RGBA', 'LA', 'P')
-            # Check if conversion to RGB is needed (excluding cases already handled by flattening)
-            needs_rgb_conversion = not needs_flattening and \
-                                   ((target_format == 'JPEG' and current_mode not in ('RGB', 'L', 'CMYK')) or \
-                                    (target_format == 'BMP' and current_mode not in ('RGB', 'L', 'P', 'RGBA')) or \
-                                    (final_ext_override and current_mode not in ('RGB', 'L', 'RGBA', 'LA', 'P'))) # If changing format, ensure basic compatibility
-
-            if needs_flattening:
-                # Flatten image with transparency onto a white background for JPEG
-                logger.info(f"{log_prefix} Flattening mode '{current_mode}' onto white background for {target_format} saving.")
-                flattened_img = None
+    # --- Pass 2: normalize (decode, resize, convert, re-encode) concurrently ---
+    # A single image is processed in the request thread, which saves the round trip to the pool
+    try:
+        pool = get_process_pool('img2pdf.normalize', NORMALIZE_WORKERS, configure_heif, (HEIF_POOL_THREADS,)) if len(pending) > 1 else None
+        futures.extend(pool.submit(normalize_image, *item[3]) if pool else None for item in pending)
+        try:
+            for (i, original_filename, log_prefix, args, input_digest, recipe), future in zip(pending, futures):
                 try:
-                    # Create a new RGB image with a white background
-                    bg = Image.new("RGB", img_to_save.size, (255, 255, 255))
-                    # Paste the image onto the background. Pillow's paste handles the alpha mask correctly.
-                    bg.paste(img_to_save, (0, 0), img_to_save)
-                    flattened_img = bg # Keep reference to the new object
-                    logger.info(f"{log_prefix} Successfully flattened image to RGB.")
-
-                    # Close the previous image object (the one with transparency)
-                    logger.debug(f"{log_prefix} Closing pre-flattening image object.")
-                    img_to_save.close()
-                    img_to_save = flattened_img # Update reference to the flattened image
-                    current_mode = img_to_save.mode # Update mode tracker
-
-                except Exception as flatten_err:
-                    logger.error(f"{log_prefix} Error during flattening: {flatten_err}. Attempting fallback convert('RGB').", exc_info=True)
-                    # Clean up background image if created but not used
-                    if 'bg' in locals() and flattened_img is not bg:
-                        try: bg.close()
-                        except Exception: pass
-                    # Fallback: Simple conversion to RGB (might use black background for transparency)
-                    try:
-                        logger.warning(f"{log_prefix} Falling back to simple convert('RGB').")
-                        converted_img = img_to_save.convert('RGB')
-                        logger.debug(f"{log_prefix} Closing pre-fallback-conversion image object.")
-                        img_to_save.close()
-                        img_to_save = converted_img
-                        current_mode = img_to_save.mode
-                        logger.info(f"{log_prefix} Fallback convert('RGB') successful.")
-                    except Exception as convert_err:
-                         logger.error(f"{log_prefix} Fallback convert('RGB') also failed: {convert_err}", exc_info=True)
-                         # Re-raise the error to be caught by the main handler for this image
-                         raise convert_err
-
-            elif needs_rgb_conversion:
-                # Convert modes like CMYK, YCbCr, etc., to RGB if necessary for the target format
-                logger.info(f"{log_prefix} Converting mode '{current_mode}' to RGB for {target_format or 'saving'}.")
+                    result = future.result() if future else normalize_image(*args)
+                except BrokenProcessPool as e:
+                    discard_process_pool('img2pdf.normalize', pool)
+                    return abort_batch(original_filename, e)
+                except Exception as e:
+                    return abort_batch(original_filename, e, args[0])
+
+                logger.info(f"{log_prefix} Successfully saved final image to {result['path']}")
+                processed_files_this_request.append(result['path']) # Track successfully saved file
+                results[i] = result
                 try:
-                    converted_img = img_to_save.convert('RGB')
-                    logger.debug(f"{log_prefix} Closing pre-RGB-conversion image object.")
-                    img_to_save.close()
-                    img_to_save = converted_img
-                    current_mode = img_to_save.mode # Update mode tracker
-                    logger.info(f"{log_prefix} Successfully converted to mode '{current_mode}'.")
-                except Exception as convert_err:
-                    logger.error(f"{log_prefix} Failed to convert mode '{current_mode}' to RGB: {convert_err}", exc_info=True)
-                    # Re-raise the error
-                    raise convert_err
-
-            # --- Determine Final Save Path and Options ---
-            final_extension = final_ext_override if final_ext_override else safe_ext
-            # Ensure there's a valid extension, default to .png if missing or problematic
-            if not final_extension or final_extension == '.':
-                 final_extension = ".png"
-                 target_format = 'PNG' # Make sure format matches extension
-                 logger.warning(f"{log_prefix} No valid extension found, defaulting to '.png' and PNG format.")
-
-            final_save_path = os.path.join(session_dir, f"{unique_filename_base}{final_extension}")
-
-            # Prepare options for Pillow's save method
-            save_options = {}
-            if target_format:
-                 # Pillow expects format identifiers in uppercase
-                 save_options['format'] = target_format.upper()
-
-            # Set quality for JPEG
-            if save_options.get('format') == 'JPEG':
-                save_options['quality'] = 90 # Good balance of quality and size
-                logger.info(f"{log_prefix} Setting JPEG quality to 90.")
-                # Add other options like optimize=True, progressive=True if desired
-                # save_options['optimize'] = True
-                # save_options['progressive'] = True
-
-            # --- Save the Final Processed Image ---
-            final_mode_to_save = img_to_save.mode
-            logger.info(f"{log_prefix} Final check before saving:")
-            logger.info(f"  - Original Mode: {original_mode}, Final Mode: {final_mode_to_save}")
-            logger.info(f"  - Target Format: {save_options.get('format', 'Implicit from extension')}")
-            logger.info(f"  - Save Path: {final_save_path}")
-            logger.info(f"  - Save Options: {save_options}")
-
-            # Save the image (which might be original, resized, flattened, or converted)
-            img_to_save.save(final_save_path, **save_options)
-
-            logger.info(f"{log_prefix} Successfully saved final image to {final_save_path}")
-            processed_files_this_request.append(final_save_path) # Track successfully saved file
-
-            # --- Store Image Information in Session ---
-            img_id = str(uuid.uuid4()) # Unique ID for this image within the session
-            final_width, final_height = img_to_save.size # Get dimensions of the saved image
-            img_info = {
-                'id': img_id,
-                'name': original_filename, # Display original name to the user
-                'path': final_save_path,  # Store the path to the ACTUAL saved file
-                'size': f"{final_width}x{final_height}" # Store final dimensions
-            }
-            SESSIONS[session_id]['images'].append(img_info)
-            logger.info(f"{log_prefix} Stored info for image ID {img_id}. Path: {final_save_path}")
-
-            # --- Prepare Data for JSON Response to Client ---
-            image_data_response.append({
-                'id': img_id,
-                'name': original_filename,
-                'size': f"{final_width}x{final_height}" # Send final dimensions
-            })
-
-        except pillow_heif.HeifError as he:
-             # Specific error for HEIF processing issues
-             logger.error(f"{log_prefix} HEIF Error: {str(he)}. Check libheif installation.", exc_info=True)
-             # Clean up the entire session attempt as HEIF support might be broken
-             if session_id in SESSIONS: del SESSIONS[session_id]
-             if os.path.exists(session_dir): shutil.rmtree(session_dir)
-             return jsonify({'error': f'Error processing HEIC/HEIF image "{original_filename}". Is libheif installed correctly? Details: {str(he)}'}), 400 # Bad request likely due to format/library issue
-        except Image.DecompressionBombError as db_err:
-             # Pillow's protection against potential DoS attacks
-             logger.error(f"{log_prefix} Decompression Bomb Error: {str(db_err)}", exc_info=True)
-             return jsonify({'error': f'Image "{original_filename}" is too large or could be a decompression bomb. Processing aborted.'}), 413 # Payload too large
-        except Exception as e:
-            # Catch all other exceptions during processing of this single image
-            logger.error(f"{log_prefix} Unexpected error during processing: {str(e)}", exc_info=True)
-            # Don't abort the whole batch, just report error for this image?
-            # Or abort the whole batch? Let's abort the batch for simplicity.
-            # Clean up any files created *during this request* and the session dir
-            logger.error(f"[{session_id}] Aborting batch due to error on '{original_filename}'. Cleaning up.")
-            for fp in processed_files_this_request:
-                if os.path.exists(fp):
-                    try: os.remove(fp)
-                    except OSError: logger.warning(f"[{session_id}] Failed to remove file during error cleanup: {fp}")
-            if session_id in SESSIONS: del SESSIONS[session_id] # Remove session data
-            if os.path.exists(session_dir): shutil.rmtree(session_dir) # Remove session dir
-            return jsonify({'error': f'Server error processing image "{original_filename}": {str(e)}'}), 500 # Internal server error
+                    # Deduplicate the processed file and remember it for identical future uploads
+                    output_digest = blob_store.put_file(result['path'])
+                    blob_store.put_derived(input_digest, recipe, output_digest,
+                                           {'ext': result['ext'], 'width': result['width'], 'height': result['height']})
+                except Exception as e:
+                    return abort_batch(original_filename, e)
         finally:
-            # --- Ensure Pillow image objects are closed ---
-            # It's crucial to close images, especially when working with streams or large files.
-            if img_to_save:
-                try:
-                    img_to_save.close()
-                    logger.debug(f"{log_prefix} Closed final image object (img_to_save).")
-                except Exception as close_err:
-                     logger.warning(f"{log_prefix} Error closing final image object: {close_err}")
-            # Close original img_object if it's different from img_to_save and wasn't closed earlier
-            if img_object and img_object is not img_to_save:
-                 try:
-                     img_object.close()
-                     logger.debug(f"{log_prefix} Closed original image object (img_object).")
-                 except Exception as close_err:
-                     logger.warning(f"{log_prefix} Error closing original image object: {close_err}")
-
-    # --- End of loop for processing images ---
+            # Normally all done; abort_batch has already waited for them on error
+            for future in futures:
+                if future:
+                    future.cancel()
+            wait([future for future in futures if future])
+    finally:
+        for staged_path in staged_uploads:
+            if os.path.exists(staged_path):
+                os.remove(staged_path)
+
+    # --- Pass 3: record the images in upload order ---
+    for i, (img_file_storage, result) in enumerate(zip(images_to_process, results)):
+        log_prefix = f"[{session_id}][Image {i+1}/{len(images_to_process)}: '{img_file_storage.filename}']"
+        add_image_info(img_file_storage.filename, result['path'], result['width'], result['height'], log_prefix)
+
+
+    if appending:
+        # Appended to the images as they are now, so removals/reorders made meanwhile are kept
+        new_images = session_images
+        session_images = edit_session_images(session_id, lambda images: images + new_images)
+        if session_images is None:
+            for fp in processed_files_this_request:
+                if os.path.exists(fp): os.remove(fp)
+            return jsonify({'error': 'Invalid or expired session ID'}), 404
+        logger.info(f"[{session_id}] Appended {len(image_data_response)} images; the session now has {len(session_images)}.")
+        return jsonify({
+            'success': True,
+            'session_id': session_id,
+            'images': session_image_list(session_images) # The whole session, in PDF order
+        })
 
     # Check if any images were successfully processed
     if not image_data_response:
@@ -421,15 +440,14 @@ def upload_image():
          if os.path.exists(session_dir):
              shutil.rmtree(session_dir)
              logger.info(f"[{session_id}] Removed session directory as no images were processed.")
-         if session_id in SESSIONS:
-            del SESSIONS[session_id]
+         if SESSIONS.delete(session_id) is not None:
             logger.info(f"[{session_id}] Removed session data as no images were processed.")
          # Return an error to the client
          return jsonify({'error': 'No images could be processed successfully. Please check file formats or server logs.'}), 400
 
     # Log the final list of image paths stored for the session before returning success
-    if session_id in SESSIONS:
-        final_session_paths = [img.get('path', 'Missing path!') for img in SESSIONS[session_id].get('images', [])]
+    if SESSIONS.update(session_id, images=session_images) is not None:
+        final_session_paths = [img.get('path', 'Missing path!') for img in session_images]
         logger.info(f"[{session_id}] Successfully processed {len(image_data_response)} images. Final paths stored in session: {final_session_paths}")
     else:
         # This shouldn't happen if processing succeeded, but log if it does
@@ -443,9 +461,86 @@ def upload_image():
     })
 
 
+@img2pdf_bp.route('/api/session/<session_id>', methods=['GET'])
+def get_session_images(session_id):
+    """Lists the session's images in the order they will appear in the PDF."""
+    session = SESSIONS.get(session_id, touch=True)
+    if session is None:
+        return jsonify({'error': 'Invalid or expired session ID'}), 404
+    return jsonify({'success': True, 'session_id': session_id, 'images': session_image_list(session.get('images', []))})
+
+
+@img2pdf_bp.route('/api/session/<session_id>/images/<image_id>', methods=['DELETE'])
+def remove_image(session_id, image_id):
+    """Removes one image (by its id) from the session and deletes its processed file."""
+    log_prefix = f"[{session_id}]"
+    session = SESSIONS.get(session_id, touch=True)
+    if session is None:
+        logger.warning(f"{log_prefix} Remove image request for invalid/unknown session ID.")
+        return jsonify({'error': 'Invalid or expired session ID'}), 404
+    error_response = check_session_editable(session_id, session)
+    if error_response:
+        return error_response
+
+    removed = {}
+
+    def remove(images):
+        removed.update(next((img for img in images if img['id'] == image_id), {}))
+        if not removed:
+            raise SessionEditError('Image not found in this session', 404)
+        return [img for img in images if img['id'] != image_id]
+
+    try:
+        session_images = edit_session_images(session_id, remove)
+    except SessionEditError as e:
+        return e.to_response()
+    if session_images is None:
+        return jsonify({'error': 'Invalid or expired session ID'}), 404
+
+    # The file is only a hard link into the blob store, so identical future uploads are still reused
+    if removed.get('path') and os.path.exists(removed['path']):
+        try: os.remove(removed['path'])
+        except OSError as rm_err: logger.warning(f"{log_prefix} Failed to remove file '{removed['path']}': {rm_err}")
+    logger.info(f"{log_prefix} Removed image {image_id} ('{removed['name']}'); {len(session_images)} images left.")
+    return jsonify({'success': True, 'session_id': session_id, 'images': session_image_list(session_images)})
+
+
+@img2pdf_bp.route('/api/session/<session_id>/order', methods=['PUT'])
+def reorder_images(session_id):
+    """Reorders the session's images. JSON {'order': [image ids]} must list every image exactly once."""
+    log_prefix = f"[{session_id}]"
+    data = request.get_json(silent=True) or {}
+    order = data.get('order')
+    if not isinstance(order, list) or not all(isinstance(image_id, str) for image_id in order):
+        return jsonify({'error': "Missing 'order' list of image IDs"}), 400
+
+    session = SESSIONS.get(session_id, touch=True)
+    if session is None:
+        logger.warning(f"{log_prefix} Reorder request for invalid/unknown session ID.")
+        return jsonify({'error': 'Invalid or expired session ID'}), 404
+    error_response = check_session_editable(session_id, session)
+    if error_response:
+        return error_response
+
+    def reorder(images):
+        images_by_id = {img['id']: img for img in images}
+        if len(order) != len(images_by_id) or set(order) != set(images_by_id):
+            raise SessionEditError("'order' must list every image ID of the session exactly once", 400)
+        return [images_by_id[image_id] for image_id in order]
+
+    try:
+        session_images = edit_session_images(session_id, reorder)
+    except SessionEditError as e:
+        return e.to_response()
+    if session_images is None:
+        return jsonify({'error': 'Invalid or expired session ID'}), 404
+    logger.info(f"{log_prefix} Reordered {len(session_images)} images.")
+    return jsonify({'success': True, 'session_id': session_id, 'images': session_image_list(session_images)})
+
+
 @img2pdf_bp.route('/api/generate', methods=['POST'])
 def generate_pdf():
-    """Generates the PDF from processed images stored in the session."""
+    """Queues PDF generation from the processed images stored in the session. Poll the returned status_url for progress."""
     data = request.get_json()
     if not data:
         logger.warning("Generate PDF request received without JSON data.")
@@ -456,16 +551,19 @@ def generate_pdf():
         logger.warning("Generate PDF request missing 'session_id' in JSON data.")
         return jsonify({'error': 'Missing session ID'}), 400
 
+    # Optional size budget for the PDF in bytes; images are recompressed/downscaled to fit
+    target_bytes = data.get('target_bytes')
+    if target_bytes is not None and (isinstance(target_bytes, bool) or not isinstance(target_bytes, int) or target_bytes <= 0):
+        return jsonify({'error': 'target_bytes must be a positive integer'}), 400
+
     log_prefix = f"[{session_id}]" # Prefix for logs related to this session
 
     # --- Validate Session ---
-    if session_id not in SESSIONS:
+    session = SESSIONS.get(session_id, touch=True) # Also updates last accessed time
+    if session is None:
         logger.warning(f"{log_prefix} Generate PDF request for invalid/unknown session ID.")
         return jsonify({'error': 'Invalid or expired session ID'}), 404 # Not Found
 
-    session = SESSIONS[session_id]
-    touch_session(session_id) # Update last accessed time
-
     session_images = session.get('images')
     if not session_images:
         logger.warning(f"{log_prefix} Generate PDF request for session with no associated images.")
@@ -512,25 +610,75 @@ def generate_pdf():
     for valid_p in valid_image_paths:
         logger.info(f"  - {valid_p}")
 
-    # --- Create PDF using img2pdf ---
-    try:
-        # The core conversion step
-        pdf_bytes = img2pdf.convert(valid_image_paths)
+    # --- Queue the conversion ---
+    # A session that is already being generated returns the running job instead of starting a second one
+    previous_job_id = session.get('job_id')
+    job = GENERATE_JOBS.get(previous_job_id) if previous_job_id else None
+    if job and job['status'] in ('queued', 'running'):
+        job_id = previous_job_id
+        logger.info(f"{log_prefix} PDF generation already in progress as job {job_id}.")
+    else:
+        try:
+            job_id = GENERATE_JOBS.reserve(session_id=session_id)
+        except QueueFull as e:
+            logger.warning(f"{log_prefix} Rejected PDF generation: {e}")
+            response = jsonify({'error': 'The server is busy generating other PDFs. Please try again shortly.'})
+            response.headers['Retry-After'] = '5'
+            return response, 503 # Service Unavailable
+
+        def claim(data):
+            # Compare-and-swap: another request (possibly in another worker process) may have
+            # started a job for this session since it was read above
+            if data.get('job_id') != previous_job_id:
+                return {}
+            return {'job_id': job_id, 'pdf_path': None}
+
+        session = SESSIONS.modify(session_id, claim)
+        if session is None or session.get('job_id') != job_id:
+            GENERATE_JOBS.release(job_id)
+            if session is None:
+                return jsonify({'error': 'Invalid or expired session ID'}), 404
+            job_id = session['job_id']
+            logger.info(f"{log_prefix} PDF generation already in progress as job {job_id}.")
+        else:
+            GENERATE_JOBS.start(job_id, run_generate_job, session_id, valid_image_paths, pdf_path, target_bytes)
+            logger.info(f"{log_prefix} Queued PDF generation as job {job_id}.")
 
-        # Write the generated PDF bytes to the file
-        with open(pdf_path, "wb") as f:
-            f.write(pdf_bytes)
+    return jsonify({
+        'success': True,
+        'session_id': session_id,
+        'job_id': job_id,
+        'status_url': url_for('img2pdf.get_job', job_id=job_id),
+        'pdf_filename': pdf_filename # Send filename for potential display/download link
+    }), 202 # Accepted
 
-        # Store the generated PDF path in the session data
-        session['pdf_path'] = pdf_path
-        logger.info(f"{log_prefix} Successfully generated PDF ({len(pdf_bytes)} bytes) at {pdf_path}")
 
-        # Return success response to the client
-        return jsonify({
-            'success': True,
-            'session_id': session_id,
-            'pdf_filename': pdf_filename # Send filename for potential display/download link
-        })
+def run_generate_job(progress, session_id, image_paths, pdf_path, target_bytes=None):
+    """
+    Job body: writes the PDF and records it in the session. Runs on a GENERATE_JOBS thread.
+    With target_bytes the images are fitted into that budget first (see optimize.write_to_budget).
+    """
+    log_prefix = f"[{session_id}]"
+    try:
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(pdf_path), prefix='.fit_') as work_dir:
+            # The core conversion step: pages are written to the file one image at a time
+            with open(pdf_path, "wb") as f:
+                if target_bytes:
+                    pdf_size = write_to_budget(image_paths, target_bytes, f, work_dir, progress, log_prefix)
+                else:
+                    pdf_size = write_pdf(image_paths, f, progress)
+
+        # Store the generated PDF path in the session data
+        if SESSIONS.update(session_id, pdf_path=pdf_path) is None:
+            raise RuntimeError('The session expired while the PDF was being generated.')
+        logger.info(f"{log_prefix} Successfully generated PDF ({pdf_size} bytes) at {pdf_path}")
+        result = {'pdf_filename': os.path.basename(pdf_path), 'size': pdf_size}
+        if target_bytes:
+            result['target_bytes'] = target_bytes
+            result['target_met'] = pdf_size <= target_bytes
+            if not result['target_met']:
+                logger.warning(f"{log_prefix} PDF is {pdf_size} bytes, over the {target_bytes} byte target.")
+        return result
 
     except img2pdf.PdfTooLargeError as pdf_err:
         # Handle error if the generated PDF exceeds size limits (img2pdf internal check)
@@ -539,8 +687,8 @@ def generate_pdf():
         if os.path.exists(pdf_path):
             try: os.remove(pdf_path)
             except OSError as rm_err: logger.error(f"{log_prefix} Failed to remove oversized PDF '{pdf_path}': {rm_err}")
-        session['pdf_path'] = None # Ensure pdf_path is cleared in session
-        return jsonify({'error': f'Error generating PDF: The resulting PDF is too large. Try using fewer or smaller dimension images. Details: {str(pdf_err)}'}), 413 # Payload Too Large
+        SESSIONS.update(session_id, pdf_path=None) # Ensure pdf_path is cleared in session
+        raise RuntimeError(f'Error generating PDF: The resulting PDF is too large. Try using fewer or smaller dimension images. Details: {str(pdf_err)}')
 
     except Exception as e:
         # Handle any other errors during PDF generation
@@ -549,8 +697,28 @@ def generate_pdf():
         if os.path.exists(pdf_path):
              try: os.remove(pdf_path)
              except OSError as rm_err: logger.error(f"{log_prefix} Failed to remove partially generated PDF '{pdf_path}' after error: {rm_err}")
-        session['pdf_path'] = None # Ensure pdf_path is cleared
-        return jsonify({'error': f'An unexpected error occurred while generating the PDF: {str(e)}'}), 500
+        SESSIONS.update(session_id, pdf_path=None) # Ensure pdf_path is cleared
+        raise RuntimeError(f'An unexpected error occurred while generating the PDF: {str(e)}')
+
+
+@img2pdf_bp.route('/api/jobs/<job_id>')
+def get_job(job_id):
+    """Reports the progress of a PDF generation job: {status, done, total, error, download_url, size}."""
+    job = GENERATE_JOBS.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job ID'}), 404
+
+    response = {
+        'job_id': job_id,
+        'status': job['status'], # queued / running / done / failed
+        'done': job['done'], # Pages written so far
+        'total': job['total'],
+        'error': job['error'],
+    }
+    if job['status'] == 'done':
+        response.update(job['result']) # pdf_filename, size, and target_bytes/target_met if a budget was given
+        response['download_url'] = url_for('img2pdf.download_pdf', session_id=job['session_id'])
+    return jsonify(response)
 
 
 @img2pdf_bp.route('/api/download/<session_id>')
@@ -560,12 +728,12 @@ def download_pdf(session_id):
     logger.info(f"{log_prefix} Download request received.")
 
     # --- Validate Session and PDF Existence ---
-    if not session_id or session_id not in SESSIONS:
+    session = SESSIONS.get(session_id) if session_id else None
+    if session is None:
         logger.warning(f"{log_prefix} Download request for invalid/unknown session ID.")
         # Use 404 Not Found for invalid session/resource
         return jsonify({'error': 'Invalid or expired session ID. The download link may have expired.'}), 404
 
-    session = SESSIONS[session_id]
     # No need to touch session here, download is the final action
 
     pdf_path = session.get('pdf_path')
@@ -602,10 +770,9 @@ def download_pdf(session_id):
             log_prefix_cleanup = f"[{session_to_clean}]"
             logger.info(f"{log_prefix_cleanup} Post-download cleanup triggered.")
             try:
-                # 1. Remove session data from the global dictionary
-                if session_to_clean in SESSIONS:
-                    logger.info(f"{log_prefix_cleanup} Removing session data from memory.")
-                    del SESSIONS[session_to_clean]
+                # 1. Remove session data from the session store
+                if SESSIONS.delete(session_to_clean) is not None:
+                    logger.info(f"{log_prefix_cleanup} Removed session data from the session store.")
                 else:
                      logger.warning(f"{log_prefix_cleanup} Session data already removed before post-download cleanup could run.")
 
@@ -665,12 +832,12 @@ def cleanup_session():
     session_dir = None
     session_existed = False
     try:
-        if session_id in SESSIONS:
+        removed_session = SESSIONS.delete(session_id)
+        if removed_session is not None:
             session_existed = True
-            # Retrieve directory path *before* deleting session data
-            session_dir = SESSIONS[session_id].get('directory')
-            logger.info(f"{log_prefix} Removing session data from memory (explicit cleanup).")
-            del SESSIONS[session_id]
+            # Retrieve directory path from the removed session data
+            session_dir = removed_session.get('directory')
+            logger.info(f"{log_prefix} Removed session data from the session store (explicit cleanup).")
         else:
             logger.info(f"{log_prefix} Explicit cleanup requested for non-existent or already cleaned session.")
             # Attempt cleanup based on session_id anyway, dir might be orphaned
@@ -715,113 +882,7 @@ def cleanup_session():
     return jsonify({'success': True, 'message': 'Cleanup process completed.'})
 
 
-# --- Optional: Background Cleanup Task (Example using APScheduler) ---
-# Needs: pip install APScheduler
-# Uncomment and adapt if needed. Ensure it's initialized correctly with your Flask app.
-
-# from apscheduler.schedulers.background import BackgroundScheduler
-# import atexit
-
-# def cleanup_old_sessions_job():
-#     """Scans TEMP_DIR and SESSIONS for old entries and removes them."""
-#     cutoff_time = time.time() - SESSION_CLEANUP_DELAY
-#     logger.info(f"[Scheduler] Running background cleanup for sessions older than {datetime.datetime.fromtimestamp(cutoff_time)}...")
-#
-#     cleaned_sessions = 0
-#     cleaned_dirs = 0
-#     errors = 0
-#
-#     # --- Clean based on SESSIONS data (more reliable if available) ---
-#     session_ids_to_remove = []
-#     # Iterate over a copy of keys to allow deletion during iteration
-#     for session_id, session_data in list(SESSIONS.items()):
-#         try:
-#             last_accessed = session_data.get('last_accessed', 0)
-#             if last_accessed < cutoff_time:
-#                 logger.info(f"[Scheduler][{session_id}] Session timed out (last access: {datetime.datetime.fromtimestamp(last_accessed)}). Marking for removal.")
-#                 session_ids_to_remove.append(session_id)
-#             # else: logger.debug(f"[Scheduler][{session_id}] Session is recent, skipping.")
-#         except Exception as e:
-#             logger.error(f"[Scheduler][{session_id}] Error checking session timestamp: {e}", exc_info=True)
-#             errors += 1
-#
-#     # Perform removal outside the iteration loop
-#     for session_id in session_ids_to_remove:
-#         try:
-#             session_dir = SESSIONS[session_id].get('directory')
-#             del SESSIONS[session_id] # Remove from memory
-#             cleaned_sessions += 1
-#             logger.info(f"[Scheduler][{session_id}] Removed session data from memory.")
-#             if session_dir and os.path.exists(session_dir):
-#                 try:
-#                     shutil.rmtree(session_dir)
-#                     logger.info(f"[Scheduler][{session_id}] Removed session directory: {session_dir}")
-#                     cleaned_dirs += 1
-#                 except OSError as rm_err:
-#                     logger.error(f"[Scheduler][{session_id}] Error removing directory {session_dir}: {rm_err}", exc_info=True)
-#                     errors += 1
-#             elif session_dir:
-#                  logger.warning(f"[Scheduler][{session_id}] Session directory {session_dir} not found during scheduled cleanup.")
-#         except KeyError:
-#             logger.warning(f"[Scheduler][{session_id}] Session already removed before scheduled cleanup action.")
-#         except Exception as e:
-#             logger.error(f"[Scheduler][{session_id}] Error during scheduled removal: {e}", exc_info=True)
-#             errors += 1
-#
-#     # --- Optional: Scan TEMP_DIR for orphaned directories (less precise) ---
-#     # This can catch directories left behind if the server crashed before cleanup
-#     try:
-#         for item_name in os.listdir(TEMP_DIR):
-#             item_path = os.path.join(TEMP_DIR, item_name)
-#             # Check if it looks like a session ID and is a directory
-#             if os.path.isdir(item_path) and len(item_name) == 36: # Basic check for UUID format
-#                 # Check if session still exists in memory (maybe it's active)
-#                 if item_name not in SESSIONS:
-#                     try:
-#                         dir_mtime = os.path.getmtime(item_path)
-#                         if dir_mtime < cutoff_time:
-#                             logger.warning(f"[Scheduler][{item_name}] Found orphaned directory older than cutoff. Removing: {item_path}")
-#                             shutil.rmtree(item_path)
-#                             cleaned_dirs += 1
-#                         # else: logger.debug(f"[Scheduler][{item_name}] Found orphaned directory, but it's recent. Skipping.")
-#                     except FileNotFoundError:
-#                         pass # Directory might have been removed by another process/request
-#                     except Exception as e:
-#                         logger.error(f"[Scheduler][{item_name}] Error checking/removing orphaned directory {item_path}: {e}", exc_info=True)
-#                         errors += 1
-#     except Exception as e:
-#         logger.error(f"[Scheduler] Error scanning TEMP_DIR for orphans: {e}", exc_info=True)
-#         errors += 1
-#
-#     logger.info(f"[Scheduler] Background cleanup finished. Removed {cleaned_sessions} session data entries, {cleaned_dirs} directories. Encountered {errors} errors.")
-
-# def start_scheduler():
-#     """Initializes and starts the background cleanup scheduler."""
-#     scheduler = BackgroundScheduler(daemon=True)
-#     # Schedule the cleanup job to run periodically (e.g., every 30 minutes)
-#     scheduler.add_job(cleanup_old_sessions_job, 'interval', minutes=30)
-#     try:
-#         scheduler.start()
-#         logger.info("Background session cleanup scheduler started successfully.")
-#     except Exception as e:
-#         logger.error(f"Failed to start background scheduler: {e}", exc_info=True)
-#         return # Don't register shutdown hook if start failed
-#
-#     # Ensure the scheduler shuts down gracefully when the Flask app exits
-#     atexit.register(lambda: scheduler.shutdown())
-
-# --- Initialize Scheduler (if using) ---
-# Call this function once when your Flask application starts.
-# For example, in your app factory or main script:
-# if __name__ == '__main__' and not app.debug: # Don't run scheduler in debug mode usually
-#    start_scheduler()
-# Or if using an app factory:
-# def create_app():
-#     app = Flask(__name__)
-#     # ... configure app ...
-#     app.register_blueprint(img2pdf_bp, url_prefix='/img2pdf') # Example registration
-#     if not app.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
-#          with app.app_context(): # Ensure context if needed by scheduler job
-#              start_scheduler()
-#     return app
-
+# --- Background Cleanup ---
+# Idle sessions older than SESSION_CLEANUP_DELAY and orphaned session directories
+# are removed by the background janitor (app/services/janitor.py), which also
+# enforces UPLOADS_QUOTA_BYTES with least-recently-used eviction.
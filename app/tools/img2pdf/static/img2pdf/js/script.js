@@ -170,7 +170,25 @@ document.addEventListener('DOMContentLoaded', function() {
         });
 
         xhr.open('POST', '/tools/img2pdf/api/upload'); // Ensure this endpoint can handle HEIC
-        xhr.send(formData);
+        if (needsChunkedUpload(imageInput.files)) {
+            // Large batches are sent in resumable chunks first; api/upload then processes them by ID
+            chunkedUpload('/tools/img2pdf', imageInput.files, {
+                onProgress: function(percentComplete) {
+                    uploadProgress.style.width = percentComplete + '%';
+                    uploadProgress.textContent = percentComplete + '%';
+                    uploadProgress.setAttribute('aria-valuenow', percentComplete);
+                }
+            }).then(function(result) {
+                xhr.setRequestHeader('Content-Type', 'application/json');
+                xhr.send(JSON.stringify(result));
+            }).catch(function(err) {
+                hideElement(progressContainer);
+                showError(err.message || '上传失败');
+                generatePdfBtn.disabled = true;
+            });
+        } else {
+            xhr.send(formData);
+        }
     }
 
     // --- SIGNIFICANTLY MODIFIED: Display image previews (handles standard + HEIC) ---
@@ -337,6 +355,28 @@ function displayImagePreviews() {
      }
 
 
+    // Polls a PDF generation job until it finishes, showing per-page progress on the button
+    function waitForJob(statusUrl) {
+        return fetch(statusUrl)
+            .then(response => response.json().then(job => {
+                if (!response.ok) {
+                    throw new Error(job.error || `服务器错误: ${response.statusText} (${response.status})`);
+                }
+                return job;
+            }))
+            .then(job => {
+                if (job.status === 'done') {
+                    return job;
+                }
+                if (job.status === 'failed') {
+                    throw new Error(job.error || 'PDF生成失败');
+                }
+                const progress = job.total ? ` ${job.done}/${job.total}` : '';
+                generatePdfBtn.innerHTML = `<span class="spinner-border spinner-border-sm animate-spin mr-1" role="status" aria-hidden="true"></span> 生成中...${progress}`;
+                return new Promise(resolve => setTimeout(resolve, 1000)).then(() => waitForJob(statusUrl));
+            });
+    }
+
     // --- MODIFIED: Generate PDF (Ensure button state is managed) ---
     function generatePdf() {
         // Check based on previews shown, not just session ID,
@@ -382,23 +422,20 @@ function displayImagePreviews() {
             return response.json();
         })
         .then(data => {
-             // Re-enable button ONLY on success or expected failure
-             generatePdfBtn.disabled = false; // Re-enable before checking success
+            if (!data.success) {
+                throw new Error(data.error || 'PDF生成失败');
+            }
+            // Generation runs as a background job on the server; poll until it is done
+            return waitForJob(data.status_url);
+        })
+        .then(job => {
+            generatePdfBtn.disabled = false;
             generatePdfBtn.innerHTML = '生成PDF'; // Restore text
 
-            if (data.success) {
-                // Set download link using session ID
-                downloadPdfBtn.href = `/tools/img2pdf/api/download/${currentSessionId}`; // Ensure this endpoint works
-                showElement(pdfResultContainer);
-                hideError(); // Hide previous errors on success
-
-                // No automatic cleanup - let user download first.
-                // downloadPdfBtn.onclick = () => { setTimeout(cleanup, 3000); }; // Example if cleanup is needed
-            } else {
-                showError(data.error || 'PDF生成失败');
-                 hideElement(pdfResultContainer); // Hide result container on error
-                 generatePdfBtn.disabled = false; // Ensure button is enabled on failure
-            }
+            // The finished job links to the download endpoint of this session
+            downloadPdfBtn.href = job.download_url;
+            showElement(pdfResultContainer);
+            hideError(); // Hide previous errors on success
         })
         .catch(error => {
             console.error("Generate PDF Error:", error);
@@ -0,0 +1,118 @@
+import io
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from PyPDF2 import PdfReader
+
+# 每个 worker 进程缓存的 PDF 字节数上限 (已解析的对象另计)
+DEFAULT_CACHE_BYTES = int(os.environ.get('PDFPICK_READER_CACHE_BYTES', 128 * 1024 * 1024))
+# 每个 worker 进程缓存的 reader 个数上限: 解析出的对象可能比 PDF 本身大很多倍, 字节数上限约束不了它们
+DEFAULT_CACHE_ENTRIES = int(os.environ.get('PDFPICK_READER_CACHE_ENTRIES', 8))
+
+
+class _Entry:
+    def __init__(self, path, mtime, reader, size):
+        self.path = path
+        self.mtime = mtime
+        self.reader = reader
+        self.size = size
+        self.lock = threading.Lock()
+
+
+class ReaderCache:
+    """
+    Parsed PdfReader objects per pdfpick session, so extracting another page
+    selection from the same upload does not parse the file again.
+
+    The PDF is read into memory, so cached readers hold no open files. The
+    cache is per process and bounded by max_entries readers and max_bytes of
+    PDF data (least recently used sessions are dropped first); a file larger
+    than max_bytes is parsed on every use as before. The parsed objects are
+    not counted in max_bytes, which is why the number of readers is bounded
+    too.
+
+    Sessions may be removed by another process (api/cleanup on another
+    worker, the janitor), so every lookup re-checks the files of all cached
+    entries: an entry is replaced when its file changed and dropped when the
+    file is gone.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES, max_entries=DEFAULT_CACHE_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()  # { session_id: _Entry }
+        self._bytes = 0
+
+    def _load(self, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        return PdfReader(io.BytesIO(data)), len(data)
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _drop_stale(self):
+        """Drops entries whose file was removed or changed (e.g. the session expired in another process)."""
+        with self._lock:
+            entries = list(self._cache.items())
+        stale = [session_id for session_id, entry in entries if self._mtime(entry.path) != entry.mtime]
+        if stale:
+            with self._lock:
+                for session_id in stale:
+                    entry = self._cache.pop(session_id, None)
+                    if entry is not None:
+                        self._bytes -= entry.size
+
+    def _lookup(self, session_id, path):
+        self._drop_stale()
+        mtime = os.stat(path).st_mtime_ns
+        with self._lock:
+            entry = self._cache.get(session_id)
+            if entry is not None and entry.path == path and entry.mtime == mtime:
+                self._cache.move_to_end(session_id)
+                return entry
+        reader, size = self._load(path)
+        entry = _Entry(path, mtime, reader, size)
+        if size > self.max_bytes or self.max_entries <= 0:
+            return entry
+        with self._lock:
+            previous = self._cache.pop(session_id, None)
+            if previous is not None:
+                self._bytes -= previous.size
+            self._cache[session_id] = entry
+            self._bytes += size
+            while self._bytes > self.max_bytes or len(self._cache) > self.max_entries:
+                _, evicted = self._cache.popitem(last=False)
+                self._bytes -= evicted.size
+        return entry
+
+    @contextmanager
+    def reader(self, session_id, path):
+        """
+        Yields the parsed reader of the PDF at path. PdfReader is not thread-safe,
+        so the reader is locked for the duration of the with block; finish
+        everything that reads from it (including writing pages copied from it)
+        inside the block.
+        """
+        entry = self._lookup(session_id, path)
+        with entry.lock:
+            yield entry.reader
+
+    def discard(self, session_id):
+        """Drops a session's reader (e.g. when the session is cleaned up)."""
+        with self._lock:
+            entry = self._cache.pop(session_id, None)
+            if entry is not None:
+                self._bytes -= entry.size
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._bytes = 0
@@ -1,11 +1,17 @@
-from flask import Blueprint, render_template, request, jsonify, send_file
+from flask import Blueprint, render_template, request, jsonify, send_file, after_this_request
 import os
 import uuid
 import tempfile
 import logging
 import shutil
-from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2 import PdfWriter
 from . import pdfpick_bp
+from app.metrics import register_session_gauge
+from app.services.session_store import create_session_store
+from app.services.janitor import register_session_storage
+from app.services.blob_store import get_blob_store
+from app.services.chunked_upload import ChunkedUploads, UploadError, register_chunked_upload_routes
+from .reader_cache import ReaderCache
 
 # Configure logger
 logger = logging.getLogger(__name__)
@@ -15,8 +21,20 @@ TEMP_DIR = os.path.join(tempfile.gettempdir(), 'pdfpick_uploads')
 if not os.path.exists(TEMP_DIR):
     os.makedirs(TEMP_DIR)
 
-# Session storage
-SESSIONS = {}
+SESSION_TTL = 3600  # Seconds before an inactive session expires
+
+# Session storage (shared by all worker processes, see app/services/session_store.py)
+SESSIONS = create_session_store('pdfpick', ttl=SESSION_TTL)
+register_session_gauge('pdfpick', lambda: len(SESSIONS))
+# Expired sessions and their directories are removed by the background janitor
+register_session_storage('pdfpick', TEMP_DIR, SESSIONS)
+
+# 大文件分块上传 (api/upload/init, api/upload/<upload_id>), 完成后再调用 api/upload
+CHUNKED_UPLOADS = ChunkedUploads('pdfpick', TEMP_DIR, ttl=SESSION_TTL)
+register_chunked_upload_routes(pdfpick_bp, CHUNKED_UPLOADS)
+
+# 解析过的 PdfReader 按会话缓存, 换一组页面重新提取时不必重新解析整个文件
+READERS = ReaderCache()
 
 @pdfpick_bp.route('/')
 def index():
@@ -24,45 +42,81 @@ def index():
 
 @pdfpick_bp.route('/api/upload', methods=['POST'])
 def upload_pdf():
-    if 'pdf' not in request.files:
-        return jsonify({'error': '未提供PDF文件'}), 400
-    
-    pdf_file = request.files['pdf']
-    
-    if not pdf_file:
-        return jsonify({'error': '未提供PDF文件'}), 400
+    # 分块上传的文件: JSON {session_id, upload_ids}, 文件已在 <session_dir>/incoming/ 下
+    chunked = None
+    if request.is_json:
+        data = request.get_json(silent=True) or {}
+        upload_ids = data.get('upload_ids')
+        if isinstance(upload_ids, list) and len(upload_ids) > 1:
+            return jsonify({'error': '一次只能上传一个PDF文件'}), 400
+        try:
+            completed = CHUNKED_UPLOADS.completed_files(data.get('session_id'), data.get('upload_ids'))
+        except UploadError as e:
+            return e.to_response()
+        chunked = (data['session_id'], data['upload_ids'])
+        filename, part_path = completed[0]
+
+        @after_this_request
+        def _finish_chunked_upload(response):
+            CHUNKED_UPLOADS.finish(*chunked)
+            return response
+    else:
+        if 'pdf' not in request.files:
+            return jsonify({'error': '未提供PDF文件'}), 400
+        
+        pdf_file = request.files['pdf']
+        
+        if not pdf_file:
+            return jsonify({'error': '未提供PDF文件'}), 400
+        filename = pdf_file.filename
     
     # Check if it's a PDF
-    if not pdf_file.filename.lower().endswith('.pdf'):
+    if not filename.lower().endswith('.pdf'):
         return jsonify({'error': '请上传PDF格式的文件'}), 400
     
     # Generate a session id and directory for this upload
-    session_id = str(uuid.uuid4())
+    session_id = chunked[0] if chunked else str(uuid.uuid4())
     session_dir = os.path.join(TEMP_DIR, session_id)
-    os.makedirs(session_dir)
+    os.makedirs(session_dir, exist_ok=True)
     
     try:
         # Save PDF to the temporary directory
-        pdf_path = os.path.join(session_dir, f"original_{pdf_file.filename}")
-        pdf_file.save(pdf_path)
+        pdf_path = os.path.join(session_dir, f"original_{filename}")
+        # Store content-addressed so repeated uploads of the same PDF share one copy
+        blob_store = get_blob_store()
+        if chunked:
+            digest = blob_store.put_file(part_path)
+            if not blob_store.link_into(digest, pdf_path):
+                shutil.move(part_path, pdf_path)
+        else:
+            digest = blob_store.put_stream(pdf_file.stream)
+            if not blob_store.link_into(digest, pdf_path):
+                pdf_file.stream.seek(0)
+                pdf_file.save(pdf_path)
         
-        # Open the PDF to get page count
-        with open(pdf_path, "rb") as f:
-            pdf = PdfReader(f)
-            page_count = len(pdf.pages)
+        # Open the PDF to get page count (cached per content digest)
+        cached = blob_store.get_derived(digest, 'pdfpick.page_count')
+        if cached:
+            page_count = cached[1]['page_count']
+        else:
+            # 解析结果留在缓存中, 供之后的提取使用
+            with READERS.reader(session_id, pdf_path) as pdf:
+                page_count = len(pdf.pages)
+            blob_store.put_derived(digest, 'pdfpick.page_count', meta={'page_count': page_count})
         
         # Store session info
-        SESSIONS[session_id] = {
+        SESSIONS.set(session_id, {
             'pdf_path': pdf_path,
-            'filename': pdf_file.filename,
+            'filename': filename,
             'page_count': page_count,
-            'directory': session_dir
-        }
+            'directory': session_dir,
+            'digest': digest
+        })
         
         return jsonify({
             'success': True,
             'session_id': session_id,
-            'filename': pdf_file.filename,
+            'filename': filename,
             'page_count': page_count
         })
     except Exception as e:
@@ -70,8 +124,8 @@ def upload_pdf():
         # Clean up
         if os.path.exists(session_dir):
             shutil.rmtree(session_dir)
-        if session_id in SESSIONS:
-            del SESSIONS[session_id]
+        SESSIONS.delete(session_id)
+        READERS.discard(session_id)
             
         return jsonify({'error': f'处理PDF时出错: {str(e)}'}), 500
 
@@ -82,11 +136,10 @@ def extract_pages():
     page_ranges = data.get('page_ranges', [])
     page_list = data.get('page_list', [])
     
-    if not session_id or session_id not in SESSIONS:
+    session = SESSIONS.get(session_id, touch=True) if session_id else None
+    if session is None:
         return jsonify({'error': '无效的会话ID'}), 400
     
-    session = SESSIONS[session_id]
-    
     if not page_ranges and not page_list:
         return jsonify({'error': '未指定要提取的页面'}), 400
     
@@ -127,23 +180,31 @@ def extract_pages():
         # Create output PDF
         output_path = os.path.join(session['directory'], f"extracted_{session['filename']}")
         
-        # Extract pages
-        pdf_writer = PdfWriter()
-        with open(session['pdf_path'], 'rb') as f:
-            pdf_reader = PdfReader(f)
+        # 相同内容、相同页面选择的提取结果直接复用
+        blob_store = get_blob_store()
+        source_digest = session.get('digest')
+        recipe = f"pdfpick.extract:{','.join(map(str, pages_to_extract))}"
+        cached = blob_store.get_derived(source_digest, recipe) if source_digest else None
+        if not (cached and blob_store.link_into(cached[0], output_path, replace=True)):
+            # Extract pages
+            pdf_writer = PdfWriter()
+            with READERS.reader(session_id, session['pdf_path']) as pdf_reader:
+                
+                # Add selected pages to the output
+                for page_num in pages_to_extract:
+                    # Adjust for 0-based indexing
+                    pdf_writer.add_page(pdf_reader.pages[page_num - 1])
             
-            # Add selected pages to the output
-            for page_num in pages_to_extract:
-                # Adjust for 0-based indexing
-                pdf_writer.add_page(pdf_reader.pages[page_num - 1])
-        
-        # 将写入操作移到外面，使用单独的 with 语句
-        with open(output_path, 'wb') as output_file:
-            pdf_writer.write(output_file)
+                # 写入时仍会从 reader 读取对象, 需要在持有 reader 时完成
+                # output_path 可能是上一次提取结果在 blob 存储中的硬链接, 不能原地覆盖
+                with blob_store.replacing(output_path) as output_file:
+                    pdf_writer.write(output_file)
+
+            if source_digest:
+                blob_store.put_derived(source_digest, recipe, blob_store.put_file(output_path))
         
         # Store output path in session
-        session['output_path'] = output_path
-        session['extracted_pages'] = pages_to_extract
+        SESSIONS.update(session_id, output_path=output_path, extracted_pages=pages_to_extract)
         
         return jsonify({
             'success': True,
@@ -158,10 +219,10 @@ def extract_pages():
 
 @pdfpick_bp.route('/api/download/<session_id>')
 def download_pdf(session_id):
-    if not session_id or session_id not in SESSIONS:
+    session = SESSIONS.get(session_id, touch=True) if session_id else None
+    if session is None:
         return jsonify({'error': '无效的会话ID'}), 400
     
-    session = SESSIONS[session_id]
     if 'output_path' not in session:
         return jsonify({'error': '未找到提取的PDF文件'}), 404
     
@@ -183,15 +244,15 @@ def cleanup():
     data = request.get_json()
     session_id = data.get('session_id')
     
-    if session_id and session_id in SESSIONS:
+    if session_id:
         try:
-            # Remove session directory and all its contents
-            session_dir = SESSIONS[session_id]['directory']
-            if os.path.exists(session_dir):
-                shutil.rmtree(session_dir)
-            
             # Remove session data
-            del SESSIONS[session_id]
+            session = SESSIONS.delete(session_id)
+            READERS.discard(session_id)
+
+            # Remove session directory and all its contents
+            if session and os.path.exists(session['directory']):
+                shutil.rmtree(session['directory'])
         except Exception as e:
             logger.error(f"Error cleaning up session {session_id}: {str(e)}")
     
@@ -141,7 +141,24 @@ document.addEventListener('DOMContentLoaded', function() {
         });
         
         xhr.open('POST', '/tools/pdfpick/api/upload');
-        xhr.send(formData);
+        if (needsChunkedUpload(pdfInput.files)) {
+            // 大文件先分块上传 (可断点续传), 再由 api/upload 处理
+            chunkedUpload('/tools/pdfpick', pdfInput.files, {
+                onProgress: function(percentComplete) {
+                    uploadProgress.style.width = percentComplete + '%';
+                    uploadProgress.textContent = percentComplete + '%';
+                    uploadProgress.setAttribute('aria-valuenow', percentComplete);
+                }
+            }).then(function(result) {
+                xhr.setRequestHeader('Content-Type', 'application/json');
+                xhr.send(JSON.stringify(result));
+            }).catch(function(err) {
+                hideElement(progressContainer);
+                showError(err.message || '上传失败');
+            });
+        } else {
+            xhr.send(formData);
+        }
     }
     
     // Extract pages from PDF
@@ -0,0 +1,94 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+from .client import Client
+from .fixtures import Fixtures, IMAGE_KINDS, IMAGE_SIZES, PDF_PAGE_COUNTS
+from .runner import run_case, environment_info, save_results, format_table, format_comparison
+from .scenarios import build_scenarios
+from .server import LocalServer, PROJECT_ROOT
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+TOOLS = ('image_converter', 'img2pdf', 'pdfpick')
+
+
+def _csv(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def _ints(value):
+    return [int(item) for item in _csv(value)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks',
+        description="End-to-end HTTP benchmark of the image_converter, img2pdf and pdfpick flows.")
+    parser.add_argument('--url', help="Benchmark an already running server instead of starting one under gunicorn.")
+    parser.add_argument('--pid', type=int, help="With --url: server (master) pid to sample peak RSS from.")
+    parser.add_argument('--workers', type=int, help="WEB_CONCURRENCY for the local server (default: gunicorn.conf.py).")
+    parser.add_argument('--threads', type=int, help="WEB_THREADS for the local server (default: gunicorn.conf.py).")
+    parser.add_argument('--tools', type=_csv, default=list(TOOLS), help=f"Comma-separated subset of {','.join(TOOLS)}.")
+    parser.add_argument('--kinds', type=_csv, default=list(IMAGE_KINDS), help=f"Image kinds ({','.join(IMAGE_KINDS)}).")
+    parser.add_argument('--sizes', type=_csv, default=['small', 'medium'], help=f"Image sizes ({','.join(IMAGE_SIZES)}).")
+    parser.add_argument('--pdf-pages', type=_ints, default=list(PDF_PAGE_COUNTS), help="PDF page counts.")
+    parser.add_argument('--concurrency', type=_ints, default=[1, 4], help="Comma-separated concurrency levels.")
+    parser.add_argument('--iterations', type=int, default=20, help="Flows per scenario and concurrency level.")
+    parser.add_argument('--warmup', type=int, default=1, help="Untimed flows before each measurement.")
+    parser.add_argument('--fixtures-dir', default=os.path.join(BENCHMARKS_DIR, 'fixtures'),
+                        help="Where generated inputs are cached.")
+    parser.add_argument('--output', help="Results file (default: benchmarks/results/<timestamp>.json).")
+    parser.add_argument('--compare', help="Previous results file to compare against.")
+    args = parser.parse_args(argv)
+
+    unknown = set(args.tools) - set(TOOLS)
+    if unknown:
+        parser.error(f"unknown tools: {', '.join(sorted(unknown))}")
+
+    fixtures = Fixtures(args.fixtures_dir)
+    print("Preparing fixtures...", file=sys.stderr)
+    scenarios = build_scenarios(fixtures, args.tools, args.kinds, args.sizes, args.pdf_pages)
+
+    server = None
+    if args.url:
+        base_url, server_pid = args.url.rstrip('/'), args.pid
+    else:
+        server = LocalServer(workers=args.workers, threads=args.threads,
+                             log_path=os.path.join(BENCHMARKS_DIR, 'results', 'server.log'))
+        os.makedirs(os.path.dirname(server.log_path), exist_ok=True)
+        print(f"Starting gunicorn on {server.url}...", file=sys.stderr)
+        server.start()
+        base_url, server_pid = server.url, server.pid
+
+    cases = []
+    try:
+        client = Client(base_url)
+        for scenario in scenarios:
+            for level, concurrency in enumerate(args.concurrency):
+                print(f"Running {scenario.name} (concurrency={concurrency})...", file=sys.stderr)
+                cases.append(run_case(client, scenario, args.iterations, concurrency, warmup=args.warmup,
+                                      server_pid=server_pid, first_iteration=level * args.iterations))
+    finally:
+        if server is not None:
+            server.stop()
+
+    results = {
+        'environment': environment_info(),
+        'settings': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'cases': cases,
+    }
+    output = args.output or os.path.join(BENCHMARKS_DIR, 'results', time.strftime('%Y%m%d-%H%M%S') + '.json')
+    save_results(output, results)
+
+    print(format_table(cases))
+    print(f"\nResults saved to {os.path.relpath(output, PROJECT_ROOT)}")
+    if args.compare:
+        with open(args.compare) as f:
+            print('\n' + format_comparison(cases, json.load(f)))
+    return 1 if any(case['errors'] for case in cases) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
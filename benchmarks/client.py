@@ -0,0 +1,82 @@
+import os
+import json
+import uuid
+import threading
+import mimetypes
+import http.client
+from urllib.parse import urlsplit
+
+
+class HTTPError(Exception):
+    def __init__(self, method, path, status, body):
+        super().__init__(f"{method} {path} -> {status}: {body[:200]!r}")
+        self.status = status
+
+
+class Client:
+    """
+    Minimal keep-alive HTTP client (standard library only).
+
+    Each thread gets its own connection, so one Client can be shared by the
+    worker threads of a benchmark run.
+    """
+
+    def __init__(self, base_url, timeout=300):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return conn
+
+    def request(self, method, path, body=None, headers=None):
+        """Returns (status, body bytes). Reconnects once if a kept-alive connection was closed."""
+        for attempt in (0, 1):
+            conn = self._connection()
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                response = conn.getresponse()
+                data = response.read()
+                if response.getheader('Connection', '').lower() == 'close':
+                    conn.close()
+                    self._local.conn = None
+                return response.status, data
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+
+    def _checked(self, method, path, body=None, headers=None):
+        status, data = self.request(method, path, body, headers)
+        if status >= 400:
+            raise HTTPError(method, path, status, data)
+        return data
+
+    def get(self, path):
+        return self._checked('GET', path)
+
+    def post_json(self, path, payload):
+        data = self._checked('POST', path, json.dumps(payload).encode(), {'Content-Type': 'application/json'})
+        return json.loads(data)
+
+    def post_files(self, path, field, file_paths):
+        """POSTs multipart/form-data with each file under field; returns the decoded JSON response."""
+        boundary = uuid.uuid4().hex
+        parts = []
+        for file_path in file_paths:
+            filename = os.path.basename(file_path)
+            content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            with open(file_path, 'rb') as f:
+                content = f.read()
+            parts.append(
+                f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+                f'Content-Type: {content_type}\r\n\r\n'.encode() + content + b'\r\n')
+        body = b''.join(parts) + f'--{boundary}--\r\n'.encode()
+        data = self._checked('POST', path, body, {'Content-Type': f'multipart/form-data; boundary={boundary}'})
+        return json.loads(data)
@@ -0,0 +1,133 @@
+import io
+import os
+import zlib
+import random
+
+from PIL import Image, ImageDraw
+
+try:
+    import pillow_heif
+    pillow_heif.register_heif_opener()
+except ImportError:  # 没有 pillow_heif 时跳过 HEIC 样本
+    pillow_heif = None
+
+# 图片尺寸档位: 手机截图 / 常见相机 / 1200 万像素手机照片
+IMAGE_SIZES = {
+    'small': (640, 480),
+    'medium': (2048, 1536),
+    'large': (4032, 3024),
+}
+IMAGE_KINDS = ('jpeg', 'png', 'rgba', 'heic')
+PDF_PAGE_COUNTS = (10, 200, 2000)
+
+
+def _synthetic_image(size, mode, seed):
+    """A photo-like image: smooth gradients plus shapes and noise, so encoders do real work."""
+    width, height = size
+    rng = random.Random(seed)
+    # 先在小尺寸上画, 再放大: 生成速度快且有平滑过渡
+    base = Image.new('RGB', (max(1, width // 8), max(1, height // 8)))
+    draw = ImageDraw.Draw(base)
+    for _ in range(24):
+        x0, y0 = rng.randrange(base.width), rng.randrange(base.height)
+        x1, y1 = x0 + rng.randrange(1, base.width), y0 + rng.randrange(1, base.height)
+        draw.ellipse((x0, y0, x1, y1), fill=tuple(rng.randrange(256) for _ in range(3)))
+    img = base.resize(size, Image.BILINEAR)
+    noise = Image.effect_noise(size, 24).convert('RGB')
+    img = Image.blend(img, noise, 0.15)
+    if mode == 'RGBA':
+        alpha = Image.linear_gradient('L').resize(size)
+        img.putalpha(alpha)
+    return img
+
+
+def _encode_image(kind, size, seed):
+    img = _synthetic_image(size, 'RGBA' if kind == 'rgba' else 'RGB', seed)
+    buf = io.BytesIO()
+    if kind == 'jpeg':
+        img.save(buf, format='JPEG', quality=90)
+    elif kind in ('png', 'rgba'):
+        img.save(buf, format='PNG')
+    elif kind == 'heic':
+        img.save(buf, format='HEIF', quality=80)
+    return buf.getvalue()
+
+
+IMAGE_EXTENSIONS = {'jpeg': '.jpg', 'png': '.png', 'rgba': '.png', 'heic': '.heic'}
+
+
+def _pdf_object(num, body):
+    return f"{num} 0 obj\n".encode() + body + b"\nendobj\n"
+
+
+def build_pdf(page_count, seed=0):
+    """A text/vector PDF with page_count pages (no third-party writer needed)."""
+    rng = random.Random(seed)
+    font_num = 3
+    first_page_num = 4
+    objects = {
+        1: b"<< /Type /Catalog /Pages 2 0 R >>",
+        font_num: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    }
+    kids = []
+    for i in range(page_count):
+        page_num = first_page_num + 2 * i
+        content_num = page_num + 1
+        kids.append(f"{page_num} 0 R")
+        lines = [f"BT /F1 24 Tf 72 740 Td (Benchmark page {i + 1} of {page_count}) Tj ET"]
+        for row in range(30):
+            words = ' '.join(f"w{rng.randrange(10 ** 6)}" for _ in range(8))
+            lines.append(f"BT /F1 10 Tf 72 {700 - row * 20} Td ({words}) Tj ET")
+        for _ in range(10):
+            x, y = rng.randrange(50, 500), rng.randrange(50, 700)
+            lines.append(f"{rng.random():.2f} {rng.random():.2f} {rng.random():.2f} rg {x} {y} 40 20 re f")
+        stream = zlib.compress('\n'.join(lines).encode())
+        objects[page_num] = (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 {font_num} 0 R >> >> /Contents {content_num} 0 R >>").encode()
+        objects[content_num] = (
+            f"<< /Length {len(stream)} /Filter /FlateDecode >>\nstream\n".encode() + stream + b"\nendstream")
+    objects[2] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {page_count} >>".encode()
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = {}
+    for num in sorted(objects):
+        offsets[num] = out.tell()
+        out.write(_pdf_object(num, objects[num]))
+    xref_offset = out.tell()
+    size = max(objects) + 1
+    out.write(f"xref\n0 {size}\n0000000000 65535 f \n".encode())
+    for num in range(1, size):
+        out.write(f"{offsets[num]:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode())
+    return out.getvalue()
+
+
+class Fixtures:
+    """Synthetic benchmark inputs, generated once and cached on disk under directory."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _cached(self, name, build):
+        path = os.path.join(self.directory, name)
+        if not os.path.exists(path):
+            data = build()
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return path
+
+    def image(self, kind, size_name):
+        """Returns the path of a synthetic image of the given kind (jpeg/png/rgba/heic) and size."""
+        if kind == 'heic' and pillow_heif is None:
+            raise RuntimeError("HEIC fixtures require pillow_heif")
+        size = IMAGE_SIZES[size_name]
+        name = f"{kind}_{size_name}{IMAGE_EXTENSIONS[kind]}"
+        return self._cached(name, lambda: _encode_image(kind, size, seed=zlib.crc32(name.encode())))
+
+    def pdf(self, page_count):
+        return self._cached(f"doc_{page_count}p.pdf", lambda: build_pdf(page_count, seed=page_count))
@@ -0,0 +1,111 @@
+"""
+HEIC normalization benchmark for img2pdf: the generic Pillow path (full
+decode with pillow_heif's default options, resize, re-encode) against
+app.tools.img2pdf.normalize (thumbnail draft, no depth/aux images, decoder
+threads sized to the pool), both run on a process pool like api/upload.
+
+    python -m benchmarks.heic --sizes medium,large --images 16 --workers 4
+"""
+import os
+import io
+import sys
+import time
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+from .fixtures import Fixtures, IMAGE_SIZES, _synthetic_image, pillow_heif
+from .runner import summarize
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+MODES = ('generic', 'tuned')
+
+
+def _preview_heic(fixtures, size_name, preview):
+    """Like an iPhone photo that also embeds a large preview image."""
+    def build():
+        buf = io.BytesIO()
+        _synthetic_image(IMAGE_SIZES[size_name], 'RGB', seed=preview).save(
+            buf, format='HEIF', quality=80, thumbnails=[preview])
+        return buf.getvalue()
+    return fixtures._cached(f"heic_{size_name}_preview{preview}.heic", build)
+
+
+def _init_generic():
+    # pillow_heif as registered before: default options (4 decoder threads, depth and aux images read)
+    pillow_heif.register_heif_opener(thumbnails=True, depth_images=True, aux_images=True, decode_threads=4)
+
+
+def _generic(source_path, dest_path, max_dimension, decode_threads):
+    start = time.perf_counter()
+    with Image.open(source_path) as img:
+        img.load()
+        scale = max_dimension / max(img.size)
+        if scale < 1:
+            img = img.resize((int(img.width * scale), int(img.height * scale)), Image.Resampling.LANCZOS)
+        img.convert('RGB').save(dest_path, format='JPEG', quality=90)
+    return time.perf_counter() - start
+
+
+def _init_tuned(decode_threads):
+    # Same as the img2pdf pool initializer
+    from app.tools.img2pdf.normalize import configure_heif
+    configure_heif(decode_threads)
+
+
+def _tuned(source_path, dest_path, max_dimension, decode_threads):
+    from app.tools.img2pdf.normalize import normalize_image
+    start = time.perf_counter()
+    normalize_image(source_path, dest_path, '.heic', '[bench]')
+    return time.perf_counter() - start
+
+
+def run(path, mode, images, workers, decode_threads, work_dir):
+    """Normalizes `images` copies of path on a fresh pool. Returns (images/s, per-image latencies)."""
+    from app.tools.img2pdf.normalize import MAX_DIMENSION
+    fn = _generic if mode == 'generic' else _tuned
+    initializer, initargs = (_init_generic, ()) if mode == 'generic' else (_init_tuned, (decode_threads,))
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as pool:
+        # 预热: 进程启动和模块导入不计入
+        list(pool.map(fn, [path] * workers, [os.path.join(work_dir, f"warm{i}") for i in range(workers)],
+                      [MAX_DIMENSION] * workers, [decode_threads] * workers))
+        start = time.perf_counter()
+        latencies = list(pool.map(fn, [path] * images, [os.path.join(work_dir, f"{mode}{i}") for i in range(images)],
+                                  [MAX_DIMENSION] * images, [decode_threads] * images))
+        elapsed = time.perf_counter() - start
+    return images / elapsed, latencies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.heic', description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='medium,large', help=f"HEIC sizes ({','.join(IMAGE_SIZES)}).")
+    parser.add_argument('--images', type=int, default=16, help="Images per measurement.")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Pool size (IMG2PDF_WORKERS).")
+    parser.add_argument('--preview', type=int, default=2048,
+                        help="Also measure a large HEIC with an embedded preview of this size (0 to skip).")
+    parser.add_argument('--fixtures-dir', default=os.path.join(BENCHMARKS_DIR, 'fixtures'))
+    args = parser.parse_args(argv)
+    if pillow_heif is None:
+        parser.error("pillow_heif is not installed")
+
+    fixtures = Fixtures(args.fixtures_dir)
+    cases = [(f"heic_{size}", fixtures.image('heic', size)) for size in args.sizes.split(',') if size]
+    if args.preview:
+        cases.append((f"heic_large_preview{args.preview}", _preview_heic(fixtures, 'large', args.preview)))
+    decode_threads = max(1, (os.cpu_count() or 1) // args.workers)
+
+    print(f"{'case':<28}{'mode':<9}{'images/s':>9}{'mean':>9}{'p95':>9}")
+    with tempfile.TemporaryDirectory() as work_dir:
+        for name, path in cases:
+            for mode in MODES:
+                throughput, latencies = run(path, mode, args.images, args.workers, decode_threads, work_dir)
+                stats = summarize(latencies)
+                print(f"{name:<28}{mode:<9}{throughput:>9.2f}"
+                      f"{stats['mean'] * 1000:>7.0f}ms{stats['p95'] * 1000:>7.0f}ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,178 @@
+import os
+import json
+import time
+import platform
+import subprocess
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from .server import RSSSampler, PROJECT_ROOT
+
+
+def percentile(values, q):
+    """Linear-interpolated percentile (q in 0..100) of a non-empty list."""
+    ordered = sorted(values)
+    if len(ordered) == 1:
+        return ordered[0]
+    rank = (len(ordered) - 1) * q / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def summarize(latencies):
+    if not latencies:
+        return None
+    return {
+        'count': len(latencies),
+        'mean': sum(latencies) / len(latencies),
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'max': max(latencies),
+    }
+
+
+def run_case(client, scenario, iterations, concurrency, warmup=1, server_pid=None, first_iteration=0):
+    """
+    Runs scenario.run iterations times on concurrency threads.
+
+    Iterations are numbered from first_iteration; scenarios vary their
+    parameters by iteration, so distinct numbers avoid derived-cache hits
+    across concurrency levels.
+
+    Returns a dict with throughput (flows/s), latency summaries (seconds) for
+    the whole flow and each step, the error count and the server's peak RSS.
+    """
+    for i in range(warmup):
+        scenario.run(client, -1 - i, _ignore_step)
+
+    lock = threading.Lock()
+    flow_latencies = []
+    step_latencies = {}
+    errors = []
+
+    def one(iteration):
+        timings = {}
+
+        @contextmanager
+        def step(name):
+            start = time.perf_counter()
+            yield
+            timings[name] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        try:
+            scenario.run(client, iteration, step)
+        except Exception as e:
+            with lock:
+                errors.append(str(e))
+            return
+        elapsed = time.perf_counter() - start
+        with lock:
+            flow_latencies.append(elapsed)
+            for name, value in timings.items():
+                step_latencies.setdefault(name, []).append(value)
+
+    with RSSSampler(server_pid) as rss:
+        wall_start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(one, range(first_iteration, first_iteration + iterations)))
+        wall_time = time.perf_counter() - wall_start
+
+    return {
+        'scenario': scenario.name,
+        'tool': scenario.tool,
+        'concurrency': concurrency,
+        'iterations': iterations,
+        'errors': len(errors),
+        'error_samples': errors[:5],
+        'wall_time': wall_time,
+        'throughput': len(flow_latencies) / wall_time if wall_time else 0.0,
+        'latency': {
+            'flow': summarize(flow_latencies),
+            **{name: summarize(values) for name, values in step_latencies.items()},
+        },
+        'peak_rss_bytes': rss.peak or None,
+    }
+
+
+@contextmanager
+def _ignore_step(name):
+    yield
+
+
+def environment_info():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_ROOT,
+                                capture_output=True, text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'commit': commit or None,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def save_results(path, results):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+def _case_key(case):
+    return case['scenario'], case['concurrency']
+
+
+def _mb(value):
+    return f"{value / (1024 * 1024):.0f}MB" if value else '-'
+
+
+def format_table(cases):
+    header = f"{'scenario':<40}{'conc':>5}{'ok/err':>9}{'flows/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'peak RSS':>10}"
+    lines = [header, '-' * len(header)]
+    for case in cases:
+        flow = case['latency']['flow'] or {}
+        ok_err = f"{case['iterations'] - case['errors']}/{case['errors']}"
+        lines.append(
+            f"{case['scenario']:<40}{case['concurrency']:>5}{ok_err:>9}{case['throughput']:>9.2f}"
+            f"{flow.get('p50', 0) * 1000:>7.0f}ms{flow.get('p95', 0) * 1000:>7.0f}ms{flow.get('p99', 0) * 1000:>7.0f}ms"
+            f"{_mb(case['peak_rss_bytes']):>10}")
+        for name, summary in case['latency'].items():
+            if name == 'flow' or not summary:
+                continue
+            lines.append(
+                f"  {name:<38}{'':>5}{'':>9}{'':>9}"
+                f"{summary['p50'] * 1000:>7.0f}ms{summary['p95'] * 1000:>7.0f}ms{summary['p99'] * 1000:>7.0f}ms")
+    return '\n'.join(lines)
+
+
+def _change(new, old):
+    if not old:
+        return '     n/a'
+    return f"{(new - old) / old * 100:+7.1f}%"
+
+
+def format_comparison(cases, baseline):
+    """Compares throughput, p95 latency and peak RSS against a previous results file."""
+    previous = {_case_key(case): case for case in baseline['cases']}
+    header = f"{'scenario':<40}{'conc':>5}{'flows/s':>10}{'p95':>10}{'peak RSS':>10}"
+    lines = [f"Compared with {baseline['environment'].get('commit')} ({baseline['environment'].get('timestamp')}):",
+             header, '-' * len(header)]
+    for case in cases:
+        old = previous.get(_case_key(case))
+        if old is None:
+            lines.append(f"{case['scenario']:<40}{case['concurrency']:>5}  (not in baseline)")
+            continue
+        new_p95 = (case['latency']['flow'] or {}).get('p95')
+        old_p95 = (old['latency']['flow'] or {}).get('p95')
+        lines.append(
+            f"{case['scenario']:<40}{case['concurrency']:>5}"
+            f"{_change(case['throughput'], old['throughput']):>10}"
+            f"{_change(new_p95, old_p95) if new_p95 else '     n/a':>10}"
+            f"{_change(case['peak_rss_bytes'] or 0, old['peak_rss_bytes']):>10}")
+    return '\n'.join(lines)
@@ -0,0 +1,106 @@
+import json
+import time
+
+from .fixtures import IMAGE_SIZES
+
+JOB_POLL_INTERVAL = 0.05  # 轮询后台任务状态的间隔 (秒)
+
+
+class Scenario:
+    """
+    One benchmark case: a complete user flow against one tool with one input.
+
+    run(client, iteration, step) performs the flow once; each HTTP call is
+    wrapped in `with step('name'):` so per-step latencies are recorded next
+    to the latency of the whole flow.
+    """
+
+    def __init__(self, name, tool, run):
+        self.name = name
+        self.tool = tool
+        self.run = run
+
+
+def image_converter_scenario(fixtures, kind, size_name):
+    path = fixtures.image(kind, size_name)
+    width, height = IMAGE_SIZES[size_name]
+    output_format = 'png' if kind == 'rgba' else 'jpeg'
+
+    def run(client, iteration, step):
+        with step('upload'):
+            uploaded = client.post_files('/tools/image_converter/api/upload', 'image', [path])
+        # 每次迭代的尺寸略有不同, 测的是真实处理而不是派生结果缓存
+        operations = [
+            {'type': 'rotate', 'angle': 90},
+            {'type': 'resize', 'width': width // 2 - iteration % 64, 'height': height // 2},
+            {'type': 'grayscale'},
+        ]
+        with step('edit'):
+            edited = client.post_json('/tools/image_converter/api/edit', {
+                'filename': uploaded['filename'], 'operations': operations, 'format': output_format})
+        with step('fetch'):
+            client.get(edited['url'])
+
+    return Scenario(f'image_converter/{kind}/{size_name}', 'image_converter', run)
+
+
+def img2pdf_scenario(fixtures, kinds, size_name):
+    paths = [fixtures.image(kind, size_name) for kind in kinds]
+
+    def run(client, iteration, step):
+        with step('upload'):
+            uploaded = client.post_files('/tools/img2pdf/api/upload', 'images', paths)
+        session_id = uploaded['session_id']
+        # api/generate 只是把任务放入队列, 轮询到任务结束才算生成完成
+        with step('generate'):
+            queued = client.post_json('/tools/img2pdf/api/generate', {'session_id': session_id})
+            while True:
+                job = json.loads(client.get(queued['status_url']))
+                if job['status'] == 'done':
+                    break
+                if job['status'] == 'failed':
+                    raise RuntimeError(f"img2pdf job {queued['job_id']} failed: {job['error']}")
+                time.sleep(JOB_POLL_INTERVAL)
+        # 下载完成后服务器会清理会话
+        with step('download'):
+            client.get(job['download_url'])
+
+    return Scenario(f"img2pdf/{'+'.join(kinds)}/{size_name}", 'img2pdf', run)
+
+
+def pdfpick_scenario(fixtures, page_count):
+    path = fixtures.pdf(page_count)
+
+    def run(client, iteration, step):
+        with step('upload'):
+            uploaded = client.post_files('/tools/pdfpick/api/upload', 'pdf', [path])
+        session_id = uploaded['session_id']
+        # 一段连续范围加上按迭代变化的零散页面, 避开提取结果缓存
+        stride = max(1, page_count // 10)
+        page_list = sorted({(iteration + k * stride) % page_count + 1 for k in range(10)})
+        with step('extract'):
+            client.post_json('/tools/pdfpick/api/extract', {
+                'session_id': session_id, 'page_ranges': [f'1-{min(5, page_count)}'], 'page_list': page_list})
+        with step('download'):
+            client.get(f'/tools/pdfpick/api/download/{session_id}')
+        with step('cleanup'):
+            client.post_json('/tools/pdfpick/api/cleanup', {'session_id': session_id})
+
+    return Scenario(f'pdfpick/{page_count}p', 'pdfpick', run)
+
+
+def build_scenarios(fixtures, tools, kinds, sizes, pdf_pages):
+    """Expands the requested tools × inputs into a list of Scenarios."""
+    scenarios = []
+    if 'image_converter' in tools:
+        # image_converter 不接受 HEIC
+        for kind in (k for k in kinds if k != 'heic'):
+            for size_name in sizes:
+                scenarios.append(image_converter_scenario(fixtures, kind, size_name))
+    if 'img2pdf' in tools:
+        for size_name in sizes:
+            scenarios.append(img2pdf_scenario(fixtures, kinds, size_name))
+    if 'pdfpick' in tools:
+        for page_count in pdf_pages:
+            scenarios.append(pdfpick_scenario(fixtures, page_count))
+    return scenarios
@@ -0,0 +1,159 @@
+import os
+import sys
+import time
+import shutil
+import socket
+import signal
+import tempfile
+import threading
+import subprocess
+import http.client
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _children(pid):
+    """Direct children of pid (Linux /proc)."""
+    children = []
+    try:
+        for task in os.listdir(f'/proc/{pid}/task'):
+            with open(f'/proc/{pid}/task/{task}/children') as f:
+                children.extend(int(child) for child in f.read().split())
+    except OSError:
+        pass
+    return children
+
+
+def _rss_bytes(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def process_tree_rss(pid):
+    """Resident memory of pid and all its descendants, in bytes."""
+    total = 0
+    stack = [pid]
+    while stack:
+        current = stack.pop()
+        total += _rss_bytes(current)
+        stack.extend(_children(current))
+    return total
+
+
+class RSSSampler:
+    """Samples the server's process-tree RSS in a background thread and keeps the peak."""
+
+    def __init__(self, pid, interval=0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, process_tree_rss(self.pid))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = process_tree_rss(self.pid) if self.pid else 0
+        if self.pid and os.path.isdir('/proc'):
+            self._thread = threading.Thread(target=self._run, name='rss-sampler', daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return False
+
+
+class LocalServer:
+    """
+    Runs the app under gunicorn (gunicorn.conf.py) on a free localhost port.
+
+    Sessions and blobs go to a throwaway directory so benchmark runs do not
+    touch the real uploads/ state and start with a cold derived-artifact cache.
+    """
+
+    def __init__(self, workers=None, threads=None, log_path=None):
+        self.port = _free_port()
+        self.url = f'http://127.0.0.1:{self.port}'
+        self.workers = workers
+        self.threads = threads
+        self.log_path = log_path or os.devnull
+        self.state_dir = None
+        self.process = None
+        self._log = None
+
+    @property
+    def pid(self):
+        return self.process.pid if self.process else None
+
+    def start(self, timeout=60):
+        self.state_dir = tempfile.mkdtemp(prefix='vibetools-bench-')
+        env = dict(os.environ,
+                   BIND=f'127.0.0.1:{self.port}',
+                   FLASK_CONFIG='production',
+                   WEB_ACCESS_LOG=os.devnull,
+                   SESSION_DB_PATH=os.path.join(self.state_dir, 'sessions.sqlite3'),
+                   BLOB_STORE_DIR=os.path.join(self.state_dir, 'blobs'))
+        if self.workers:
+            env['WEB_CONCURRENCY'] = str(self.workers)
+        if self.threads:
+            env['WEB_THREADS'] = str(self.threads)
+        self._log = open(self.log_path, 'ab')
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', os.path.join(PROJECT_ROOT, 'gunicorn.conf.py'), 'run:app'],
+            cwd=PROJECT_ROOT, env=env, stdout=self._log, stderr=subprocess.STDOUT)
+        self._wait_ready(timeout)
+        return self
+
+    def _wait_ready(self, timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Server exited with code {self.process.returncode} (see {self.log_path})")
+            try:
+                conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=2)
+                conn.request('GET', '/')
+                if conn.getresponse().status < 500:
+                    conn.close()
+                    return
+            except OSError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"Server did not become ready within {timeout}s")
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.send_signal(signal.SIGTERM)
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        if self._log:
+            self._log.close()
+        if self.state_dir:
+            shutil.rmtree(self.state_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
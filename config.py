@@ -6,6 +6,26 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'a_very_secret_string'
     
     PROJECT_ROOT = os.path.abspath(os.path.dirname(__file__))
+
+    # 为 True 时工具蓝图在第一次请求其 URL 前缀时才导入注册, 减少 worker 启动时间和内存
+    LAZY_TOOL_LOADING = os.environ.get('LAZY_TOOL_LOADING', '').lower() in ('1', 'true', 'yes')
+
+    # Jinja bytecode cache 目录, 为空时不启用; 部署时可用 run.py --precompile-templates 预编译
+    TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR')
+
+    # Prometheus 格式的 /metrics 端点及请求埋点
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1').lower() in ('1', 'true', 'yes')
+
+    # 后台清理任务: 删除过期会话和上传文件; 超出 UPLOADS_QUOTA_BYTES (0 为不限制) 时按 LRU 淘汰
+    JANITOR_ENABLED = os.environ.get('JANITOR_ENABLED', '1').lower() in ('1', 'true', 'yes')
+    JANITOR_INTERVAL = int(os.environ.get('JANITOR_INTERVAL', 300))
+    UPLOADS_QUOTA_BYTES = int(os.environ.get('UPLOADS_QUOTA_BYTES', 0))
+
+    # 单个请求体的上限; 更大的文件通过分块上传 (api/upload/init + PUT 分片) 传输
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))
+    # 分块上传: 每个分片的大小 (需小于 MAX_CONTENT_LENGTH) 和单个文件的总大小上限
+    UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))
+    MAX_UPLOAD_SIZE = int(os.environ.get('MAX_UPLOAD_SIZE', 2 * 1024 * 1024 * 1024))
     
     @staticmethod
     def init_app(app):
@@ -23,6 +43,7 @@ class ProductionConfig(Config):
 class TestingConfig(Config):
     TESTING = True
     WTF_CSRF_ENABLED = False # 通常在测试中禁用 CSRF
+    JANITOR_ENABLED = False
     # 测试环境特定配置...
 
 config = {
@@ -0,0 +1,44 @@
+# Gunicorn 生产环境配置
+# 用法: gunicorn -c gunicorn.conf.py run:app   (或 python run.py --production)
+#
+# - 预先 fork 多个 worker 进程, 每个 worker 使用多个线程 (gthread)
+# - 收到 SIGHUP 时平滑重载: 先启动新 worker, 再优雅关闭旧 worker (systemctl reload)
+# - backlog 限制等待 accept 的连接数, 过载时尽快拒绝而不是无限排队
+import os
+import multiprocessing
+
+bind = os.environ.get('BIND', '0.0.0.0:8080')
+
+# Pillow/PyPDF2 的处理是 CPU 密集型的, 默认每个核一个 worker
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 4))
+
+# 内核 accept 队列上限
+backlog = int(os.environ.get('WEB_BACKLOG', 256))
+
+# 大批量图片/PDF 处理可能较慢
+timeout = int(os.environ.get('WEB_TIMEOUT', 120))
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 60))
+keepalive = 5
+
+# 定期回收 worker, 限制 Pillow 等库的内存碎片增长
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('WEB_MAX_REQUESTS_JITTER', 100))
+
+# 不预加载应用: SIGHUP 时新 worker 会重新导入代码, 实现零停机更新
+preload_app = False
+
+raw_env = [f"FLASK_CONFIG={os.environ.get('FLASK_CONFIG', 'production')}"]
+
+accesslog = os.environ.get('WEB_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.environ.get('WEB_LOG_LEVEL', 'info')
+
+
+def post_worker_init(worker):
+    # LAZY_TOOL_LOADING: 在 worker 开始接受连接前加载所有工具
+    # (处理请求后再注册蓝图会与其他线程的 URL 匹配冲突)
+    lazy_loader = getattr(worker.wsgi, 'extensions', {}).get('lazy_tool_loader')
+    if lazy_loader is not None:
+        lazy_loader.load_all()
@@ -1 +1 @@
-sudo systemctl start vibetools
\ No newline at end of file
+sudo systemctl reload-or-restart vibetools
\ No newline at end of file
@@ -1,10 +1,60 @@
 import os
+import sys
+import argparse
 from app import create_app
 
 # 根据环境变量选择配置，默认为 'development'
 config_name = os.getenv('FLASK_CONFIG', 'development')
-app = create_app(config_name)
 
-if __name__ == '__main__':
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the vibetools server.")
+    parser.add_argument('--production', action='store_true',
+                        help="Serve with gunicorn using gunicorn.conf.py (pre-forked workers, graceful reload on SIGHUP).")
+    parser.add_argument('--profile-startup', action='store_true',
+                        help="Report how long create_app takes, broken down per tool, then exit.")
+    parser.add_argument('--precompile-templates', action='store_true',
+                        help="Compile templates into TEMPLATE_CACHE_DIR (run at deploy time), then exit.")
+    args = parser.parse_args(argv)
+
+    if args.production:
+        # 用 gunicorn 替换当前进程, 使 systemd 的 MAINPID 指向 gunicorn master (SIGHUP 平滑重载)
+        # --chdir: run:app 需要从项目根目录导入, 与当前工作目录无关
+        project_root = os.path.dirname(os.path.abspath(__file__))
+        conf_path = os.path.join(project_root, 'gunicorn.conf.py')
+        os.execvp('gunicorn', ['gunicorn', '-c', conf_path, '--chdir', project_root, 'run:app'])
+
+    if args.profile_startup:
+        from app.profiling import profile_startup
+        profile_startup(config_name)
+        return 0
+
+    app = create_app(config_name)
+    lazy_loader = app.extensions.get('lazy_tool_loader')
+    if lazy_loader is not None:
+        # 蓝图必须在处理请求 (以及预编译模板) 之前注册
+        lazy_loader.load_all()
+
+    if args.precompile_templates:
+        from app.template_cache import precompile_templates
+        try:
+            results = precompile_templates(app)
+        except RuntimeError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        for name, error in results:
+            print(f"{'FAILED' if error else 'ok':<8}{name}" + (f"  ({error})" if error else ""))
+        return 1 if any(error for _, error in results) else 0
+
+    # 开发服务器; 生产环境请使用 --production
     # host='0.0.0.0' 允许外部访问
     app.run(host='0.0.0.0', port=8080)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+elif __name__ != '__mp_main__':
+    # 供 WSGI 服务器以 run:app 方式导入
+    # (multiprocessing 的 forkserver/spawn 子进程会以 __mp_main__ 重新导入本模块, 不需要创建应用)
+    app = create_app(config_name)
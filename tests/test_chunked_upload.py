@@ -0,0 +1,100 @@
+import hashlib
+import os
+
+import pytest
+from flask import Blueprint, Flask
+
+from app.services.chunked_upload import ChunkedUploads, UploadError, register_chunked_upload_routes
+
+
+@pytest.fixture
+def uploads(tmp_path, monkeypatch):
+    monkeypatch.setenv('SESSION_STORE', 'memory')
+    return ChunkedUploads('test', str(tmp_path), ttl=3600)
+
+
+@pytest.fixture
+def client(uploads):
+    app = Flask(__name__)
+    app.config.update(TESTING=True, UPLOAD_CHUNK_SIZE=4, MAX_UPLOAD_SIZE=1024)
+    blueprint = Blueprint('test', __name__)
+    register_chunked_upload_routes(blueprint, uploads)
+    app.register_blueprint(blueprint, url_prefix='/tools/test')
+    return app.test_client()
+
+
+def init_upload(client, data, **extra):
+    response = client.post('/tools/test/api/upload/init', json={'filename': 'a.bin', 'size': len(data), **extra})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def put_chunk(client, upload_id, offset, chunk, **headers):
+    return client.put(f'/tools/test/api/upload/{upload_id}?offset={offset}', data=chunk, headers=headers)
+
+
+def test_upload_in_chunks(client, uploads):
+    data = b'0123456789'
+    info = init_upload(client, data, sha256=hashlib.sha256(data).hexdigest())
+    for offset in range(0, len(data), info['chunk_size']):
+        response = put_chunk(client, info['upload_id'], offset, data[offset:offset + info['chunk_size']])
+        assert response.status_code == 200
+    assert response.get_json() == {'success': True, 'offset': len(data), 'complete': True}
+
+    [(filename, path)] = uploads.completed_files(info['session_id'], [info['upload_id']])
+    assert filename == 'a.bin'
+    with open(path, 'rb') as f:
+        assert f.read() == data
+
+
+def test_wrong_offset_returns_current_offset(client):
+    data = b'0123456789'
+    info = init_upload(client, data)
+    put_chunk(client, info['upload_id'], 0, data[:4])
+
+    response = put_chunk(client, info['upload_id'], 8, data[8:])
+    assert response.status_code == 409
+    assert response.get_json()['offset'] == 4
+
+    # 客户端查询偏移量后从服务器记录的位置继续
+    status = client.get(f"/tools/test/api/upload/{info['upload_id']}").get_json()
+    assert status['offset'] == 4 and not status['complete']
+    assert put_chunk(client, info['upload_id'], 4, data[4:]).get_json()['complete']
+
+
+def test_chunk_checksum_mismatch_is_discarded(client):
+    data = b'0123456789'
+    info = init_upload(client, data)
+    response = put_chunk(client, info['upload_id'], 0, data[:4], **{'X-Chunk-SHA256': '0' * 64})
+    assert response.status_code == 400
+    assert response.get_json()['offset'] == 0
+    assert client.get(f"/tools/test/api/upload/{info['upload_id']}").get_json()['offset'] == 0
+
+
+def test_incomplete_upload_is_rejected(client, uploads):
+    data = b'0123456789'
+    info = init_upload(client, data)
+    put_chunk(client, info['upload_id'], 0, data[:4])
+    with pytest.raises(UploadError) as excinfo:
+        uploads.completed_files(info['session_id'], [info['upload_id']])
+    assert excinfo.value.status_code == 409
+
+
+def test_finish_removes_only_the_finished_uploads(client, uploads, tmp_path):
+    first = init_upload(client, b'abcd')
+    session_id = first['session_id']
+    second = init_upload(client, b'efgh', session_id=session_id)
+    put_chunk(client, first['upload_id'], 0, b'abcd')
+    put_chunk(client, second['upload_id'], 0, b'ef')
+
+    uploads.finish(session_id, [first['upload_id']])
+
+    incoming_dir = tmp_path / session_id / 'incoming'
+    assert not (incoming_dir / first['upload_id']).exists()
+    assert client.get(f"/tools/test/api/upload/{first['upload_id']}").status_code == 404
+    # 同一会话中仍在进行的上传不受影响
+    assert put_chunk(client, second['upload_id'], 2, b'gh').get_json()['complete']
+
+    uploads.finish(session_id, [second['upload_id']])
+    assert not incoming_dir.exists()
+    assert os.path.isdir(tmp_path / session_id)
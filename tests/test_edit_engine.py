@@ -0,0 +1,89 @@
+import random
+
+import pytest
+from PIL import Image, ImageChops, ImageStat
+
+from app.tools.image_converter.edit_engine import apply_operation, plan_operations, result_size
+
+
+def noise_image(size=(64, 48), mode='RGB'):
+    rng = random.Random(0)
+    return Image.frombytes(mode, size, rng.randbytes(size[0] * size[1] * len(mode)))
+
+
+def apply_unplanned(img, operations):
+    for op in operations:
+        img = apply_operation(img, op)
+    return img
+
+
+def apply_planned(img, operations):
+    for op in plan_operations(operations, img.size):
+        img = apply_operation(img, op)
+    return img
+
+
+ROTATE_90 = {'type': 'rotate', 'angle': 90}
+ROTATE_270 = {'type': 'rotate', 'angle': -90}
+FLIP_H = {'type': 'flip', 'direction': 'horizontal'}
+FLIP_V = {'type': 'flip', 'direction': 'vertical'}
+GRAYSCALE = {'type': 'grayscale'}
+
+
+@pytest.mark.parametrize('operations', [
+    [ROTATE_90],
+    [ROTATE_90, ROTATE_90, ROTATE_90],
+    [FLIP_H, FLIP_H],
+    [FLIP_V, ROTATE_90, FLIP_H],
+    [ROTATE_270, FLIP_V, GRAYSCALE, ROTATE_90, GRAYSCALE],
+    [{'type': 'rotate', 'angle': 0}, {'type': 'resize', 'width': 64, 'height': 48}],
+    [{'type': 'crop', 'left': 4, 'top': 2, 'right': 60, 'bottom': 40},
+     {'type': 'crop', 'left': 10, 'top': 5, 'right': 30, 'bottom': 25}],
+    [{'type': 'crop', 'left': 8, 'top': 8, 'right': 40, 'bottom': 40}, ROTATE_90,
+     {'type': 'crop', 'left': 0, 'top': 0, 'right': 16, 'bottom': 32}],
+    # 超出图像的 crop (补黑) 不能与后续 crop 合并
+    [{'type': 'crop', 'left': -10, 'top': 0, 'right': 50, 'bottom': 48},
+     {'type': 'crop', 'left': 5, 'top': 5, 'right': 20, 'bottom': 20}],
+])
+def test_plan_is_pixel_identical(operations):
+    img = noise_image()
+    expected = apply_unplanned(img, operations)
+    actual = apply_planned(img, operations)
+    assert actual.mode == expected.mode
+    assert actual.size == expected.size
+    assert actual.tobytes() == expected.tobytes()
+
+
+@pytest.mark.parametrize('operations', [
+    [{'type': 'crop', 'left': 10, 'top': 6, 'right': 58, 'bottom': 42}, {'type': 'resize', 'width': 24, 'height': 18}],
+    [{'type': 'crop', 'left': 0, 'top': 0, 'right': 32, 'bottom': 32}, {'type': 'resize', 'width': 64, 'height': 64}],
+    [FLIP_H, {'type': 'crop', 'left': 2, 'top': 2, 'right': 50, 'bottom': 40}, {'type': 'resize', 'width': 12, 'height': 10}],
+])
+def test_fused_crop_resize_matches(operations):
+    # resize(box=...) 直接从未裁剪的图像重采样, 边缘像素可以参考裁剪框外的像素, 允许很小的误差
+    img = noise_image()
+    expected = apply_unplanned(img, operations)
+    actual = apply_planned(img, operations)
+    assert actual.size == expected.size
+    diff = ImageStat.Stat(ImageChops.difference(actual, expected)).mean
+    assert max(diff) < 16
+
+
+def test_plan_simplifies():
+    assert plan_operations([FLIP_H, FLIP_H], (64, 48)) == []
+    assert plan_operations([ROTATE_90, ROTATE_90], (64, 48)) == [{'type': 'transpose', 'method': 'ROTATE_180'}]
+    assert plan_operations([GRAYSCALE, ROTATE_90, GRAYSCALE], (64, 48)) == [
+        GRAYSCALE, {'type': 'transpose', 'method': 'ROTATE_90'}]
+    planned = plan_operations([{'type': 'crop', 'left': 10, 'top': 6, 'right': 58, 'bottom': 42},
+                               {'type': 'resize', 'width': 24, 'height': 18}], (64, 48))
+    assert planned == [{'type': 'resize', 'width': 24, 'height': 18, 'box': [10, 6, 58, 42]}]
+
+
+@pytest.mark.parametrize('operations', [
+    [{'type': 'rotate', 'angle': 30}],
+    [{'type': 'rotate', 'angle': 45}, {'type': 'crop', 'left': 5, 'top': 5, 'right': 40, 'bottom': 30}],
+    [ROTATE_90, {'type': 'resize', 'width': 20, 'height': 30}, FLIP_V],
+])
+def test_result_size_matches_applied_size(operations):
+    img = noise_image()
+    assert result_size(img.size, operations) == apply_unplanned(img, operations).size
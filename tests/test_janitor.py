@@ -0,0 +1,86 @@
+import os
+import time
+
+import pytest
+
+from app.services.janitor import FileStorage, Janitor, SessionStorage, _SweepLock
+from app.services.session_store import MemorySessionStore
+
+
+def write(path, size, age):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    used = time.time() - age
+    os.utime(path, (used, used))
+    return path
+
+
+def set_age(path, age):
+    used = time.time() - age
+    os.utime(path, (used, used))
+
+
+@pytest.fixture
+def lock_path(tmp_path):
+    return str(tmp_path / '.janitor.lock')
+
+
+def test_expired_files_are_removed(tmp_path, lock_path):
+    files_dir = tmp_path / 'files'
+    old = write(str(files_dir / 'old'), 10, age=7200)
+    new = write(str(files_dir / 'new'), 10, age=10)
+    janitor = Janitor(interval=60, quota_bytes=0, lock_path=lock_path,
+                      areas=[FileStorage('files', str(files_dir), max_age=3600)])
+
+    assert janitor.sweep() == 1
+    assert not os.path.exists(old) and os.path.exists(new)
+
+
+def test_expired_and_orphaned_sessions_are_removed(tmp_path, lock_path):
+    sessions_dir = tmp_path / 'sessions'
+    store = MemorySessionStore('test', ttl=3600)
+    store.set('live', {})
+    write(str(sessions_dir / 'live' / 'a'), 10, age=0)
+    write(str(sessions_dir / 'orphan' / 'a'), 10, age=0)
+    set_age(str(sessions_dir / 'orphan'), 7200)
+    janitor = Janitor(interval=60, quota_bytes=0, lock_path=lock_path,
+                      areas=[SessionStorage('sessions', str(sessions_dir), store)])
+
+    assert janitor.sweep() == 1
+    assert sorted(os.listdir(sessions_dir)) == ['live']
+
+
+def test_quota_evicts_least_recently_used_across_areas(tmp_path, lock_path):
+    files_dir, sessions_dir = tmp_path / 'files', tmp_path / 'sessions'
+    store = MemorySessionStore('test', ttl=86400)
+    write(str(files_dir / 'oldest'), 400, age=300)
+    write(str(files_dir / 'older'), 400, age=200)
+    write(str(sessions_dir / 'session' / 'a'), 400, age=1000)
+    # 会话的最后使用时间来自会话存储, 而不是目录的时间戳
+    set_age(str(sessions_dir / 'session'), 1000)
+    store.set('session', {})
+    areas = [FileStorage('files', str(files_dir), max_age=86400), SessionStorage('sessions', str(sessions_dir), store)]
+    janitor = Janitor(interval=60, quota_bytes=700, lock_path=lock_path, areas=areas)
+
+    # 1200 字节超出配额, 按最后使用时间淘汰, 直到低于 630 (QUOTA_LOW_WATERMARK)
+    assert janitor.sweep() == 2
+    assert os.listdir(files_dir) == []
+    assert os.listdir(sessions_dir) == ['session'] and store.get('session') == {}
+
+
+def test_prepare_registers_areas_before_sweeping(tmp_path, lock_path):
+    files_dir = tmp_path / 'files'
+    write(str(files_dir / 'old'), 10, age=7200)
+    areas = []
+    janitor = Janitor(interval=60, quota_bytes=0, lock_path=lock_path, areas=areas,
+                      prepare=lambda: areas.append(FileStorage('files', str(files_dir), max_age=3600)))
+    assert janitor.sweep() == 1
+
+
+def test_only_one_process_sweeps(lock_path):
+    janitor = Janitor(interval=60, quota_bytes=0, lock_path=lock_path, areas=[])
+    with _SweepLock(lock_path) as acquired:
+        assert acquired
+        assert janitor.sweep() is None
+    assert janitor.sweep() == 0
@@ -0,0 +1,55 @@
+import io
+import os
+import random
+
+import pytest
+from PIL import Image, ImageFilter
+
+from app.tools.img2pdf.optimize import MIN_IMAGE_BYTES, _kept, _share, fit_to_budget, write_to_budget
+
+
+def photo(path, size, seed):
+    # 模糊过的噪声: 像照片一样能被 JPEG 压缩, 但质量越低文件越小
+    rng = random.Random(seed)
+    img = Image.frombytes('RGB', size, rng.randbytes(size[0] * size[1] * 3)).filter(ImageFilter.GaussianBlur(2))
+    img.save(path, 'JPEG', quality=95)
+    return str(path)
+
+
+@pytest.fixture
+def image_paths(tmp_path):
+    return [photo(tmp_path / f'{i}.jpg', size, i) for i, size in enumerate([(800, 600), (600, 800), (60, 60)])]
+
+
+def test_small_image_gets_at_least_the_minimum_share():
+    pixels = [4000 * 3000, 60 * 60]
+    assert _share(100_000, pixels, [0, 1], 1) >= MIN_IMAGE_BYTES
+    # 预算不够每张 MIN_IMAGE_BYTES 时平分
+    assert _share(1000, pixels, [0, 1], 1) == 500
+
+
+def test_unused_share_goes_to_the_others():
+    # 第二张按像素只能分到一半预算, 但第一张用不完的部分让给了它
+    assert _kept([100, 9000], [1, 1], 10_000) == {0, 1}
+    assert _kept([100, 9000], [1, 1], 9_000) == {0}
+
+
+def test_images_that_fit_are_kept(image_paths, tmp_path):
+    total = sum(os.path.getsize(path) for path in image_paths)
+    fitted, estimate = fit_to_budget(image_paths, total + 10_000, str(tmp_path))
+    assert fitted == image_paths
+    assert estimate <= total + 10_000
+
+
+@pytest.mark.parametrize('fraction', [0.5, 0.2])
+def test_write_to_budget_meets_target(image_paths, tmp_path, fraction):
+    target = int(sum(os.path.getsize(path) for path in image_paths) * fraction)
+    work_dir = tmp_path / 'work'
+    work_dir.mkdir()
+    calls = []
+    out = io.BytesIO()
+    size = write_to_budget(image_paths, target, out, str(work_dir), lambda done, total: calls.append((done, total)))
+
+    assert size == len(out.getvalue()) <= target
+    assert out.getvalue().startswith(b'%PDF-')
+    assert calls and calls[-1][0] == calls[-1][1]
@@ -0,0 +1,55 @@
+import io
+
+import img2pdf
+import pytest
+from PIL import Image
+from PyPDF2 import PdfReader
+
+from app.tools.img2pdf.pdf_writer import write_pdf
+
+
+@pytest.fixture
+def image_paths(tmp_path):
+    paths = []
+    for i, (size, fmt) in enumerate([((40, 30), 'JPEG'), ((20, 50), 'PNG'), ((64, 64), 'JPEG')]):
+        path = tmp_path / f'{i}.{fmt.lower()}'
+        Image.new('RGB', size, (i * 80, 0, 0)).save(path, fmt)
+        paths.append(str(path))
+    # 带透明通道的 PNG 需要 SMask, 会提高 PDF 版本
+    path = tmp_path / 'alpha.png'
+    Image.new('RGBA', (16, 16), (0, 0, 255, 128)).save(path, 'PNG')
+    paths.append(str(path))
+    return paths
+
+
+def test_pages_in_order(image_paths):
+    out = io.BytesIO()
+    size = write_pdf(image_paths, out)
+    assert size == len(out.getvalue())
+
+    reader = PdfReader(io.BytesIO(out.getvalue()), strict=True)
+    expected = [Image.open(path).size for path in image_paths]
+    # 没有 DPI 信息的图片按 96 DPI 排版
+    assert [(float(page.mediabox.width), float(page.mediabox.height)) for page in reader.pages] == \
+        [pytest.approx((width * 72 / 96, height * 72 / 96), abs=1) for width, height in expected]
+
+
+def test_matches_img2pdf(image_paths):
+    out = io.BytesIO()
+    write_pdf(image_paths, out)
+    expected = img2pdf.convert(image_paths, engine=img2pdf.Engine.internal)
+    # 同样的对象, 只是按图片顺序重新编号并逐张写出
+    assert out.getvalue()[:9] == expected[:9]
+    assert len(PdfReader(io.BytesIO(out.getvalue())).pages) == len(PdfReader(io.BytesIO(expected)).pages)
+    assert abs(len(out.getvalue()) - len(expected)) < 64
+
+
+def test_progress(image_paths):
+    calls = []
+    write_pdf(image_paths, io.BytesIO(), lambda done, total: calls.append((done, total)))
+    assert calls == [(i + 1, len(image_paths)) for i in range(len(image_paths))]
+
+
+def test_empty_list():
+    with pytest.raises(ValueError):
+        write_pdf([], io.BytesIO())
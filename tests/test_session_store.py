@@ -0,0 +1,80 @@
+import threading
+
+import pytest
+
+from app.services.session_store import MemorySessionStore, SQLiteSessionStore
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return MemorySessionStore('test', ttl=60)
+    return SQLiteSessionStore('test', ttl=60, db_path=str(tmp_path / 'sessions.db'))
+
+
+def test_set_get_update_delete(store):
+    assert store.get('a') is None
+    store.set('a', {'images': [1]})
+    assert store.get('a') == {'images': [1]}
+    assert 'a' in store and len(store) == 1
+
+    assert store.update('a', pdf_path='x.pdf') == {'images': [1], 'pdf_path': 'x.pdf'}
+    assert store.update('missing', pdf_path='x.pdf') is None
+
+    assert store.delete('a') == {'images': [1], 'pdf_path': 'x.pdf'}
+    assert store.get('a') is None and len(store) == 0
+
+
+def test_get_returns_a_copy(store):
+    store.set('a', {'images': [1]})
+    store.get('a')['images'].append(2)
+    assert store.get('a') == {'images': [1]}
+
+
+def test_expiry(store):
+    store.set('a', {'n': 1})
+    store.set('b', {'n': 2})
+    assert store.pop_expired() == []
+    last = store.last_accessed()
+    assert set(last) == {'a', 'b'}
+
+    expired = store.pop_expired(now=max(last.values()) + store.ttl + 1)
+    assert sorted(expired) == [('a', {'n': 1}), ('b', {'n': 2})]
+    assert store.get('a') is None
+
+
+def test_modify_aborts_when_fn_raises(store):
+    store.set('a', {'n': 1})
+
+    def fail(data):
+        raise ValueError('no')
+
+    with pytest.raises(ValueError):
+        store.modify('a', fail)
+    assert store.get('a') == {'n': 1}
+    assert store.modify('missing', lambda data: {'n': 2}) is None
+
+
+def test_modify_is_atomic(store):
+    store.set('a', {'n': 0})
+
+    def increment():
+        for _ in range(50):
+            store.modify('a', lambda data: {'n': data['n'] + 1})
+
+    threads = [threading.Thread(target=increment) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert store.get('a') == {'n': 200}
+
+
+def test_sqlite_sessions_are_shared(tmp_path):
+    db_path = str(tmp_path / 'sessions.db')
+    first = SQLiteSessionStore('test', ttl=60, db_path=db_path)
+    second = SQLiteSessionStore('test', ttl=60, db_path=db_path)
+    other = SQLiteSessionStore('other', ttl=60, db_path=db_path)
+    first.set('a', {'n': 1})
+    assert second.get('a') == {'n': 1}
+    assert other.get('a') is None